@@ -0,0 +1,207 @@
+"""Open compressed tar archives, decompressing them once with the fastest backend available
+
+tarfile.open(path, 'r:gz') decompresses lazily, so every seek backwards (to
+read the metadata file after listing the members, or to extract a second set
+of members) starts decompressing again from the beginning of the stream.
+open_tar() instead decompresses the whole archive once, into an anonymous
+temp file, and opens that as a plain tar, where seeks are free.
+
+The compression is detected from the first bytes of the file, not its name,
+so a '.tar.gz' url that serves zstd still works.
+
+Backends, in the order 'auto' tries them:
+- gzip: 'isal' (the python-isal module), 'pigz' (an external pigz), 'zlib'
+- xz: 'lzma' (the python module), 'xz' (an external xz)
+- zstd: 'zstandard' (the python module), 'zstd' (an external zstd)
+- bzip2: 'bz2'
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import bz2
+import logging
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import zlib
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+try:
+    import lzma
+    HAS_LZMA = True
+except ImportError:
+    HAS_LZMA = False
+
+try:
+    from isal import igzip
+    HAS_ISAL = True
+except ImportError:
+    HAS_ISAL = False
+
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.config import runtime
+from ansible_galaxy.utils.text import to_text
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'BZh', 'bzip2'),
+)
+
+# per format, the backends 'auto' tries, fastest first
+BACKENDS = {
+    'gzip': ('isal', 'pigz', 'zlib'),
+    'xz': ('lzma', 'xz'),
+    'zstd': ('zstandard', 'zstd'),
+    'bzip2': ('bz2',),
+}
+
+DECOMPRESSORS = ('auto',) + tuple(sorted(set(backend for backends in BACKENDS.values() for backend in backends)))
+
+# the external command for each command line backend
+COMMANDS = {
+    'pigz': ['pigz', '-dc'],
+    'xz': ['xz', '-dc'],
+    'zstd': ['zstd', '-dcq'],
+}
+
+
+def detect_format(path):
+    """The compression of the file at path, one of the BACKENDS keys, or None if it isn't compressed"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, compression in MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def available(backend):
+    if backend in COMMANDS:
+        return which(COMMANDS[backend][0]) is not None
+    if backend == 'isal':
+        return HAS_ISAL
+    if backend == 'lzma':
+        return HAS_LZMA
+    if backend == 'zstandard':
+        return HAS_ZSTANDARD
+    return backend in ('zlib', 'bz2')
+
+
+def choose_backend(compression, decompressor=None):
+    """The backend to decompress compression with
+
+    :param decompressor: a backend to use if it handles compression and is available, or 'auto' for the fastest one
+    """
+    decompressor = decompressor or runtime.GALAXY_DECOMPRESSOR
+    candidates = BACKENDS[compression]
+    if decompressor in candidates and available(decompressor):
+        return decompressor
+    for backend in candidates:
+        if available(backend):
+            return backend
+    raise exceptions.GalaxyClientError("Unable to decompress a %s archive, install one of: %s" % (compression, ', '.join(candidates)))
+
+
+def _decompress_zlib(src, dest):
+    # 16 + MAX_WBITS is the gzip container. A gzip file can be several members
+    # back to back, anything after the last one (padding, usually) is ignored.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = src.read(CHUNK_SIZE)
+    while data:
+        dest.write(decompressor.decompress(data))
+        if not decompressor.unused_data:
+            data = src.read(CHUNK_SIZE)
+            continue
+
+        dest.write(decompressor.flush())
+        data = decompressor.unused_data + src.read(CHUNK_SIZE)
+        if not data.startswith(MAGIC[0][0]):
+            return
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    dest.write(decompressor.flush())
+
+
+def _decompress_file_module(open_func, path, dest):
+    with open_func(path) as f:
+        shutil.copyfileobj(f, dest, CHUNK_SIZE)
+
+
+def _decompress_command(backend, path, dest):
+    cmd = COMMANDS[backend] + [path]
+    log.debug('running: %s', ' '.join(cmd))
+    popen = subprocess.Popen(cmd, stdout=dest, stderr=subprocess.PIPE)
+    _, stderr = popen.communicate()
+    if popen.returncode != 0:
+        raise exceptions.GalaxyClientError("%s failed to decompress %s (rc=%s): %s" % (cmd[0], path, popen.returncode, to_text(stderr).strip()))
+
+
+def decompress(path, dest, compression=None, decompressor=None):
+    """Decompress the file at path into the file object dest
+
+    :returns: the name of the backend used
+    """
+    compression = compression or detect_format(path)
+    backend = choose_backend(compression, decompressor)
+    log.debug('decompressing %s (%s) with %s', path, compression, backend)
+
+    if backend in COMMANDS:
+        dest.flush()
+        _decompress_command(backend, path, dest)
+    elif backend == 'isal':
+        _decompress_file_module(igzip.open, path, dest)
+    elif backend == 'lzma':
+        _decompress_file_module(lzma.open, path, dest)
+    elif backend == 'zstandard':
+        with open(path, 'rb') as f:
+            zstandard.ZstdDecompressor().copy_stream(f, dest, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+    elif backend == 'bz2':
+        _decompress_file_module(bz2.BZ2File, path, dest)
+    else:
+        with open(path, 'rb') as f:
+            _decompress_zlib(f, dest)
+    return backend
+
+
+def open_tar(path, decompressor=None):
+    """Open the tar archive at path, decompressing it first if it is compressed
+
+    The decompressed tar is an anonymous temp file, removed when the returned TarFile is closed (or collected).
+
+    :raises GalaxyClientError: if path is not a (compressed) tar archive
+    """
+    compression = detect_format(path)
+    try:
+        if compression is None:
+            return tarfile.open(path, 'r:')
+
+        decompressed = tempfile.TemporaryFile()
+        try:
+            decompress(path, decompressed, compression=compression, decompressor=decompressor)
+            decompressed.seek(0)
+            tar_file = tarfile.open(fileobj=decompressed, mode='r:')
+        except Exception:
+            decompressed.close()
+            raise
+        # tarfile doesn't close a fileobj it was given, but this one is ours
+        tar_file._extfileobj = False
+        return tar_file
+    except (tarfile.TarError, EOFError, IOError, OSError, zlib.error) as e:
+        raise exceptions.GalaxyClientError("%s is not a valid tar archive: %s" % (path, e))
@@ -0,0 +1,266 @@
+"""Write the members of a tar archive to disk, with a pool of writer threads
+
+Reading a compressed tar is sequential, so one thread reads (and decompresses)
+the members in order, and hands each file's data to a pool of threads that
+write it. On network filesystems, where each create, write, chmod and utime is
+a round trip, the writes overlap instead of queueing behind each other.
+
+Every directory the files go in is created before any file is written, so
+the writers never have to check or create their parent dir.
+
+When the tar is a regular file (a local '.tar', or the temp file a compressed
+archive is decompressed into, see decompress.open_tar), the reading thread
+doesn't read the file data at all. Each writer copies its member straight
+from the archive's file descriptor, at the member's offset, with
+os.copy_file_range (falling back to os.sendfile, then os.pread), so the data
+is copied by the kernel and never goes through python.
+
+fsync policies:
+- 'none': leave flushing to the OS (the default, like tarfile.extract)
+- 'file': fsync each file before it is closed
+- 'final': sync once, after every file is written
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import bz2
+import collections
+import errno
+import gzip
+import logging
+import os
+import shutil
+import stat
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import lzma
+    COMPRESSED_FILE_TYPES = (gzip.GzipFile, bz2.BZ2File, lzma.LZMAFile)
+except ImportError:
+    COMPRESSED_FILE_TYPES = (gzip.GzipFile, bz2.BZ2File)
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.config import runtime
+
+log = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('none', 'file', 'final')
+
+# members bigger than this are streamed to disk by the reading thread, instead of being held in memory for a writer
+MAX_BUFFERED_SIZE = 4 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+# the most bytes to ask the kernel to copy at once
+MAX_COPY_SIZE = 1024 * 1024 * 1024
+
+# errors that mean a way of copying doesn't work here, the next one is tried
+UNSUPPORTED_ERRNOS = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK, errno.ESPIPE)
+
+# the data of a member, to be copied from the archive's file descriptor
+ArchiveRange = collections.namedtuple('ArchiveRange', ['fd', 'offset', 'size'])
+
+
+def _copy_file_range(src_fd, dest_fd, offset, size):
+    return os.copy_file_range(src_fd, dest_fd, min(size, MAX_COPY_SIZE), offset)
+
+
+def _sendfile(src_fd, dest_fd, offset, size):
+    return os.sendfile(dest_fd, src_fd, offset, min(size, MAX_COPY_SIZE))
+
+
+def _pread(src_fd, dest_fd, offset, size):
+    data = os.pread(src_fd, min(size, CHUNK_SIZE), offset)
+    written = 0
+    while written < len(data):
+        written += os.write(dest_fd, data[written:])
+    return written
+
+
+# the ways to copy a range of the archive, best first. One that fails with an UNSUPPORTED_ERRNOS error isn't tried again.
+RANGE_COPIERS = [copier for name, copier in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile), ('pread', _pread))
+                 if hasattr(os, name)]
+
+
+def copy_range(src_fd, dest_fd, offset, size):
+    """Copy size bytes from offset in src_fd to the current position of dest_fd"""
+    copied = 0
+    while copied < size:
+        copier = RANGE_COPIERS[0]
+        try:
+            count = copier(src_fd, dest_fd, offset + copied, size - copied)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS or copier is _pread:
+                raise
+            log.debug('%s failed (%s), trying the next way to copy', copier.__name__, e)
+            try:
+                RANGE_COPIERS.remove(copier)
+            except ValueError:
+                # another writer got there first
+                pass
+            continue
+        if count == 0:
+            raise IOError(errno.EIO, 'unexpected end of archive, %d of %d bytes at offset %d copied' % (copied, size, offset))
+        copied += count
+    return copied
+
+
+def archive_fd(tar_file):
+    """The file descriptor of the archive tar_file reads, if it is an uncompressed tar in a regular file, or None"""
+    if not RANGE_COPIERS:
+        return None
+    fileobj = tar_file.fileobj
+    if isinstance(fileobj, COMPRESSED_FILE_TYPES):
+        return None
+    try:
+        fd = fileobj.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+        # streams ('r|gz') and in memory files
+        return None
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        return None
+    return fd
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _remove_link(path):
+    # don't write through a symlink left by an earlier install
+    if os.path.islink(path):
+        os.unlink(path)
+
+
+class Extractor(object):
+    """Extract tar members to a directory
+
+    :param dest: the directory to extract to
+    :param workers: number of writer threads, 1 writes from the reading thread
+    :param fsync: one of FSYNC_POLICIES
+    """
+
+    def __init__(self, dest, workers=None, fsync=None):
+        self.dest = dest
+        self.workers = runtime.GALAXY_EXTRACT_WORKERS if workers is None else workers
+        self.fsync = fsync or runtime.GALAXY_EXTRACT_FSYNC
+        if self.fsync not in FSYNC_POLICIES:
+            raise exceptions.GalaxyClientError("Unknown fsync policy %s, expected one of: %s" % (self.fsync, ', '.join(FSYNC_POLICIES)))
+
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def _write_file(self, path, data, mode, mtime):
+        """Write data (bytes, an ArchiveRange, or a file object to copy) to path, and set its mode and mtime"""
+        _remove_link(path)
+        with open(path, 'wb') as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            elif isinstance(data, ArchiveRange):
+                copy_range(data.fd, f.fileno(), data.offset, data.size)
+            else:
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+            if self.fsync == 'file':
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(path, mode)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _write_symlink(self, path, linkname):
+        if os.path.lexists(path):
+            os.unlink(path)
+        os.symlink(linkname, path)
+
+    def extract(self, tar_file, members):
+        """Extract members of tar_file
+
+        :param members: list of (TarInfo, name) of the regular files and
+            symlinks to extract, with name relative to dest
+        :returns: the list of paths written
+        """
+        if not members:
+            return []
+
+        # the last member with a name wins, like extracting them one after the other would
+        targets = dict((os.path.join(self.dest, name), member) for member, name in members)
+        targets = sorted(((member, path) for path, member in targets.items()), key=lambda target: target[0].offset_data)
+
+        # one makedirs per distinct dir, shallowest first
+        for dir_path in sorted(set(os.path.dirname(path) for _, path in targets)):
+            _makedirs(dir_path)
+
+        src_fd = archive_fd(tar_file)
+        pool = ThreadPool(self.workers) if self.workers > 1 else None
+        # bound how much file data is waiting on the writers
+        pending = threading.BoundedSemaphore(max(1, self.workers) * 4)
+        results = []
+        written = []
+        symlinks = []
+
+        def _write_pending(*args):
+            try:
+                return self._write_file(*args)
+            finally:
+                pending.release()
+
+        try:
+            # members are read in archive order, seeking backwards in a compressed stream is expensive
+            for member, path in targets:
+                if member.issym():
+                    # after the files, a link to a file that isn't written yet would be followed by the writer
+                    symlinks.append((path, member.linkname))
+                    continue
+
+                mode = member.mode & 0o7777
+                if src_fd is not None and not member.issparse():
+                    # copied by the writer, nothing to hold in memory here
+                    data = ArchiveRange(src_fd, member.offset_data, member.size)
+                    if pool is None:
+                        written.append(self._write_file(path, data, mode, member.mtime))
+                        continue
+                else:
+                    src = tar_file.extractfile(member)
+                    if pool is None or member.size > MAX_BUFFERED_SIZE:
+                        written.append(self._write_file(path, src, mode, member.mtime))
+                        continue
+                    data = src.read()
+
+                pending.acquire()
+                results.append(pool.apply_async(_write_pending, (path, data, mode, member.mtime)))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # raises the first error a writer hit
+        written.extend(result.get() for result in results)
+
+        for path, linkname in symlinks:
+            self._write_symlink(path, linkname)
+            written.append(path)
+
+        if self.fsync == 'final':
+            self._sync(written)
+
+        return written
+
+    def _sync(self, paths):
+        if hasattr(os, 'sync'):
+            os.sync()
+            return
+        for path in paths:
+            if os.path.islink(path):
+                continue
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+
+
+def extract(tar_file, members, dest, workers=None, fsync=None):
+    return Extractor(dest, workers=workers, fsync=fsync).extract(tar_file, members)
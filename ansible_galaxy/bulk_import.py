@@ -0,0 +1,199 @@
+"""Submit and track many Galaxy import tasks at once"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from ansible_galaxy import exceptions
+
+log = logging.getLogger(__name__)
+
+FINISHED_STATES = ('SUCCESS', 'FAILED')
+
+DEFAULT_WORKERS = 4
+DEFAULT_POLL_INTERVAL = 10
+
+
+def parse_repo_list(lines):
+    """Parse a list of repos to import, one per line.
+
+    Each line is 'github_user github_repo [branch [role_name]]' or
+    'github_user/github_repo [branch [role_name]]'. Blank lines and
+    lines starting with '#' are ignored.
+
+    :param lines: iterable of str
+    :returns: list of dicts with github_user, github_repo, reference and role_name keys
+    """
+    repos = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        fields = line.split()
+        if '/' in fields[0]:
+            fields = fields[0].split('/', 1) + fields[1:]
+
+        if len(fields) < 2 or len(fields) > 4 or not fields[0] or not fields[1]:
+            raise exceptions.GalaxyClientError("Invalid import line %s (%s). Expected 'github_user github_repo [branch [role_name]]'"
+                                               % (lineno, line))
+
+        fields += [None] * (4 - len(fields))
+        repos.append(dict(github_user=fields[0],
+                          github_repo=fields[1],
+                          reference=fields[2],
+                          role_name=fields[3]))
+    return repos
+
+
+class ImportResult(object):
+    """The outcome of importing one github_user/github_repo"""
+
+    def __init__(self, github_user, github_repo):
+        self.github_user = github_user
+        self.github_repo = github_repo
+        self.task_ids = []
+        self.states = {}
+        self.error = None
+
+    @property
+    def repo(self):
+        return '%s/%s' % (self.github_user, self.github_repo)
+
+    @property
+    def finished(self):
+        if self.error:
+            return True
+        return all(self.states.get(task_id) in FINISHED_STATES for task_id in self.task_ids)
+
+    @property
+    def succeeded(self):
+        if self.error or not self.task_ids:
+            return False
+        return all(self.states.get(task_id) == 'SUCCESS' for task_id in self.task_ids)
+
+    def __repr__(self):
+        return '%s(%s, task_ids=%s, states=%s, error=%s)' % (self.__class__.__name__, self.repo,
+                                                             self.task_ids, self.states, self.error)
+
+
+class BulkImporter(object):
+    """Submit import requests with bounded concurrency and poll them together
+
+    All of the submitted tasks are tracked by a single polling loop, each round
+    checks every unfinished task (again with bounded concurrency) and then sleeps
+    for poll_interval seconds.
+    """
+
+    def __init__(self, api, workers=None, poll_interval=None, display_callback=None):
+        self.api = api
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.poll_interval = DEFAULT_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.display_callback = display_callback or self._display_callback
+        self.results = []
+
+        self._seen_messages = set()
+
+    def _display_callback(self, *args, **kwargs):
+        kwargs.pop('color', None)
+        print(*args, **kwargs)
+
+    def _map(self, func, items):
+        if not items:
+            return []
+
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _submit_one(self, repo):
+        result = ImportResult(repo['github_user'], repo['github_repo'])
+        try:
+            tasks = self.api.create_import_task(repo['github_user'], repo['github_repo'],
+                                                reference=repo.get('reference'),
+                                                role_name=repo.get('role_name'))
+        except Exception as e:
+            log.exception(e)
+            result.error = str(e)
+            return result
+
+        for task in tasks:
+            result.task_ids.append(task['id'])
+            result.states[task['id']] = task.get('state')
+        return result
+
+    def submit(self, repos):
+        """Submit an import request for each repo
+
+        :param repos: list of dicts as returned by parse_repo_list()
+        :returns: list of ImportResult, in the same order as repos
+        """
+        results = self._map(self._submit_one, repos)
+        for result in results:
+            if result.error:
+                self.display_callback("- %s import request failed: %s" % (result.repo, result.error))
+            else:
+                self.display_callback("- %s submitted import request %s" % (result.repo, ', '.join(str(t) for t in result.task_ids)))
+        self.results.extend(results)
+        return results
+
+    def _poll_one(self, task_id):
+        try:
+            return task_id, self.api.get_import_task(task_id=task_id)[0], None
+        except Exception as e:
+            log.exception(e)
+            return task_id, None, e
+
+    def poll(self):
+        """Check every unfinished task once
+
+        :returns: True if every task has finished
+        """
+        task_results = {}
+        for result in self.results:
+            if result.error:
+                continue
+            for task_id in result.task_ids:
+                if result.states.get(task_id) not in FINISHED_STATES:
+                    task_results[task_id] = result
+
+        for task_id, task, error in self._map(self._poll_one, list(task_results.keys())):
+            result = task_results[task_id]
+            if error:
+                # leave the state alone and retry on the next round
+                log.warning('Unable to get the status of import task %s for %s: %s', task_id, result.repo, error)
+                continue
+
+            for msg in task.get('summary_fields', {}).get('task_messages', []):
+                if msg['id'] not in self._seen_messages:
+                    self._seen_messages.add(msg['id'])
+                    self.display_callback("%s: %s" % (result.repo, msg['message_text']))
+
+            result.states[task_id] = task['state']
+
+        return all(result.finished for result in self.results)
+
+    def wait(self):
+        """Poll until every submitted task has finished"""
+        while not self.poll():
+            time.sleep(self.poll_interval)
+        return self.results
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.succeeded]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.finished and not result.succeeded]
+
+    @property
+    def pending(self):
+        return [result for result in self.results if not result.finished]
@@ -0,0 +1,301 @@
+"""A local, searchable mirror of galaxy server role and content metadata
+
+The catalog is a sqlite database that is updated incrementally from
+GalaxyAPI.get_list_pages() with a 'modified since' cursor, and indexed
+with sqlite full text search (FTS5, or FTS4 on older sqlite builds) plus
+tag and platform tables, so 'search' and 'info' can be answered without
+talking to the server.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.config import defaults
+
+log = logging.getLogger(__name__)
+
+# The galaxy api list endpoints that are mirrored
+CATALOG_KINDS = ('roles', 'content')
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sync_state (
+        server TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        cursor TEXT,
+        synced_at REAL,
+        PRIMARY KEY (server, kind))''',
+    '''CREATE TABLE IF NOT EXISTS items (
+        rowid INTEGER PRIMARY KEY,
+        server TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        namespace TEXT,
+        name TEXT,
+        description TEXT,
+        modified TEXT,
+        data TEXT,
+        UNIQUE (server, kind, id))''',
+    'CREATE INDEX IF NOT EXISTS items_name ON items (server, kind, namespace, name)',
+    '''CREATE TABLE IF NOT EXISTS item_tags (
+        item_rowid INTEGER NOT NULL,
+        tag TEXT NOT NULL)''',
+    'CREATE INDEX IF NOT EXISTS item_tags_tag ON item_tags (tag, item_rowid)',
+    '''CREATE TABLE IF NOT EXISTS item_platforms (
+        item_rowid INTEGER NOT NULL,
+        platform TEXT NOT NULL)''',
+    'CREATE INDEX IF NOT EXISTS item_platforms_platform ON item_platforms (platform, item_rowid)',
+]
+
+FTS_MODULES = ('fts5', 'fts4')
+
+
+def _names(values):
+    """Normalize a list of tags/platforms (strs or dicts with a 'name') to a list of lowercase str"""
+    names = []
+    for value in values or []:
+        if isinstance(value, dict):
+            value = value.get('name', None)
+        if value:
+            names.append(value.lower())
+    return names
+
+
+def _namespace(item):
+    summary_fields = item.get('summary_fields', {}) or {}
+    namespace = summary_fields.get('namespace', {}) or {}
+    return item.get('username') or namespace.get('name') or item.get('namespace') or item.get('github_user')
+
+
+def _tags(item):
+    summary_fields = item.get('summary_fields', {}) or {}
+    return _names(item.get('tags') or summary_fields.get('tags'))
+
+
+def _platforms(item):
+    summary_fields = item.get('summary_fields', {}) or {}
+    return _names(summary_fields.get('platforms') or item.get('platforms'))
+
+
+def _fts_query(search):
+    """Build an FTS MATCH expression that requires every term, as a prefix"""
+    terms = [t for t in re.split(r'[\s+]+', search or '') if t]
+    return ' '.join('"%s"*' % t.replace('"', '""') for t in terms)
+
+
+class GalaxyCatalog(object):
+    """A local sqlite mirror of a galaxy server's role and content lists"""
+
+    def __init__(self, server, path=None):
+        self.server = server
+        self.path = os.path.expanduser(path or defaults.DEFAULT_CATALOG_PATH)
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+        self._db = None
+        self._fts_module = None
+
+    @property
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    @property
+    def db(self):
+        if self._db is None:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._db = sqlite3.connect(self.path)
+            self._db.row_factory = sqlite3.Row
+            self._setup()
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _setup(self):
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+        for fts_module in FTS_MODULES:
+            try:
+                self._db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING %s (namespace, name, description, tags)' % fts_module)
+                self._fts_module = fts_module
+                break
+            except sqlite3.OperationalError as e:
+                self.log.debug('sqlite %s is not available: %s', fts_module, e)
+        else:
+            self.log.warning('sqlite full text search is not available, catalog searches will be slower')
+
+        self._db.commit()
+
+    def cursor_for(self, kind):
+        row = self.db.execute('SELECT cursor FROM sync_state WHERE server = ? AND kind = ?', (self.server, kind)).fetchone()
+        if row:
+            return row['cursor']
+        return None
+
+    def last_synced(self, kind):
+        row = self.db.execute('SELECT synced_at FROM sync_state WHERE server = ? AND kind = ?', (self.server, kind)).fetchone()
+        if row:
+            return row['synced_at']
+        return None
+
+    def count(self, kind='roles'):
+        return self.db.execute('SELECT count(*) FROM items WHERE server = ? AND kind = ?', (self.server, kind)).fetchone()[0]
+
+    def clear(self, kind):
+        db = self.db
+        rowids = [row[0] for row in db.execute('SELECT rowid FROM items WHERE server = ? AND kind = ?', (self.server, kind))]
+        for rowid in rowids:
+            self._delete_index(rowid)
+        db.execute('DELETE FROM items WHERE server = ? AND kind = ?', (self.server, kind))
+        db.execute('DELETE FROM sync_state WHERE server = ? AND kind = ?', (self.server, kind))
+        db.commit()
+
+    def _delete_index(self, rowid):
+        self._db.execute('DELETE FROM item_tags WHERE item_rowid = ?', (rowid,))
+        self._db.execute('DELETE FROM item_platforms WHERE item_rowid = ?', (rowid,))
+        if self._fts_module:
+            self._db.execute('DELETE FROM items_fts WHERE rowid = ?', (rowid,))
+
+    def add(self, kind, item):
+        """Insert or update one item from the galaxy api and (re)index it
+
+        :returns: the 'modified' value of the item
+        """
+        db = self.db
+        namespace = _namespace(item)
+        name = item.get('name')
+        description = item.get('description') or ''
+        modified = item.get('modified')
+        tags = _tags(item)
+
+        row = db.execute('SELECT rowid FROM items WHERE server = ? AND kind = ? AND id = ?', (self.server, kind, item['id'])).fetchone()
+        if row:
+            rowid = row[0]
+            self._delete_index(rowid)
+            db.execute('UPDATE items SET namespace = ?, name = ?, description = ?, modified = ?, data = ? WHERE rowid = ?',
+                       (namespace, name, description, modified, json.dumps(item), rowid))
+        else:
+            rowid = db.execute('INSERT INTO items (server, kind, id, namespace, name, description, modified, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (self.server, kind, item['id'], namespace, name, description, modified, json.dumps(item))).lastrowid
+
+        db.executemany('INSERT INTO item_tags (item_rowid, tag) VALUES (?, ?)', [(rowid, tag) for tag in tags])
+        db.executemany('INSERT INTO item_platforms (item_rowid, platform) VALUES (?, ?)', [(rowid, p) for p in _platforms(item)])
+        if self._fts_module:
+            db.execute('INSERT INTO items_fts (rowid, namespace, name, description, tags) VALUES (?, ?, ?, ?, ?)',
+                       (rowid, namespace, name, description, ' '.join(tags)))
+        return modified
+
+    def sync(self, api, kind='roles', full=False, progress_callback=None):
+        """Mirror the 'kind' list from the galaxy server
+
+        Only items modified since the last sync are requested unless full=True.
+        Each page is committed as it arrives, so an interrupted sync resumes
+        from the last committed page.
+
+        :param api: a GalaxyAPI
+        :returns: the number of items added or updated
+        """
+        if kind not in CATALOG_KINDS:
+            raise exceptions.GalaxyClientError("Unknown catalog kind %s, expected one of: %s" % (kind, ', '.join(CATALOG_KINDS)))
+
+        if full:
+            self.clear(kind)
+
+        cursor = self.cursor_for(kind)
+        filters = {'order_by': 'modified'}
+        if cursor:
+            filters['modified__gt'] = cursor
+
+        self.log.debug('syncing %s from %s since %s', kind, self.server, cursor)
+
+        db = self.db
+        synced = 0
+        for page in api.get_list_pages(kind, filters=filters):
+            if not isinstance(page, list):
+                raise exceptions.GalaxyClientError("Unexpected response for the %s list from %s" % (kind, self.server))
+
+            for item in page:
+                modified = self.add(kind, item)
+                if modified and (cursor is None or modified > cursor):
+                    cursor = modified
+            synced += len(page)
+
+            db.execute('INSERT OR REPLACE INTO sync_state (server, kind, cursor, synced_at) VALUES (?, ?, ?, ?)',
+                       (self.server, kind, cursor, time.time()))
+            db.commit()
+
+            if progress_callback:
+                progress_callback(kind, synced)
+
+        # record the sync time even if nothing changed
+        db.execute('INSERT OR REPLACE INTO sync_state (server, kind, cursor, synced_at) VALUES (?, ?, ?, ?)',
+                   (self.server, kind, cursor, time.time()))
+        db.commit()
+        return synced
+
+    def search_roles(self, search=None, tags=None, platforms=None, author=None, offset=0, limit=None):
+        """Search the mirrored roles
+
+        :returns: a dict shaped like a page of the galaxy search api, with 'count' and 'results'
+        """
+        # opening the db finds out which fts module there is
+        db = self.db
+        where = ['items.server = ?', 'items.kind = ?']
+        params = [self.server, 'roles']
+
+        if search:
+            if self._fts_module:
+                where.append('items.rowid IN (SELECT rowid FROM items_fts WHERE items_fts MATCH ?)')
+                params.append(_fts_query(search))
+            else:
+                for term in [t for t in re.split(r'[\s+]+', search) if t]:
+                    where.append('(items.name LIKE ? OR items.namespace LIKE ? OR items.description LIKE ?)')
+                    params.extend(['%%%s%%' % term] * 3)
+
+        for table, column, values in (('item_tags', 'tag', tags), ('item_platforms', 'platform', platforms)):
+            for value in _names((values or '').split(',') if values else []):
+                where.append('items.rowid IN (SELECT item_rowid FROM %s WHERE %s = ?)' % (table, column))
+                params.append(value)
+
+        if author:
+            where.append('items.namespace = ?')
+            params.append(author)
+
+        where_sql = ' AND '.join(where)
+        count = db.execute('SELECT count(*) FROM items WHERE %s' % where_sql, params).fetchone()[0]
+
+        sql = 'SELECT data FROM items WHERE %s ORDER BY items.namespace, items.name LIMIT ? OFFSET ?' % where_sql
+        rows = db.execute(sql, params + [-1 if limit is None else limit, offset or 0])
+
+        results = []
+        for row in rows:
+            item = json.loads(row['data'])
+            item['username'] = _namespace(item)
+            results.append(item)
+
+        return {'count': count, 'results': results}
+
+    def lookup_role_by_name(self, role_name):
+        """Find a mirrored role by its 'username.rolename' name"""
+        if '.' not in role_name:
+            return None
+
+        parts = role_name.split('.')
+        namespace = '.'.join(parts[0:-1])
+        name = parts[-1]
+        row = self.db.execute('SELECT data FROM items WHERE server = ? AND kind = ? AND namespace = ? AND name = ?',
+                              (self.server, 'roles', namespace, name)).fetchone()
+        if row:
+            return json.loads(row['data'])
+        return None
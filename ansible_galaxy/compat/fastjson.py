@@ -0,0 +1,38 @@
+"""json.loads() that takes the raw response bytes, using a faster json module if one is installed
+
+orjson or ujson are used when available, otherwise the stdlib json module.
+All of them raise a ValueError subclass for invalid json.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import sys
+
+try:
+    import orjson
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    try:
+        import ujson
+        JSON_BACKEND = 'ujson'
+    except ImportError:
+        ujson = None
+        JSON_BACKEND = 'json'
+
+
+def _stdlib_loads(data):
+    # json.loads() only takes bytes on python >= 3.6
+    if isinstance(data, bytes) and (3, 0) <= sys.version_info < (3, 6):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+if orjson is not None:
+    loads = orjson.loads
+elif ujson is not None:
+    loads = ujson.loads
+else:
+    loads = _stdlib_loads
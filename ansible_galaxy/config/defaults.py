@@ -9,6 +9,24 @@ DEFAULT_CONTENT_PATH = ['~/.ansible/content', '/usr/share/ansible/content']
 
 DEFAULT_LOCAL_TMP = "~/.ansible/tmp"
 
+# local mirror of the galaxy server role/content metadata (see 'catalog sync')
+DEFAULT_CATALOG_PATH = "~/.ansible/galaxy/catalog.db"
+
+# bare mirrors of the scm repos installed from (see ansible_galaxy.scm)
+DEFAULT_SCM_CACHE_PATH = "~/.ansible/galaxy/scm"
+
+# archives stored by 'serve'
+DEFAULT_SERVE_STORE_PATH = "~/.ansible/galaxy/serve"
+
+# api versions of the galaxy servers used (see ansible_galaxy.flat_rest_api.server_version)
+DEFAULT_SERVER_VERSION_CACHE_PATH = "~/.ansible/galaxy/server_versions.yml"
+
+# extracted roles, linked into roles paths (see ansible_galaxy.store)
+DEFAULT_CONTENT_STORE_PATH = "~/.ansible/galaxy/store"
+
+# where the daemon listens (see ansible_galaxy_cli.daemon)
+DEFAULT_DAEMON_SOCKET_PATH = "~/.ansible/galaxy/daemon.sock"
+
 # FIXME: replace with logging config
 DEFAULT_LOG_PATH = ''
 DEFAULT_LOG_FILTER = []
@@ -11,6 +11,38 @@ GALAXY_SERVER = "http://localhost:8000"
 GALAXY_IGNORE_CERTS = False
 GALAXY_ROLE_SKELETON_IGNORE = ["^.git$", "^.*/.git_keep$"]
 GALAXY_TOKEN = None
+# how to make galaxy API requests, one of ansible_galaxy.flat_rest_api.transport.TRANSPORTS
+GALAXY_TRANSPORT = "urllib"
+# seconds a server api version saved by a previous run is used for, 0 to ask the server every run
+GALAXY_SERVER_VERSION_TTL = 86400
+# how many times to retry a request that failed with a server error, timeout or rate limit
+GALAXY_RETRIES = 3
+# the most requests in flight to one host at a time, 0 for no limit
+GALAXY_HOST_CONCURRENCY = 8
+# base urls or dirs to look for content archives in before their upstream url, see ansible_galaxy.mirrors
+GALAXY_ARCHIVE_MIRRORS = []
+# try the mirrors (and upstream) that answer fastest first, instead of in order
+GALAXY_FASTEST_MIRROR = False
+# how many byte range segments (and connections) to download a large archive in, 1 for one stream
+GALAXY_DOWNLOAD_SEGMENTS = 4
+# archives smaller than this many bytes are downloaded in one stream, and no segment is smaller
+GALAXY_DOWNLOAD_SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+# threads writing files when extracting an archive, see ansible_galaxy.archive.extract
+GALAXY_EXTRACT_WORKERS = 4
+# when to fsync extracted files, one of ansible_galaxy.archive.extract.FSYNC_POLICIES
+GALAXY_EXTRACT_FSYNC = 'none'
+# how to decompress archives, 'auto' or one of ansible_galaxy.archive.decompress.DECOMPRESSORS
+GALAXY_DECOMPRESSOR = 'auto'
+# how to install roles from the shared store of extracted roles, one of ansible_galaxy.store.LINK_MODES
+GALAXY_LINK_MODE = 'none'
+# how many roles paths 'install' installs each role into at once
+GALAXY_INSTALL_TARGET_WORKERS = 4
+# how many roles 'verify' checks at once, and files install hashes at once
+GALAXY_VERIFY_WORKERS = 8
+# seconds the daemon reuses galaxy api responses for, across commands
+GALAXY_DAEMON_CACHE_TTL = 300
+# seconds a galaxy api GET response is reused for by later lookups of the same url in the process
+GALAXY_API_MEMO_TTL = 60
 
 # FIXME: to remove
 # as used (for now) by utils/colors.py and display.py
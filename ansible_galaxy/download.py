@@ -0,0 +1,184 @@
+"""Download a url to a file, in parallel byte range segments when the server allows it
+
+A single connection is often slower than the link, so a large archive is
+split into segments that are requested with 'Range' headers over several
+connections at once, and written at their offsets in the file.
+
+Each segment request has an 'If-Range' header with the ETag (or
+Last-Modified) of the first response, so a file that changes mid download
+gets a full 200 response instead of a mix of old and new bytes. The download
+then starts over as a single stream, as it does for servers that don't
+support ranges or files smaller than min_size.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import os
+import re
+import shutil
+
+from multiprocessing.pool import ThreadPool
+
+from ansible_galaxy.config import runtime
+from ansible_galaxy.flat_rest_api import retry
+from ansible_galaxy.flat_rest_api.urls import open_url
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes\s+(\d+)-(\d+)/(\d+|\*)$')
+
+
+class RangeNotSatisfied(Exception):
+    """A segment request didn't get the bytes it asked for"""
+
+
+def _content_range(resp):
+    """(first, last, total) from the Content-Range of a 206 response, or None"""
+    match = CONTENT_RANGE_RE.match((resp.info().get('Content-Range') or '').strip())
+    if not match:
+        return None
+    first, last, total = match.groups()
+    return int(first), int(last), None if total == '*' else int(total)
+
+
+def _validator(resp):
+    """The ETag or Last-Modified of resp, for If-Range"""
+    etag = resp.info().get('ETag')
+    # a weak etag can't be used for If-Range
+    if etag and not etag.startswith('W/'):
+        return etag
+    return resp.info().get('Last-Modified')
+
+
+def split(total, segments, min_segment_size=None):
+    """Split total bytes into at most segments (first, last) ranges, inclusive like http ranges"""
+    if min_segment_size:
+        segments = max(1, min(segments, total // min_segment_size))
+    size = -(-total // segments)
+    return [(first, min(first + size, total) - 1) for first in range(0, total, size)]
+
+
+class Downloader(object):
+    """Download urls to files, in segments where possible
+
+    :param segments: how many segments, and connections, to use for one file. 1 disables segmenting.
+    :param min_size: files smaller than this many bytes are downloaded in one stream
+    """
+
+    def __init__(self, segments=None, min_size=None, validate_certs=True, policy=None):
+        self.segments = runtime.GALAXY_DOWNLOAD_SEGMENTS if segments is None else segments
+        self.min_size = runtime.GALAXY_DOWNLOAD_SEGMENT_MIN_SIZE if min_size is None else min_size
+        self.validate_certs = validate_certs
+        self.policy = policy or retry.RetryPolicy()
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def _open(self, url, headers=None):
+        return open_url(url, headers=headers, validate_certs=self.validate_certs, timeout=60)
+
+    def download(self, url, path):
+        """Download url to path (which is created or truncated)
+
+        :returns: the number of bytes downloaded
+        """
+        if self.segments > 1:
+            try:
+                return self._download_segmented(url, path)
+            except RangeNotSatisfied as e:
+                self.log.info('segmented download of %s failed (%s), downloading it in one stream', url, e)
+
+        return retry.retry_call(lambda: self._download_stream(url, path), url, policy=self.policy)
+
+    def _download_stream(self, url, path, resp=None):
+        resp = resp or self._open(url)
+        try:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(resp, f, CHUNK_SIZE)
+                return f.tell()
+        finally:
+            resp.close()
+
+    def _download_segmented(self, url, path):
+        """Download url in segments, or in one stream if the server ignores the Range header
+
+        The first segment is asked for with the request that finds out if the
+        server supports ranges, and how big the file is.
+        """
+        first_resp = retry.retry_call(lambda: self._open(url, headers={'Range': 'bytes=0-%d' % (self.min_size - 1)}), url, policy=self.policy)
+        content_range = _content_range(first_resp) if first_resp.getcode() == 206 else None
+
+        if content_range is None or content_range[2] is None:
+            # no ranges, the whole file is on its way already
+            self.log.debug('%s does not support byte ranges', url)
+            self._download_stream(url, path, resp=first_resp)
+            return os.path.getsize(path)
+
+        first, last, total = content_range
+        if first != 0:
+            first_resp.close()
+            raise RangeNotSatisfied('asked for bytes from 0, got them from %d' % first)
+        if last >= total - 1:
+            # all of it fit in the first segment
+            self._download_stream(url, path, resp=first_resp)
+            return total
+
+        validator = _validator(first_resp)
+        ranges = [(0, last)] + [(last + 1 + seg_first, last + 1 + seg_last)
+                                for seg_first, seg_last in split(total - last - 1, self.segments - 1, min_segment_size=self.min_size)]
+        self.log.debug('downloading %s (%d bytes) in %d segments', url, total, len(ranges))
+
+        with open(path, 'wb') as f:
+            f.truncate(total)
+
+        def _segment(byte_range):
+            if byte_range[0] == 0:
+                try:
+                    return self._write_segment(first_resp, path, *byte_range)
+                except retry.TRANSIENT_ERRORS as e:
+                    if not retry.is_transient(e):
+                        raise
+                    self.log.debug('first segment of %s failed (%s), requesting it again', url, e)
+            return retry.retry_call(lambda: self._fetch_segment(url, path, byte_range, total, validator), url, policy=self.policy)
+
+        pool = ThreadPool(len(ranges))
+        try:
+            written = sum(pool.map(_segment, ranges))
+        finally:
+            pool.close()
+            pool.join()
+
+        if written != total:
+            raise RangeNotSatisfied('expected %d bytes, got %d' % (total, written))
+        return total
+
+    def _fetch_segment(self, url, path, byte_range, total, validator):
+        headers = {'Range': 'bytes=%d-%d' % byte_range}
+        if validator:
+            headers['If-Range'] = validator
+        resp = self._open(url, headers=headers)
+        if resp.getcode() != 206 or _content_range(resp) != (byte_range[0], byte_range[1], total):
+            resp.close()
+            raise RangeNotSatisfied('%s changed, or did not send bytes %d-%d' % (url, byte_range[0], byte_range[1]))
+        return self._write_segment(resp, path, *byte_range)
+
+    def _write_segment(self, resp, path, first, last):
+        expected = last - first + 1
+        written = 0
+        try:
+            with open(path, 'r+b') as f:
+                f.seek(first)
+                while written < expected:
+                    data = resp.read(min(CHUNK_SIZE, expected - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+        finally:
+            resp.close()
+
+        if written != expected:
+            raise RangeNotSatisfied('bytes %d-%d: expected %d bytes, got %d' % (first, last, expected, written))
+        return written
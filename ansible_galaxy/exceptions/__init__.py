@@ -13,6 +13,19 @@ class GalaxyClientError(GalaxyError):
     pass
 
 
+class GalaxyHTTPError(GalaxyClientError):
+    """An error response from the galaxy API
+
+    :param http_status: the response's status code
+    :param detail: the error detail the server sent, None if it sent none
+    """
+
+    def __init__(self, message, http_status=None, detail=None):
+        super(GalaxyHTTPError, self).__init__(message)
+        self.http_status = http_status
+        self.detail = detail
+
+
 class ParserError(GalaxyError):
     """Base exception raised for errors while parsing galaxy content"""
     pass
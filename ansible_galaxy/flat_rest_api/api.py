@@ -22,53 +22,138 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import collections
 import logging
-import json
+import threading
+import time
+
 import six
-from six.moves.urllib.error import HTTPError
 from six.moves.urllib.parse import quote as urlquote, urlencode
 
 from ansible_galaxy.flat_rest_api.token import GalaxyToken
 from ansible_galaxy.config import runtime
 from ansible_galaxy import exceptions
+from ansible_galaxy.compat import fastjson
+from ansible_galaxy.models.content import ContentRepoSummary
+from ansible_galaxy.utils.singleflight import SingleFlight
 from ansible_galaxy.utils.text import to_native, to_text
 
-# FIXME: would be nice to just use requests, or better, some async https client
-from ansible_galaxy.flat_rest_api.urls import open_url
+from ansible_galaxy.flat_rest_api.retry import RetryingTransport, RetryPolicy
+from ansible_galaxy.flat_rest_api.server_version import SERVER_VERSION_CACHE
+from ansible_galaxy.flat_rest_api.transport import get_transport
 
 log = logging.getLogger(__name__)
 
+_shared_apis = {}
+_shared_apis_lock = threading.Lock()
+
+
+def project_fields(data, fields):
+    """Keep only the given top level fields of an api object, or of each of the 'results' of a list response
+
+    Servers that don't support sparse field selection send everything, this
+    makes the result the same either way.
+    """
+    if not fields or not isinstance(data, dict):
+        return data
+
+    if isinstance(data.get('results', None), list):
+        data = dict(data)
+        data['results'] = [project_fields(item, fields) for item in data['results']]
+        return data
+
+    return dict((field, data[field]) for field in fields if field in data)
+
 
 def g_connect(method):
     ''' wrapper to lazily initialize connection info to galaxy '''
     def wrapped(self, *args, **kwargs):
         if not self.initialized:
-            log.debug("Initial connection to galaxy_server: %s", self._api_server)
-            server_version = self._get_server_api_version()
-            if server_version not in self.SUPPORTED_VERSIONS:
-                raise exceptions.GalaxyClientError("Unsupported Galaxy server API version: %s" % server_version)
-
-            self.baseurl = '%s/api/%s' % (self._api_server, server_version)
-            self.version = server_version  # for future use
-            log.debug("Base API: %s", self.baseurl)
-            self.initialized = True
+            # a shared api can be used from several threads, only one of them does the handshake
+            with self._init_lock:
+                if not self.initialized:
+                    server_version = self.server_version_cache.get(self._api_server)
+                    if server_version not in self.SUPPORTED_VERSIONS:
+                        log.debug("Initial connection to galaxy_server: %s", self._api_server)
+                        server_version = self._get_server_api_version()
+                        if server_version not in self.SUPPORTED_VERSIONS:
+                            raise exceptions.GalaxyClientError("Unsupported Galaxy server API version: %s" % server_version)
+                        self.server_version_cache.set(self._api_server, server_version)
+
+                    self.baseurl = '%s/api/%s' % (self._api_server, server_version)
+                    self.version = server_version  # for future use
+                    log.debug("Base API: %s", self.baseurl)
+                    self.initialized = True
         return method(self, *args, **kwargs)
     return wrapped
 
 
+def get_shared_api(galaxy):
+    """
+    The GalaxyAPI for the server and options of galaxy, shared by the whole process.
+
+    Reusing it means the token file is read and the api version handshake is
+    made once, and what one install looked up is memoized for the next.
+    """
+    options = galaxy.options
+    key = (options.api_server, options.ignore_certs, getattr(options, 'transport', None), getattr(options, 'retries', None))
+    with _shared_apis_lock:
+        api = _shared_apis.get(key, None)
+        if api is None:
+            api = _shared_apis[key] = GalaxyAPI(galaxy)
+        return api
+
+
+def clear_shared_apis():
+    with _shared_apis_lock:
+        _shared_apis.clear()
+
+
 class GalaxyAPI(object):
     ''' This class is meant to be used as a API client for an Ansible Galaxy server '''
 
     SUPPORTED_VERSIONS = ['v1']
 
-    def __init__(self, galaxy):
+    # default number of results per page for search_roles_pages
+    SEARCH_PAGE_SIZE = 100
+
+    # default number of results per page for get_list_pages
+    LIST_PAGE_SIZE = 100
+
+    # the query param used to ask for only some fields of the api objects
+    SPARSE_FIELDS_PARAM = 'fields'
+
+    # seconds a memoized GET response is reused for, None for runtime.GALAXY_API_MEMO_TTL
+    MEMO_TTL = None
+
+    # the most GET responses memoized at once, the oldest are dropped first
+    MAX_MEMO_ENTRIES = 1000
+
+    def __init__(self, galaxy, transport=None, memo_ttl=None, server_version_cache=None):
         self.galaxy = galaxy
-        self.token = GalaxyToken()
+        # the api version of each server, remembered across instances and runs
+        self.server_version_cache = server_version_cache or SERVER_VERSION_CACHE
+        self._token = None
         self._api_server = runtime.GALAXY_SERVER
         self._validate_certs = not galaxy.options.ignore_certs
+        # see ansible_galaxy.flat_rest_api.transport, by default GETs that fail with a transient error are retried
+        if transport is None:
+            transport = RetryingTransport(get_transport(getattr(galaxy.options, 'transport', None) or runtime.GALAXY_TRANSPORT,
+                                                        validate_certs=self._validate_certs),
+                                          policy=RetryPolicy(retries=getattr(galaxy.options, 'retries', None)))
+        self.transport = transport
         self.baseurl = None
         self.version = None
         self.initialized = False
+        self._init_lock = threading.Lock()
+        # set to False once the server rejects SPARSE_FIELDS_PARAM
+        self.sparse_fields = True
+        # url -> (expiry time, response data), oldest first, see _get_memoized()
+        memo_ttl = self.MEMO_TTL if memo_ttl is None else memo_ttl
+        self.memo_ttl = runtime.GALAXY_API_MEMO_TTL if memo_ttl is None else memo_ttl
+        self._memo = collections.OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._single_flight = SingleFlight()
         self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
 
         self.log.debug('Validate TLS certificates: %s', self._validate_certs)
@@ -77,36 +162,142 @@ class GalaxyAPI(object):
         if galaxy.options.api_server != runtime.GALAXY_SERVER:
             self._api_server = galaxy.options.api_server
 
+    @property
+    def token(self):
+        # only read (or create) the token file for requests that need it
+        if self._token is None:
+            self._token = GalaxyToken()
+        return self._token
+
     def __auth_header(self):
         token = self.token.get()
         if token is None:
             raise exceptions.GalaxyClientError("No access token. You must first use login to authenticate and obtain an access token.")
         return {'Authorization': 'Token ' + token}
 
+    def _response_data(self, resp, method, url):
+        if resp.status >= 400:
+            self.log.debug('Exception on %s %s: http_status=%s', method, url, resp.status)
+            try:
+                res = fastjson.loads(resp.body)
+                detail = res['detail']
+            except (ValueError, KeyError, TypeError):
+                detail = None
+            raise exceptions.GalaxyHTTPError(detail or 'HTTP Error %s: %s' % (resp.status, url),
+                                             http_status=resp.status, detail=detail)
+
+        # decoded straight from the (decompressed) bytes, see compat.fastjson
+        return fastjson.loads(resp.body)
+
     @g_connect
     def __call_galaxy(self, url, args=None, headers=None, method=None):
         if args and not headers:
             headers = self.__auth_header()
-        try:
-            # self.log.info('%s %s', method, url)
-            # self.log.debug('%s %s args=%s', method, url, args)
-            # self.log.debug('%s %s headers=%s', method, url, headers)
-            resp = open_url(url, data=args, validate_certs=self._validate_certs, headers=headers, method=method,
-                            timeout=20)
-            self.log.debug('%s %s http_status=%s', method, url, resp.getcode())
-            final_url = resp.geturl()
-            if final_url != url:
-                self.log.debug('%s %s Redirected to: %s', method, url, resp.geturl())
-            # self.log.debug('%s %s info:\n%s', method, url, resp.info())
-            data = json.loads(to_text(resp.read(), errors='surrogate_or_strict'))
-            # self.log.debug('%s %s data: \n%s', method, url, json.dumps(data, indent=2))
-        except HTTPError as e:
-            self.log.debug('Exception on %s %s', method, url)
-            self.log.exception(e)
-            res = json.loads(to_text(e.fp.read(), errors='surrogate_or_strict'))
-            raise exceptions.GalaxyClientError(res['detail'])
+        # self.log.info('%s %s', method, url)
+        # self.log.debug('%s %s args=%s', method, url, args)
+        # self.log.debug('%s %s headers=%s', method, url, headers)
+        resp = self.transport.request(url, data=args, headers=headers, method=method, timeout=20)
+        self.log.debug('%s %s http_status=%s', method, url, resp.status)
+        if resp.url != url:
+            self.log.debug('%s %s Redirected to: %s', method, url, resp.url)
+        data = self._response_data(resp, method, url)
+        # self.log.debug('%s %s data: \n%s', method, url, json.dumps(data, indent=2))
         return data
 
+    def _memo_get(self, url):
+        with self._memo_lock:
+            memoized = self._memo.get(url, None)
+        if memoized is None:
+            return None
+        expires, data = memoized
+        if expires <= time.time():
+            return None
+        return memoized
+
+    def _memo_set(self, url, data):
+        now = time.time()
+        with self._memo_lock:
+            self._memo.pop(url, None)
+            self._memo[url] = (now + self.memo_ttl, data)
+            # every entry has the same ttl, so the oldest expire first
+            while self._memo:
+                oldest_url, (expires, _) = next(iter(self._memo.items()))
+                if expires > now and len(self._memo) <= self.MAX_MEMO_ENTRIES:
+                    break
+                del self._memo[oldest_url]
+
+    def _get_memoized(self, url):
+        """
+        GET url, reusing the response data of an earlier GET of the same url.
+
+        Concurrent GETs of a url that is not memoized yet share one request.
+        The data is shared too, so callers must not modify it.
+        """
+        memoized = self._memo_get(url)
+        if memoized is not None:
+            self.log.debug('GET %s (memoized)', url)
+            return memoized[1]
+
+        def _get():
+            data = self.__call_galaxy(url)
+            self._memo_set(url, data)
+            return data
+
+        return self._single_flight.do(url, _get)
+
+    def clear_memo(self):
+        with self._memo_lock:
+            self._memo.clear()
+
+    def _sparse_url(self, url, fields):
+        if not fields or not self.sparse_fields:
+            return url
+        return '%s%s%s=%s' % (url, '&' if '?' in url else '?', self.SPARSE_FIELDS_PARAM, ','.join(fields))
+
+    def _sparse_fallback(self, request, fields):
+        """Call request(fields), or request(None) to get every field if the server won't take the fields param"""
+        if not fields or not self.sparse_fields:
+            return request(None)
+
+        try:
+            return request(fields)
+        except exceptions.GalaxyHTTPError as e:
+            # a 400 that doesn't say what was wrong, or names the param. Anything
+            # else (not found, auth, server errors) isn't about the fields param.
+            if e.http_status != 400 or (e.detail and self.SPARSE_FIELDS_PARAM not in to_text(e.detail)):
+                raise
+            self.log.debug('%s does not support the %s param (%s), requesting all fields', self._api_server, self.SPARSE_FIELDS_PARAM, e)
+            self.sparse_fields = False
+            return request(None)
+
+    def _call_galaxy_sparse(self, url, fields):
+        data = self._sparse_fallback(lambda sparse_fields: self._get_memoized(self._sparse_url(url, sparse_fields)), fields)
+        return project_fields(data, fields)
+
+    @g_connect
+    def get_many(self, urls, memoize=False):
+        """
+        GET several API urls at once.
+
+        With a transport that supports it, the requests are in flight at the
+        same time instead of one after the other.
+
+        :param memoize: reuse, and remember, response data like _get_memoized() does
+        :returns: a list of the response data, in the same order as urls
+        """
+        if not memoize:
+            responses = self.transport.get_many(urls, timeout=20)
+            return [self._response_data(resp, 'GET', url) for url, resp in zip(urls, responses)]
+
+        memoized = dict((url, self._memo_get(url)) for url in urls)
+        misses = [url for url in urls if memoized[url] is None]
+        # dedupe, the same related url can be asked for more than once
+        misses = sorted(set(misses), key=misses.index)
+        fetched = dict(zip(misses, self.get_many(misses))) if misses else {}
+        for url, data in fetched.items():
+            self._memo_set(url, data)
+        return [fetched[url] if memoized[url] is None else memoized[url][1] for url in urls]
+
     @property
     def api_server(self):
         return self._api_server
@@ -122,12 +313,15 @@ class GalaxyAPI(object):
         """
         url = '%s/api/' % self._api_server
         try:
-            return_data = open_url(url, validate_certs=self._validate_certs)
+            return_data = self.transport.request(url)
         except Exception as e:
             raise exceptions.GalaxyClientError("Failed to get data from the API server (%s): %s " % (url, to_native(e)))
 
+        if return_data.status >= 400:
+            raise exceptions.GalaxyClientError("Failed to get data from the API server (%s): HTTP Error %s" % (url, return_data.status))
+
         try:
-            data = json.loads(to_text(return_data.read(), errors='surrogate_or_strict'))
+            data = fastjson.loads(return_data.body)
         except Exception as e:
             raise exceptions.GalaxyClientError("Could not process data from the API server (%s): %s " % (url, to_native(e)))
 
@@ -143,9 +337,8 @@ class GalaxyAPI(object):
         """
         url = '%s/tokens/' % self.baseurl
         args = urlencode({"github_token": github_token})
-        resp = open_url(url, data=args, validate_certs=self._validate_certs, method="POST")
-        data = json.loads(to_text(resp.read(), errors='surrogate_or_strict'))
-        return data
+        resp = self.transport.request(url, data=args, method="POST")
+        return self._response_data(resp, "POST", url)
 
     @g_connect
     def create_import_task(self, github_user, github_repo, reference=None, role_name=None):
@@ -184,16 +377,34 @@ class GalaxyAPI(object):
         return data['results']
 
     @g_connect
-    def lookup_content_repo_by_name(self, namespace, name):
+    def lookup_content_repo_by_name(self, namespace, name, fields=None):
+        """
+        Find content by its namespace and repository name.
+
+        :param fields: only return these fields of the content object, and
+            ask the server to only send them if it can
+        """
         namespace = urlquote(namespace)
         name = urlquote(name)
 
         url = '%s/content/?repository__name=%s&namespace__name=%s' % (self.baseurl, name, namespace)
-        data = self.__call_galaxy(url)
+        data = self._call_galaxy_sparse(url, fields)
         if len(data["results"]) != 0:
             return data["results"][0]
         return None
 
+    @g_connect
+    def lookup_content_repo_summary(self, namespace, name):
+        """
+        lookup_content_repo_by_name(), for only what is needed to install the content.
+
+        :returns: a ContentRepoSummary, or None if it was not found
+        """
+        data = self.lookup_content_repo_by_name(namespace, name, fields=ContentRepoSummary.API_FIELDS)
+        if data is None:
+            return None
+        return ContentRepoSummary.from_api(data)
+
     @g_connect
     def lookup_content_by_name(self, user_name, repo_name, content_name, content_type=None, notify=True):
         content_name = urlquote(content_name)
@@ -203,15 +414,18 @@ class GalaxyAPI(object):
             self.log.info("- downloading content '%s', type '%s',repo_name '%s'  owned by %s", content_name, content_type, repo_name, user_name)
 
         url = '%s/content/?owner__username=%s&name=%s' % (self.baseurl, user_name, content_name)
-        data = self.__call_galaxy(url)
+        data = self._get_memoized(url)
         if len(data["results"]) != 0:
             return data["results"][0]
         return None
 
     @g_connect
-    def lookup_role_by_name(self, role_name, notify=True):
+    def lookup_role_by_name(self, role_name, notify=True, fields=None):
         """
         Find a role by name.
+
+        :param fields: only return these fields of the role, and ask the
+            server to only send them if it can
         """
         role_name = urlquote(role_name)
 
@@ -226,7 +440,7 @@ class GalaxyAPI(object):
             raise exceptions.GalaxyClientError("Invalid role name (%s). Specify role as format: username.rolename" % role_name)
 
         url = '%s/roles/?owner__username=%s&name=%s' % (self.baseurl, user_name, role_name)
-        data = self.__call_galaxy(url)
+        data = self._call_galaxy_sparse(url, fields)
         if len(data["results"]) != 0:
             return data["results"][0]
         return None
@@ -250,16 +464,18 @@ class GalaxyAPI(object):
         self.log.debug('related_url=%s', related_url)
         try:
             url = '%s%s?page_size=50' % (self._api_server, related_url)
-            data = self.__call_galaxy(url)
+            data = self._get_memoized(url)
             results = data.get('results', None)
             if results is None:
                 # not a results list, just return the item
                 return data
 
+            # the memoized page is shared, extend a copy
+            results = list(results)
             done = (data.get('next_link', None) is None)
             while not done:
                 url = '%s%s' % (self._api_server, data['next_link'])
-                data = self.__call_galaxy(url)
+                data = self._get_memoized(url)
                 results += data['results']
                 done = (data.get('next_link', None) is None)
             return results
@@ -268,43 +484,98 @@ class GalaxyAPI(object):
             return None
 
     @g_connect
-    def get_list(self, what):
+    def fetch_content_related_many(self, related_urls, fields=None):
         """
-        Fetch the list of items specified.
+        fetch_content_related() for several related urls, with the first
+        page of each requested at the same time (see get_many()).
+
+        :param fields: only return these fields of the related objects
+        :returns: a list of what fetch_content_related() would return for each url, None for a url that is None
         """
+        urls = ['%s%s?page_size=50' % (self._api_server, related_url) for related_url in related_urls if related_url]
+
+        def _get_many(sparse_fields):
+            return self.get_many([self._sparse_url(url, sparse_fields) for url in urls], memoize=True)
+
         try:
-            url = '%s/%s/?page_size' % (self.baseurl, what)
+            pages = iter(self._sparse_fallback(_get_many, fields))
+        except Exception as e:
+            self.log.exception(e)
+            return [None] * len(related_urls)
+
+        related = []
+        for related_url in related_urls:
+            if not related_url:
+                related.append(None)
+                continue
+
+            data = next(pages)
+            results = data.get('results', None)
+            if results is None:
+                # not a results list, just the item
+                related.append(project_fields(data, fields))
+                continue
+
+            results = list(results)
+            try:
+                while data.get('next_link', None) is not None:
+                    data = self._get_memoized('%s%s' % (self._api_server, data['next_link']))
+                    results += data['results']
+            except Exception as e:
+                self.log.exception(e)
+                results = None
+            related.append(project_fields({'results': results}, fields)['results'] if results is not None else None)
+        return related
+
+    @g_connect
+    def get_list_pages(self, what, filters=None, page_size=None):
+        """
+        Generator over the pages of the list of items specified.
+
+        Each page is the list of 'results' from one response. If the
+        response is not paginated, the response data itself is the only page.
+
+        :param filters: dict of extra query params, for ex {'modified__gt': cursor}
+        """
+        params = dict(filters or {})
+        params['page_size'] = page_size or self.LIST_PAGE_SIZE
+        url = '%s/%s/?%s' % (self.baseurl, what, urlencode(sorted(params.items())))
+
+        while url:
             data = self.__call_galaxy(url)
-            if "results" in data:
-                results = data['results']
-            else:
-                results = data
-            done = True
-            if "next" in data:
-                done = (data.get('next_link', None) is None)
-            while not done:
+            if "results" not in data:
+                yield data
+                return
+
+            yield data['results']
+
+            url = None
+            if data.get('next_link', None):
                 url = '%s%s' % (self._api_server, data['next_link'])
-                data = self.__call_galaxy(url)
-                results += data['results']
-                done = (data.get('next_link', None) is None)
+
+    @g_connect
+    def get_list(self, what, filters=None):
+        """
+        Fetch the list of items specified.
+        """
+        try:
+            results = None
+            for page in self.get_list_pages(what, filters=filters):
+                if results is None:
+                    results = list(page) if isinstance(page, list) else page
+                else:
+                    results += page
             return results
         except Exception as error:
             self.log.exception(error)
             raise exceptions.GalaxyClientError("Failed to download the %s list: %s" % (what, str(error)))
 
-    @g_connect
-    def search_roles(self, search, **kwargs):
-
+    def _search_roles_url(self, search, tags=None, platforms=None, author=None, page_size=None, page=None):
         search_url = self.baseurl + '/search/roles/?'
 
         if search:
             search_url += '&autocomplete=' + urlquote(search)
 
-        tags = kwargs.get('tags', None)
-        platforms = kwargs.get('platforms', None)
-        page_size = kwargs.get('page_size', None)
-        author = kwargs.get('author', None)
-
         if tags and isinstance(tags, six.string_types):
             tags = tags.split(',')
             search_url += '&tags_autocomplete=' + '+'.join(tags)
@@ -316,12 +587,77 @@ class GalaxyAPI(object):
         if page_size:
             search_url += '&page_size=%s' % page_size
 
+        if page:
+            search_url += '&page=%s' % page
+
         if author:
             search_url += '&username_autocomplete=%s' % author
 
+        return search_url
+
+    @g_connect
+    def search_roles(self, search, **kwargs):
+
+        search_url = self._search_roles_url(search,
+                                            tags=kwargs.get('tags', None),
+                                            platforms=kwargs.get('platforms', None),
+                                            author=kwargs.get('author', None),
+                                            page_size=kwargs.get('page_size', None))
+
         data = self.__call_galaxy(search_url)
         return data
 
+    @g_connect
+    def search_roles_pages(self, search, offset=0, limit=None, page_size=None, **kwargs):
+        """
+        Generator over the pages of a role search.
+
+        Pages are requested lazily as the caller iterates, and the 'results' of
+        each yielded page are trimmed to the requested offset and limit. The
+        page size defaults to SEARCH_PAGE_SIZE, or the limit if that is smaller,
+        so the server never sends many more results than were asked for.
+        """
+        offset = offset or 0
+        if limit is not None and limit <= 0:
+            return
+
+        if not page_size:
+            page_size = self.SEARCH_PAGE_SIZE
+            if limit:
+                page_size = min(limit, page_size)
+
+        # start on the page that holds 'offset' and skip what is before it
+        page = offset // page_size + 1
+        skip = offset % page_size
+        remaining = limit
+
+        url = self._search_roles_url(search,
+                                     tags=kwargs.get('tags', None),
+                                     platforms=kwargs.get('platforms', None),
+                                     author=kwargs.get('author', None),
+                                     page_size=page_size,
+                                     page=page if page > 1 else None)
+
+        while url:
+            data = self.__call_galaxy(url)
+
+            results = data.get('results', [])[skip:]
+            skip = 0
+            if remaining is not None:
+                results = results[:remaining]
+                remaining -= len(results)
+
+            data['results'] = results
+            yield data
+
+            if remaining is not None and remaining <= 0:
+                break
+
+            if data.get('next_link', None):
+                url = '%s%s' % (self._api_server, data['next_link'])
+            else:
+                url = data.get('next', None)
+
     @g_connect
     def add_secret(self, source, github_user, github_repo, secret):
         url = "%s/notification_secrets/" % self.baseurl
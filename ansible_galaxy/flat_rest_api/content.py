@@ -28,27 +28,52 @@ import errno
 import json
 import logging
 import os
-import shutil
 from shutil import rmtree
 import six
-import subprocess
-import tarfile
-import tempfile
 import yaml
 
 from distutils.version import LooseVersion
 
-from ansible_galaxy.flat_rest_api.api import GalaxyAPI
+from ansible_galaxy.flat_rest_api.api import get_shared_api
 from ansible_galaxy.config import defaults
+from ansible_galaxy.config import runtime
 from ansible_galaxy import exceptions
+from ansible_galaxy import manifest
+from ansible_galaxy import mirrors
+from ansible_galaxy.archive import decompress
+from ansible_galaxy.archive import extract
+from ansible_galaxy import scm as galaxy_scm
+from ansible_galaxy import store
 from ansible_galaxy.models.content import CONTENT_PLUGIN_TYPES, CONTENT_TYPES
 from ansible_galaxy.models.content import CONTENT_TYPE_DIR_MAP, VALID_ROLE_SPEC_KEYS
 from ansible_galaxy.models import content
 
-from ansible_galaxy.flat_rest_api.urls import open_url
+from ansible_galaxy.flat_rest_api import retry
 
 log = logging.getLogger(__name__)
 
+# install info holds a manifest of every file, use libyaml to read and write it when it is available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# parsed install info files, by path, reused until the file changes, so a
+# long lived process (see ansible_galaxy_cli.daemon) parses each one once
+_install_info_cache = {}
+
+
+def load_install_info(info_path):
+    """The parsed install info file at info_path
+
+    :returns: a dict the caller may change, but not the values in it
+    """
+    st = os.stat(info_path)
+    key = (st.st_ino, st.st_size, getattr(st, 'st_mtime_ns', st.st_mtime))
+    cached = _install_info_cache.get(info_path)
+    if cached is None or cached[0] != key:
+        with open(info_path, 'r') as f:
+            cached = _install_info_cache[info_path] = (key, yaml.load(f, Loader=YAML_LOADER))
+    return dict(cached[1]) if cached[1] else cached[1]
+
 # has a GalaxyContentMeta FIXME: rename back to GalaxyContentData
 # FIXME: erk, and a metadata (ie, ansible-galaxy.yml)
 #
@@ -83,6 +108,13 @@ class GalaxyContent(object):
     META_INSTALL = os.path.join('meta', '.galaxy_install_info')
     ROLE_DIRS = ('defaults', 'files', 'handlers', 'meta', 'tasks', 'templates', 'vars', 'tests')
 
+    # resolving dependencies makes one of these for each role, keep them small
+    __slots__ = ('_metadata', '_galaxy_metadata', '_install_info', 'scm_archive', 'archive_source', 'archive_sha256',
+                 '_validate_certs', 'display_callback', 'options', 'galaxy', 'content', '_install_all',
+                 '_content_type', 'type_dir', '_orig_path', 'paths')
+
+    log = logging.getLogger(__name__ + '.GalaxyContent')
+
     # FIXME(alikins): Not a fan of vars/args with names like 'type', but leave it for now
     def __init__(self, galaxy, name,
                  src=None, version=None, scm=None, path=None, type="role",
@@ -106,12 +138,20 @@ class GalaxyContent(object):
 
         content_type = type
 
+        # self.path and self.paths are worked out the first time self.path is
+        # used, so making a GalaxyContent doesn't touch the filesystem
+        self.paths = None
         self._metadata = None
         self._galaxy_metadata = None
         self._install_info = None
+        # a tar file of the scm repo, if it was archived ahead of install()
+        self.scm_archive = None
+        # the url or path the archive was downloaded from, see fetch()
+        self.archive_source = None
+        # the sha256 of the archive installed, see install()
+        self.archive_sha256 = None
         self._validate_certs = not galaxy.options.ignore_certs
 
-        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
         self.log.debug('Validate TLS certificates: %s', self._validate_certs)
 
         self.display_callback = display_callback or self._display_callback
@@ -130,22 +170,17 @@ class GalaxyContent(object):
         # This is a marker needed to make certain decisions about single
         # content type vs all content found in the repository archive when
         # extracting files
-        self._install_all_content = False
-        if content_type == "all":
-            self._install_all_content = True
+        self._install_all = content_type == "all"
 
         self._set_type(content_type)
 
-        if self.content_type not in CONTENT_TYPES and self.content_type != "all":
-            raise exceptions.GalaxyClientError("%s is not a valid Galaxy Content Type" % self.content_type)
+        if content_type not in CONTENT_TYPES and content_type != "all":
+            raise exceptions.GalaxyClientError("%s is not a valid Galaxy Content Type" % content_type)
 
         # Set original path, needed to determine what action to take in order to
         # maintain backwards compat with legacy roles
         self._orig_path = path
 
-        # Set self.path and self.path_dir
-        self._set_content_paths(path)
-
     def _display_callback(self, *args, **kwargs):
         level_arg = kwargs.pop('level', None)
         levels = {'warning': 'WARNING'}
@@ -167,6 +202,13 @@ class GalaxyContent(object):
     def __eq__(self, other):
         return self.content.name == other.content.name
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        # content is equal by name, and the meta's hash is the hash of its name
+        return hash(self.content)
+
     def _set_type(self, new_type):
         """
         Set the internal type information, because GalaxyContent can contain
@@ -182,18 +224,31 @@ class GalaxyContent(object):
 
         # FIXME - Anytime we change state like this, it feels wrong. Should
         #         probably evaluate a better way to do this.
-        self.content_type = new_type
+        self._content_type = new_type
 
         # We need this because the type_dir inside a Galaxy Content archive is
         # not the same as it's installed location as per the CONTENT_TYPE_DIR_MAP
         # for some types
         self.type_dir = "%ss" % new_type
 
+    @property
+    def content_type(self):
+        # with an explicit path, "all" content with a meta/main.yml there is a
+        # legacy role, resolving the paths finds out
+        if self._content_type == "all" and self.paths is None:
+            self._set_content_paths(self._orig_path)
+        return self._content_type
+
+    @property
+    def _install_all_content(self):
+        if self._content_type == "all" and self.paths is None:
+            self._set_content_paths(self._orig_path)
+        return self._install_all
+
     def _set_content_paths(self, path=None):
         """
         Conditionally set content path based on content type
         """
-        content_paths = "" #FIXME - handle multiple content types here
 
         # FIXME - ":" is a placeholder default value for --content_path in the
         #         galaxy cli and it should really not be
@@ -202,45 +257,36 @@ class GalaxyContent(object):
             # "we're going to install everything", however that comes with the
             # caveot of needing to inspect to find out if there's a meta/main.yml
             # and handling a legacy role type accordingly
-            if self.content.name not in path and self.content_type in ["role", "all"]:
+            if self.content.name not in path and self._content_type in ["role", "all"]:
                 path = os.path.join(path, self.content.name)
-            self.path = path
+            self.content.path = path
+            self.paths = [path]
 
             # We need for first set self.path (as we did above) in order to then
             # allow the property function "metadata" to check for the existence
-            # of a meta/main.yml and it not, then we don't join the name to the
-            # end of the path because it's not necessary for non-role content
-            # types as they aren't namespaced by directory
-            if not self.metadata:
-                self.path = path
-            else:
-                # If we find a meta/main.yml, this is a legacy role and we need
-                # to handle it
+            # of a meta/main.yml, if there is one when installing "all" this is
+            # a legacy role and we need to handle it
+            if self._content_type == "all" and self.metadata:
                 self._set_type("role")
-                self._install_all_content = False
-
-            self.paths = [path]
+                self._install_all = False
         else:
-            # First, populate the self.galaxy.content_paths for processing below
-
             # Unfortunately this exception is needed and we can't easily rely
             # on the dir_map because there's not consistency of plural vs
             # singular of type between the contants vars read in from the config
             # file and the subdirectories
-            if self.content_type != "all":
-                self.galaxy.content_paths = [os.path.join(os.path.expanduser(p),
-                                                          CONTENT_TYPE_DIR_MAP[self.content_type]) for p in defaults.DEFAULT_CONTENT_PATH]
+            if self._content_type != "all":
+                content_paths = [os.path.join(os.path.expanduser(p),
+                                              CONTENT_TYPE_DIR_MAP[self._content_type]) for p in defaults.DEFAULT_CONTENT_PATH]
             else:
-                self.galaxy.content_paths = defaults.DEFAULT_CONTENT_PATH
+                content_paths = defaults.DEFAULT_CONTENT_PATH
 
             # use the first path by default
-            if self.content_type == "role":
-                self.content.path = os.path.join(self.galaxy.content_paths[0], self.content.name)
+            if self._content_type == "role":
+                self.content.path = os.path.join(content_paths[0], self.content.name)
             else:
-                self.content.path = self.galaxy.content_paths[0]
+                self.content.path = content_paths[0]
             # create list of possible paths
-            self.paths = [x for x in self.galaxy.content_paths]
-            self.paths = [os.path.join(x, self.content.name) for x in self.paths]
+            self.paths = [os.path.join(x, self.content.name) for x in content_paths]
 
     # FIXME: update calling code instead?
     @property
@@ -265,6 +311,8 @@ class GalaxyContent(object):
 
     @property
     def path(self):
+        if self.paths is None:
+            self._set_content_paths(self._orig_path)
         return self.content.path
 
     @property
@@ -274,7 +322,7 @@ class GalaxyContent(object):
         """
         if self.content_type in ["role", "all"]:
             if self._metadata is None:
-                meta_path = os.path.join(self.content.path, self.META_MAIN)
+                meta_path = os.path.join(self.path, self.META_MAIN)
                 if os.path.isfile(meta_path):
                     try:
                         f = open(meta_path, 'r')
@@ -320,14 +368,11 @@ class GalaxyContent(object):
             info_path = os.path.join(self.path, self.META_INSTALL)
             if os.path.isfile(info_path):
                 try:
-                    f = open(info_path, 'r')
-                    self._install_info = yaml.safe_load(f)
+                    self._install_info = load_install_info(info_path)
                 except Exception as e:
                     self.log.exception(e)
                     self.debug("Unable to load Galaxy install info for %s", self.content.name)
                     return False
-                finally:
-                    f.close()
         return self._install_info
 
     def _write_galaxy_install_info(self):
@@ -343,12 +388,18 @@ class GalaxyContent(object):
             version=self.version,
             install_date=datetime.datetime.utcnow().strftime("%c"),
         )
+        if self.archive_source:
+            info['source'] = self.archive_source
+        if self.archive_sha256:
+            info['archive_sha256'] = self.archive_sha256
+        # what was installed, for 'verify'
+        info['files'] = manifest.build(self.path, exclude=[self.META_INSTALL])
         if not os.path.exists(os.path.join(self.path, 'meta')):
             os.makedirs(os.path.join(self.path, 'meta'))
         info_path = os.path.join(self.path, self.META_INSTALL)
         with open(info_path, 'w+') as f:
             try:
-                self._install_info = yaml.safe_dump(info, f)
+                self._install_info = yaml.dump(info, f, Dumper=YAML_DUMPER)
             except Exception as e:
                 self.log.warn('unable to serialize .galaxy_install_info to info_path=%s for data=%s', info_path, info)
                 self.log.exception(e)
@@ -356,7 +407,7 @@ class GalaxyContent(object):
 
         return True
 
-    def _write_archived_files(self, tar_file, parent_dir, file_name=None):
+    def _write_archived_files(self, tar_file, parent_dir, file_name=None, dest=None):
         """
         Extract and write out files from the archive, this is a common operation
         needed for both old-roles and new-style galaxy content, the main
@@ -365,16 +416,18 @@ class GalaxyContent(object):
         :param tar_file: tarfile, the local archive of the galaxy content files
         :param parent_dir: str, parent directory path to extract to
         :kwarg file_name: str, specific filename to extract from parent_dir in archive
+        :kwarg dest: str, directory to write the files to, defaults to self.path
         """
         # now we do the actual extraction to the path
+        dest = dest or self.path
 
         plugin_found = None
+        # (member, name to extract it as), written all at once by the extractor at the end
+        to_extract = []
+        # without --force, installing over existing files is an error. For a fresh
+        # install there is nothing to check, so skip the per file stat.
+        check_exists = not getattr(self.options, "force", False) and os.path.isdir(dest)
         for member in tar_file.getmembers():
-            # Have to preserve this to reset it for the sake of processing the
-            # same TarFile object many times when handling an ansible-galaxy.yml
-            # file
-            orig_name = member.name
-
             # we only extract files, and remove any relative path
             # bits that might be in the file for security purposes
             # and drop any containing directory, as mentioned above
@@ -424,17 +477,19 @@ class GalaxyContent(object):
                 for part in parts:
                     if part != '..' and '~' not in part and '$' not in part:
                         final_parts.append(part)
-                member.name = os.path.join(*final_parts)
+                # the member itself isn't renamed, the same TarFile is processed
+                # many times when handling an ansible-galaxy.yml file
+                name = os.path.join(*final_parts)
 
                 if self.content_type in CONTENT_PLUGIN_TYPES:
                     self.display_callback(
                         "-- extracting %s %s from %s into %s" %
-                        (self.content_type, member.name, self.content.name, os.path.join(self.path, member.name))
+                        (self.content_type, name, self.content.name, os.path.join(self.path, name))
                     )
-                if os.path.exists(os.path.join(self.path, member.name)) and not getattr(self.options, "force", False):
+                if check_exists and os.path.exists(os.path.join(dest, name)):
                     if self.content_type in CONTENT_PLUGIN_TYPES:
                         message = (
-                            "the specified Galaxy Content %s appears to already exist." % os.path.join(self.path, member.name),
+                            "the specified Galaxy Content %s appears to already exist." % os.path.join(self.path, name),
                             "Use of --force for non-role Galaxy Content Type is not yet supported"
                         )
                         if self._install_all_content:
@@ -450,13 +505,11 @@ class GalaxyContent(object):
                         else:
                             raise exceptions.GalaxyClientError(message)
 
-                # Alright, *now* actually write the file
-                tar_file.extract(member, self.path)
+                to_extract.append((member, name))
 
-                # Reset the name so we're on equal playing field for the sake of
-                # re-processing this TarFile object as we iterate through entries
-                # in an ansible-galaxy.yml file
-                member.name = orig_name
+        # Alright, *now* actually write the files
+        extract.extract(tar_file, to_extract, dest,
+                        workers=getattr(self.options, 'extract_workers', None), fsync=getattr(self.options, 'fsync', None))
 
         if self.content_type != "role":
             if not plugin_found:
@@ -506,30 +559,36 @@ class GalaxyContent(object):
 
             self.display_callback("- downloading content from %s" % archive_url)
 
+            # see ansible_galaxy.mirrors, the archive may come from a mirror of archive_url
+            sources = mirrors.ArchiveSources(mirrors=getattr(self.options, 'mirrors', None) or None,
+                                             fastest=getattr(self.options, 'fastest_mirror', None),
+                                             validate_certs=self._validate_certs,
+                                             policy=retry.RetryPolicy(retries=getattr(self.options, 'retries', None)),
+                                             segments=getattr(self.options, 'download_segments', None))
             try:
-                url_file = open_url(archive_url, validate_certs=self._validate_certs)
-                temp_file = tempfile.NamedTemporaryFile(delete=False)
-                data = url_file.read()
-                while data:
-                    temp_file.write(data)
-                    data = url_file.read()
-                temp_file.close()
-                return temp_file.name
+                tmp_file, self.archive_source = sources.fetch(archive_url)
+                return tmp_file
             except Exception as e:
                 self.log.exception(e)
                 self.display_callback("failed to download the file: %s" % str(e), level='error')
 
         return False
 
-    # TODO: split this up, it's pretty gnarly
-    def install(self):
-        # the file is a tar, so open it that way and extract it
-        # to the specified (or default) content directory
+    def fetch_archive(self):
+        """
+        Get an archive of the content, from its scm repo, galaxy or a url, or
+        the local tar file it names
+
+        Looking the content up on galaxy sets its version, if none was given.
+
+        :returns: (path of the archive, True if it's a local file that must be left in place)
+        """
         local_file = False
 
         if self.scm:
-            # create tar file from scm url
-            tmp_file = GalaxyContent.scm_archive_content(**self.spec)
+            # create tar file from scm url, unless it was already archived
+            tmp_file = self.scm_archive or GalaxyContent.scm_archive_content(**self.spec)
+            self.scm_archive = None
         elif self.src:
             if os.path.isfile(self.src):
                 # installing a local tar.gz
@@ -539,25 +598,26 @@ class GalaxyContent(object):
                 content_data = self.src
                 tmp_file = self.fetch(content_data)
             else:
-                api = GalaxyAPI(self.galaxy)
+                api = get_shared_api(self.galaxy)
                 # FIXME - Need to update our API calls once Galaxy has them implemented
                 content_username, repo_name, content_name = parse_content_name(self.src)
                 self.log.debug('content_username=%s, repo_name=%s content_name=%s', content_username, repo_name, content_name)
                 # TODO: extract parsing of cli content sorta-url thing and add better tests
                 repo_name = repo_name or content_name
-                content_data = api.lookup_content_repo_by_name(content_username, repo_name)
+                content_data = api.lookup_content_repo_summary(content_username, repo_name)
                 if not content_data:
                     raise exceptions.GalaxyClientError("- sorry, %s was not found on %s." % (self.src, api.api_server))
 
-                if content_data.get('role_type') == 'APP':
+                if content_data.role_type == 'APP':
                     # Container Role
                     self.display_callback("%s is a Container App role, and should only be installed using Ansible "
                                           "Container" % self.content.name, level='warning')
 
                 # FIXME - Need to update our API calls once Galaxy has them implemented
-                related = content_data.get('related', {})
-                related_versions_url = related.get('versions', None)
-                content_versions = api.fetch_content_related(related_versions_url)
+                # the versions and the repository are requested together, and
+                # only the version names and the repository's external_url are needed
+                content_versions, content_repo = api.fetch_content_related_many([content_data.versions_url, content_data.repository_url],
+                                                                                fields=('name', 'external_url'))
 
                 if not self.version:
                     # convert the version names to LooseVersion objects
@@ -576,8 +636,8 @@ class GalaxyContent(object):
                             )
                         self.content.version = str(loose_versions[-1])
                     # FIXME: follow 'repository' branch and it's ['import_branch'] ?
-                    elif content_data.get('github_branch', None):
-                        self.content.version = content_data['github_branch']
+                    elif content_data.github_branch:
+                        self.content.version = content_data.github_branch
                     else:
                         self.content.version = 'master'
                 elif self.version != 'master':
@@ -585,31 +645,52 @@ class GalaxyContent(object):
                         raise exceptions.GalaxyError("- the specified version (%s) of %s was not found in the list of available versions (%s)." % (self.version,
                                                                                                                                                    self.content.name,
                                                                                                                                                    content_versions))
-                related_repo_url = related.get('repository', None)
-                content_repo = None
-                if related_repo_url:
-                    content_repo = api.fetch_content_related(related_repo_url)
                 self.log.debug('content_repo: %s', content_repo)
 
                 external_url = content_repo.get('external_url', None)
                 if external_url:
-                    tmp_file = self.fetch(content_data, external_url)
+                    tmp_file = self.fetch(content_data._asdict(), external_url)
                 else:
-                    tmp_file = self.fetch(content_data)
+                    tmp_file = self.fetch(content_data._asdict())
 
         else:
             raise exceptions.GalaxyClientError("No valid content data found")
 
+        return tmp_file, local_file
+
+    # TODO: split this up, it's pretty gnarly
+    def install(self, archive=None):
+        """
+        Install the content, from archive if it's given
+
+        :param archive: the path of an archive of the content already got
+            with fetch_archive(), installing leaves it in place
+        """
+        # the file is a tar, so open it that way and extract it
+        # to the specified (or default) content directory
+        if archive:
+            tmp_file, local_file = archive, True
+        else:
+            tmp_file, local_file = self.fetch_archive()
+
         if tmp_file:
 
             self.log.debug("installing from %s", tmp_file)
-            if not tarfile.is_tarfile(tmp_file):
-                raise exceptions.GalaxyClientError("the file downloaded was not a tar.gz")
+
+            # recorded in the install info, and the key of the content store
+            self.archive_sha256 = store.file_checksum(tmp_file)
+            if self._link_mode() != 'none' and self.content_type == "role":
+                entry = store.CONTENT_STORE.get(self.content.name, self.version, self.archive_sha256)
+                if entry:
+                    # only old-style roles are stored, and this archive has been extracted before
+                    return self._install_from_store(entry, tmp_file, local_file)
+
+            try:
+                # decompressed once, up front, the archive is read more than once below
+                content_tar_file = decompress.open_tar(tmp_file, decompressor=getattr(self.options, 'decompressor', None))
+            except exceptions.GalaxyClientError as e:
+                raise exceptions.GalaxyClientError("the file downloaded was not a tar archive: %s" % e)
             else:
-                if tmp_file.endswith('.gz'):
-                    content_tar_file = tarfile.open(tmp_file, "r:gz")
-                else:
-                    content_tar_file = tarfile.open(tmp_file, "r")
                 # verify the role's meta file
 
                 meta_file = None
@@ -648,7 +729,7 @@ class GalaxyContent(object):
                 if self.content_type == "all" and meta_file:
                     self._set_type("role")
                     self._set_content_paths(self._orig_path)
-                    self._install_all_content = False
+                    self._install_all = False
 
                 if not archive_parent_dir:
                     # archive_parent_dir wasn't found above when checking for metadata files
@@ -708,22 +789,16 @@ class GalaxyContent(object):
                     try:
                         if self.content_type == "role" and meta_file and not galaxy_file:
                             # This is an old-style role
-                            if os.path.exists(self.path):
-                                if not os.path.isdir(self.path):
-                                    raise exceptions.GalaxyClientError("the specified roles path exists and is not a directory.")
-                                elif not getattr(self.options, "force", False):
-                                    msg = "the specified role %s appears to already exist. Use --force to replace it." % self.content.name
-                                    raise exceptions.GalaxyClientError(msg)
-                                else:
-                                    # using --force, remove the old path
-                                    if not self.remove():
-                                        raise exceptions.GalaxyClientError("%s doesn't appear to contain a role.\n  please remove this directory manually if you really "
-                                                        "want to put the role here." % self.path)
+                            self._prepare_role_path()
+
+                            if self._link_mode() != 'none':
+                                # extract it into the store once, and link it from there
+                                entry = store.CONTENT_STORE.add(self.content.name, self.version, self.archive_sha256,
+                                                                lambda entry_dir: self._write_archived_files(content_tar_file, archive_parent_dir,
+                                                                                                             dest=entry_dir))
+                                store.CONTENT_STORE.materialize(entry, self.path, link_mode=self._link_mode())
                             else:
-                                os.makedirs(self.path)
-
-
-                            self._write_archived_files(content_tar_file, archive_parent_dir)
+                                self._write_archived_files(content_tar_file, archive_parent_dir)
 
                             # write out the install info file for later use
                             self._write_galaxy_install_info()
@@ -866,7 +941,7 @@ class GalaxyContent(object):
                                 ]
 
                                 if plugin_subdirs:
-                                    self._install_all_content = True
+                                    self._install_all = True
                                     for plugin_subdir in plugin_subdirs:
                                         # Set the type, this is neccesary for processing extraction of
                                         # the tarball content
@@ -886,23 +961,59 @@ class GalaxyContent(object):
                         if e.errno == errno.EACCES and len(self.paths) > 1:
                             current = self.paths.index(self.path)
                             if len(self.paths) > current:
-                                self.path = self.paths[current + 1]
+                                self.content.path = self.paths[current + 1]
                                 error = False
                         if error:
                             raise exceptions.GalaxyClientError("Could not update files in %s: %s" % (self.path, str(e)))
 
+                content_tar_file.close()
+
                 # return the parsed yaml metadata
                 self.display_callback("- %s was installed successfully" % str(self))
-                if not local_file:
-                    try:
-                        os.unlink(tmp_file)
-                    except (OSError, IOError) as e:
-                        self.warn('Unable to remove tmp file (%s): %s' % (tmp_file, str(e)))
-                        self.display_callback("Unable to remove tmp file (%s): %s" % (tmp_file, str(e)), level='warning')
+                self._remove_tmp_file(tmp_file, local_file)
                 return True
 
         return False
 
+    def _link_mode(self):
+        return getattr(self.options, 'link_mode', None) or runtime.GALAXY_LINK_MODE
+
+    def _prepare_role_path(self):
+        """Check an old-style role can be installed at self.path, and remove the existing one with --force"""
+        if os.path.exists(self.path):
+            if not os.path.isdir(self.path):
+                raise exceptions.GalaxyClientError("the specified roles path exists and is not a directory.")
+            elif not getattr(self.options, "force", False):
+                msg = "the specified role %s appears to already exist. Use --force to replace it." % self.content.name
+                raise exceptions.GalaxyClientError(msg)
+            else:
+                # using --force, remove the old path
+                if not self.remove():
+                    raise exceptions.GalaxyClientError("%s doesn't appear to contain a role.\n  please remove this directory manually if you really "
+                                    "want to put the role here." % self.path)
+        else:
+            os.makedirs(self.path)
+
+    def _install_from_store(self, entry, tmp_file, local_file):
+        """Install an old-style role by linking the files of its store entry, without opening the archive"""
+        self.display_callback("- linking %s %s to %s" % (self.content_type, self.content.name, self.path))
+        self._prepare_role_path()
+        store.CONTENT_STORE.materialize(entry, self.path, link_mode=self._link_mode())
+        self._write_galaxy_install_info()
+
+        self.display_callback("- %s was installed successfully" % str(self))
+        self._remove_tmp_file(tmp_file, local_file)
+        return True
+
+    def _remove_tmp_file(self, tmp_file, local_file):
+        if local_file:
+            return
+        try:
+            os.unlink(tmp_file)
+        except (OSError, IOError) as e:
+            self.warn('Unable to remove tmp file (%s): %s' % (tmp_file, str(e)))
+            self.display_callback("Unable to remove tmp file (%s): %s" % (tmp_file, str(e)), level='warning')
+
     # TODO: property of GalaxyContentMeta ?
     @property
     def spec(self):
@@ -922,54 +1033,9 @@ class GalaxyContent(object):
         """
         Archive a Galaxy Content SCM repo locally
 
-        Implementation originally adopted from the Ansible RoleRequirement
+        The repo is fetched into (or updated in) the local scm cache, see ansible_galaxy.scm
         """
-        if scm not in ['hg', 'git']:
-            raise exceptions.GalaxyClientError("- scm %s is not currently supported" % scm)
-        tempdir = tempfile.mkdtemp()
-        clone_cmd = [scm, 'clone', src, name]
-        with open('/dev/null', 'w') as devnull:
-            try:
-                popen = subprocess.Popen(clone_cmd, cwd=tempdir, stdout=devnull, stderr=devnull)
-            except Exception as e:
-                raise exceptions.GalaxyClientError("error executing: %s" % " ".join(clone_cmd))
-            rc = popen.wait()
-        if rc != 0:
-            raise exceptions.GalaxyClientError("- command %s failed in directory %s (rc=%s)" % (' '.join(clone_cmd), tempdir, rc))
-
-        if scm == 'git' and version:
-            checkout_cmd = [scm, 'checkout', version]
-            with open('/dev/null', 'w') as devnull:
-                try:
-                    popen = subprocess.Popen(checkout_cmd, cwd=os.path.join(tempdir, name), stdout=devnull, stderr=devnull)
-                except (IOError, OSError):
-                    raise exceptions.GalaxyClientError("error executing: %s" % " ".join(checkout_cmd))
-                rc = popen.wait()
-            if rc != 0:
-                raise exceptions.GalaxyClientError("- command %s failed in directory %s (rc=%s)" % (' '.join(checkout_cmd), tempdir, rc))
-
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.tar')
-        if scm == 'hg':
-            archive_cmd = ['hg', 'archive', '--prefix', "%s/" % name]
-            if version:
-                archive_cmd.extend(['-r', version])
-            archive_cmd.append(temp_file.name)
-        if scm == 'git':
-            archive_cmd = ['git', 'archive', '--prefix=%s/' % name, '--output=%s' % temp_file.name]
-            if version:
-                archive_cmd.append(version)
-            else:
-                archive_cmd.append('HEAD')
-
-        with open('/dev/null', 'w') as devnull:
-            popen = subprocess.Popen(archive_cmd, cwd=os.path.join(tempdir, name),
-                                     stderr=devnull, stdout=devnull)
-            rc = popen.wait()
-        if rc != 0:
-            raise exceptions.GalaxyClientError("- command %s failed in directory %s (rc=%s)" % (' '.join(archive_cmd), tempdir, rc))
-
-        shutil.rmtree(tempdir, ignore_errors=True)
-        return temp_file.name
+        return galaxy_scm.archive(src, scm=scm, name=name, version=version)
 
     # TODO: return a new GalaxyContentMeta
     # TODO: dont munge the passed in content
@@ -0,0 +1,259 @@
+"""Retry transient HTTP failures, and limit how many requests each host gets at once
+
+A RetryPolicy decides whether a failed request is worth trying again (server
+errors, timeouts, connection resets, rate limiting) and how long to wait first:
+exponential backoff with jitter, or what the server asked for with a
+'Retry-After' header or GitHub's 'X-RateLimit-Reset'.
+
+RetryingTransport wraps any of the transports in ansible_galaxy.flat_rest_api.transport
+with a policy, and retry_call() applies one to anything else, like archive downloads.
+Both take a slot from a HostLimiter for each request, so a large parallel
+install doesn't open more connections to one server than it will tolerate.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import contextlib
+import email.utils
+import errno
+import logging
+import random
+import socket
+import threading
+import time
+
+from six.moves import http_client
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.parse import urlparse
+
+from ansible_galaxy.config import runtime
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+# don't wait on a rate limit that resets further out than this, fail instead
+DEFAULT_MAX_RATE_LIMIT_WAIT = 120.0
+
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# errors from a request that never got a response. socket.error is any OSError on py3,
+# so those are only transient with one of the NETWORK_ERRNOS, see is_transient()
+TRANSIENT_ERRORS = (socket.timeout, socket.error, URLError, http_client.HTTPException)
+
+NETWORK_ERRNOS = frozenset([errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED, errno.ETIMEDOUT,
+                            errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EPIPE])
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _parse_retry_after(value, now):
+    """Seconds to wait for a Retry-After header value, either seconds or an HTTP date"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - now)
+
+
+def is_transient(error):
+    """True for a network failure worth retrying, False for others like a full disk (ENOSPC) while writing a download"""
+    if isinstance(error, (socket.timeout, URLError, http_client.HTTPException)):
+        return True
+    return isinstance(error, socket.error) and error.errno in NETWORK_ERRNOS
+
+
+def is_rate_limited(status, headers):
+    """True for a 429, or for the 403 GitHub sends when out of requests, or for a request made too soon"""
+    if status == 429:
+        return True
+    return status == 403 and (_header(headers, 'x-ratelimit-remaining') == '0' or _header(headers, 'retry-after') is not None)
+
+
+class RetryPolicy(object):
+    """How many times, and how long apart, to retry failed requests
+
+    :param retries: how many times to retry a request after the first try, 0 to never retry
+    """
+
+    def __init__(self, retries=None, backoff=None, max_backoff=None, max_rate_limit_wait=None, jitter=True):
+        self.retries = runtime.GALAXY_RETRIES if retries is None else retries
+        self.backoff = DEFAULT_BACKOFF if backoff is None else backoff
+        self.max_backoff = DEFAULT_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.max_rate_limit_wait = DEFAULT_MAX_RATE_LIMIT_WAIT if max_rate_limit_wait is None else max_rate_limit_wait
+        self.jitter = jitter
+
+    def should_retry_status(self, status, headers=None):
+        return status in RETRY_STATUS_CODES or is_rate_limited(status, headers)
+
+    def delay(self, attempt, status=None, headers=None):
+        """Seconds to wait before retry number attempt (starting at 1), or None to give up"""
+        if attempt > self.retries:
+            return None
+
+        now = time.time()
+        requested = _parse_retry_after(_header(headers, 'retry-after'), now)
+        if requested is None and is_rate_limited(status, headers):
+            reset = _header(headers, 'x-ratelimit-reset')
+            try:
+                requested = max(0.0, float(reset) - now) if reset is not None else None
+            except ValueError:
+                requested = None
+
+        if requested is not None:
+            if requested > self.max_rate_limit_wait:
+                log.warning('server asked to wait %ds before retrying, more than the %ds limit', requested, self.max_rate_limit_wait)
+                return None
+            return requested
+
+        # exponential backoff, with jitter so parallel requests don't all retry at the same moment
+        backoff = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            backoff = random.uniform(backoff / 2, backoff)
+        return backoff
+
+
+class HostLimiter(object):
+    """Allow at most limit requests in flight to each host"""
+
+    def __init__(self, limit=None):
+        self.limit = runtime.GALAXY_HOST_CONCURRENCY if limit is None else limit
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            semaphore = self._semaphores.get(host, None)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return semaphore
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        if not self.limit:
+            yield
+            return
+
+        semaphore = self._semaphore(urlparse(url).netloc)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+HOST_LIMITER = HostLimiter()
+
+
+def retry_call(func, url, policy=None, host_limiter=None):
+    """Call func() until it succeeds, or until policy gives up on the error it raises
+
+    An HTTPError is retried if its status is, other errors if is_transient() says so.
+    """
+    policy = policy or RetryPolicy()
+    host_limiter = host_limiter or HOST_LIMITER
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with host_limiter.slot(url):
+                return func()
+        except HTTPError as e:
+            if not policy.should_retry_status(e.code, e.info()):
+                raise
+            delay = policy.delay(attempt, e.code, e.info())
+            if delay is None:
+                raise
+            log.info('%s failed with HTTP %s, retrying in %.1fs', url, e.code, delay)
+        except TRANSIENT_ERRORS as e:
+            if not is_transient(e):
+                raise
+            delay = policy.delay(attempt)
+            if delay is None:
+                raise
+            log.info('%s failed (%s), retrying in %.1fs', url, e, delay)
+        time.sleep(delay)
+
+
+class RetryingTransport(object):
+    """Retry the requests of another transport that fail with a transient error
+
+    Only GET requests are retried, a POST or DELETE may have been acted on
+    before it failed.
+    """
+
+    def __init__(self, transport, policy=None, host_limiter=None):
+        self.transport = transport
+        self.policy = policy or RetryPolicy()
+        self.host_limiter = host_limiter or HOST_LIMITER
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def _retry(self, url, response, attempt):
+        """Sleep and return True if response (None for an error) should be retried"""
+        if response is None:
+            delay = self.policy.delay(attempt)
+        elif self.policy.should_retry_status(response.status, response.headers):
+            delay = self.policy.delay(attempt, response.status, response.headers)
+        else:
+            return False
+
+        if delay is None:
+            return False
+        self.log.info('GET %s failed (%s), retrying in %.1fs', url, response.status if response else 'no response', delay)
+        time.sleep(delay)
+        return True
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None):
+        if data is not None or (method or 'GET').upper() not in ('GET', 'HEAD'):
+            with self.host_limiter.slot(url):
+                return self.transport.request(url, data=data, headers=headers, method=method, timeout=timeout)
+
+        return self._get(url, headers=headers, method=method, timeout=timeout)
+
+    def _get(self, url, headers=None, method=None, timeout=None, response=None):
+        """GET url until it succeeds or the policy gives up, starting from response if it was already tried"""
+        attempt = 0
+        while True:
+            if response is None:
+                try:
+                    with self.host_limiter.slot(url):
+                        response = self.transport.request(url, headers=headers, method=method, timeout=timeout)
+                except TRANSIENT_ERRORS as e:
+                    if not is_transient(e):
+                        raise
+                    attempt += 1
+                    if not self._retry(url, None, attempt):
+                        raise
+                    continue
+            attempt += 1
+            if not self._retry(url, response, attempt):
+                return response
+            response = None
+
+    def get_many(self, request_urls, headers=None, timeout=None):
+        """GET each url, retrying the ones that failed one at a time"""
+        try:
+            responses = self.transport.get_many(request_urls, headers=headers, timeout=timeout)
+        except TRANSIENT_ERRORS as e:
+            if not is_transient(e):
+                raise
+            self.log.debug('get_many of %d urls failed (%s), requesting them one at a time', len(request_urls), e)
+            return [self.request(url, headers=headers, timeout=timeout) for url in request_urls]
+
+        return [self._get(url, headers=headers, timeout=timeout, response=response) for url, response in zip(request_urls, responses)]
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,112 @@
+"""Remember the api version of galaxy servers, for the process and across runs
+
+GalaxyAPI needs the server's current api version to build its urls, and asks
+the server for it ('GET /api/') before its first request. The version is kept
+here per server, in memory and in a yaml file, so most runs never have to ask.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import yaml
+
+from ansible_galaxy.config import defaults
+from ansible_galaxy.config import runtime
+
+log = logging.getLogger(__name__)
+
+
+class ServerVersionCache(object):
+    """Map galaxy server urls to their api version
+
+    :param path: the yaml file the versions are persisted in
+    :param ttl: seconds a version read from the file is trusted for. 0 disables
+        the file, the versions are then only remembered for the process.
+        Defaults to runtime.GALAXY_SERVER_VERSION_TTL, as it is when the cache is used.
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = os.path.expanduser(path or defaults.DEFAULT_SERVER_VERSION_CACHE_PATH)
+        self._ttl = ttl
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+        self._lock = threading.Lock()
+        # server -> {'version': version, 'checked': time of the probe}
+        self._versions = None
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            return runtime.GALAXY_SERVER_VERSION_TTL
+        return self._ttl
+
+    def _load(self):
+        if self._versions is not None:
+            return self._versions
+
+        self._versions = {}
+        if not self.ttl or not os.path.isfile(self.path):
+            return self._versions
+
+        try:
+            with open(self.path, 'r') as f:
+                data = yaml.safe_load(f)
+        except (IOError, OSError, yaml.YAMLError) as e:
+            self.log.warning('Ignoring unreadable server version cache %s: %s', self.path, e)
+            return self._versions
+
+        if isinstance(data, dict):
+            self._versions.update((server, info) for server, info in data.items()
+                                  if isinstance(info, dict) and 'version' in info and 'checked' in info)
+        return self._versions
+
+    def get(self, server):
+        """The cached api version of server, or None if it is unknown or too old"""
+        with self._lock:
+            info = self._load().get(server, None)
+        if info is None:
+            return None
+
+        if self.ttl and info['checked'] + self.ttl < time.time():
+            self.log.debug('cached api version of %s is older than %ss', server, self.ttl)
+            return None
+        return info['version']
+
+    def set(self, server, version):
+        with self._lock:
+            versions = self._load()
+            versions[server] = {'version': version, 'checked': time.time()}
+            if self.ttl:
+                self._save(versions)
+
+    def _save(self, versions):
+        cache_dir = os.path.dirname(self.path)
+        tmp_path = None
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            # write a temp file and rename it into place, so concurrent runs never read half a file
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                yaml.safe_dump(versions, f, default_flow_style=False)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            # only an optimization, the server is asked again next time
+            self.log.warning('Unable to save server version cache %s: %s', self.path, e)
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def clear(self):
+        with self._lock:
+            self._versions = {}
+            if os.path.isfile(self.path):
+                os.unlink(self.path)
+
+
+SERVER_VERSION_CACHE = ServerVersionCache()
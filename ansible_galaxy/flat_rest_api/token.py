@@ -37,9 +37,19 @@ class GalaxyToken(object):
         self.file = os.path.expanduser("~") + '/.ansible_galaxy'
         self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
 
-        self.config = yaml.safe_load(self.__open_config_for_read())
-        if not self.config:
-            self.config = {}
+        self._mtime = None
+        self._load()
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.file)
+        except OSError:
+            return None
+
+    def _load(self):
+        with self.__open_config_for_read() as f:
+            self.config = yaml.safe_load(f) or {}
+        self._mtime = self._file_mtime()
 
     def __open_config_for_read(self):
         if os.path.isfile(self.file):
@@ -57,8 +67,12 @@ class GalaxyToken(object):
         self.save()
 
     def get(self):
+        # a long lived process (the daemon) picks up a token saved by another 'login'
+        if self._file_mtime() != self._mtime:
+            self._load()
         return self.config.get('token', None)
 
     def save(self):
         with open(self.file, 'w') as f:
             yaml.safe_dump(self.config, f, default_flow_style=False)
+        self._mtime = self._file_mtime()
@@ -0,0 +1,451 @@
+"""HTTP transports for the galaxy API client
+
+A transport makes the HTTP requests for GalaxyAPI. All of them return a
+TransportResponse for any HTTP status, and provide get_many() to fetch
+several urls at once.
+
+- UrllibTransport makes each request with a new urls.open_url() call, one at
+  a time. It is the default, and the fallback used for anything the other
+  transports can not handle (proxies, for example).
+- PipelinedTransport keeps HTTP/1.1 connections open between requests, and
+  get_many() sends several requests down each connection before reading the
+  responses (pipelining), spread across a few connections per host.
+- Http2Transport multiplexes requests as HTTP/2 streams over one connection.
+  It needs the optional 'httpx' and 'h2' python modules.
+
+All of them ask for gzip or deflate compressed responses, and return the
+decompressed body.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import socket
+import threading
+import zlib
+
+from multiprocessing.pool import ThreadPool
+
+from six.moves import http_client
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import urljoin, urlparse
+from six.moves.urllib.request import getproxies, proxy_bypass
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.flat_rest_api import urls
+from ansible_galaxy.utils.text import to_bytes
+
+try:
+    import httpx
+    import h2  # noqa: F401, httpx needs it for http2=True
+    HAS_HTTPX_HTTP2 = True
+except ImportError:
+    HAS_HTTPX_HTTP2 = False
+
+log = logging.getLogger(__name__)
+
+TRANSPORTS = ('urllib', 'pipelined', 'http2')
+
+DEFAULT_TIMEOUT = 20
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_PIPELINE_DEPTH = 8
+MAX_REDIRECTS = 10
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class TransportResponse(object):
+    """A complete, already read, HTTP response"""
+
+    def __init__(self, status, headers, body, url):
+        self.status = status
+        # a dict with lower case header names
+        self.headers = headers
+        self.body = body
+        # the url of the response, after any redirects
+        self.url = url
+
+    def __repr__(self):
+        return '%s(%s, %s, %d bytes)' % (self.__class__.__name__, self.status, self.url, len(self.body or b''))
+
+
+def _lower_headers(headers):
+    return dict((k.lower(), v) for k, v in headers.items())
+
+
+def _accept_encoding(headers):
+    """Ask for a compressed response, unless the caller asked for something else"""
+    request_headers = dict(headers or {})
+    if not any(k.lower() == 'accept-encoding' for k in request_headers):
+        request_headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return request_headers
+
+
+def decode_body(headers, body):
+    """Decompress a gzip or deflate response body
+
+    :param headers: dict of lower case response headers. 'content-encoding' is removed if the body is decoded.
+    """
+    encoding = headers.get('content-encoding', '').strip().lower()
+    if not body or encoding not in ('gzip', 'x-gzip', 'deflate'):
+        return body
+
+    if encoding == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            # some servers send a raw deflate stream, without the zlib header
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    else:
+        body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body)
+
+    del headers['content-encoding']
+    return body
+
+
+class UrllibTransport(object):
+    """Make each request with urls.open_url()"""
+
+    def __init__(self, validate_certs=True):
+        self.validate_certs = validate_certs
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None):
+        try:
+            resp = urls.open_url(url, data=data, validate_certs=self.validate_certs, headers=_accept_encoding(headers), method=method,
+                                 timeout=timeout or DEFAULT_TIMEOUT)
+        except HTTPError as e:
+            response_headers = _lower_headers(e.info() or {})
+            return TransportResponse(e.code, response_headers, decode_body(response_headers, e.read()), url)
+        response_headers = _lower_headers(resp.info())
+        return TransportResponse(resp.getcode(), response_headers, decode_body(response_headers, resp.read()), resp.geturl())
+
+    def get_many(self, request_urls, headers=None, timeout=None):
+        """GET each url
+
+        :returns: a list of TransportResponse, in the same order as request_urls
+        """
+        return [self.request(url, headers=headers, timeout=timeout) for url in request_urls]
+
+    def close(self):
+        pass
+
+
+class _NoCloseFile(object):
+    """A file that HTTPResponse can not close, so pipelined responses can share one buffered reader"""
+
+    def __init__(self, fp):
+        self._fp = fp
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def close(self):
+        pass
+
+
+class _SharedFileSocket(object):
+    """Hands the same buffered reader to every HTTPResponse read from a pipelined connection"""
+
+    def __init__(self, fp):
+        self._fp = _NoCloseFile(fp)
+
+    def makefile(self, *args, **kwargs):
+        return self._fp
+
+
+class PipelinedTransport(object):
+    """Keep-alive HTTP/1.1 connections, with pipelined get_many()
+
+    Idle connections are kept per (scheme, host, port) for reuse. get_many()
+    splits the urls for a host across up to max_connections connections and
+    pipelines up to pipeline_depth requests at a time on each. Hosts that do
+    not handle pipelining are remembered and get one request at a time.
+    """
+
+    def __init__(self, validate_certs=True, max_connections=None, pipeline_depth=None):
+        self.validate_certs = validate_certs
+        self.max_connections = max_connections or DEFAULT_MAX_CONNECTIONS
+        self.pipeline_depth = pipeline_depth or DEFAULT_PIPELINE_DEPTH
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+        self._fallback = UrllibTransport(validate_certs=validate_certs)
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._no_pipelining = set()
+
+        # counters, mostly for debugging and tests
+        self.connections_opened = 0
+
+    def _origin(self, url):
+        parsed = urlparse(url)
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        return parsed.scheme, parsed.hostname, port
+
+    def _can_handle(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or '@' in parsed.netloc:
+            return False
+        # open_url() knows how to use proxies, this does not
+        if getproxies().get(parsed.scheme) and not proxy_bypass(parsed.hostname):
+            return False
+        return True
+
+    def _connect(self, origin, timeout):
+        scheme, host, port = origin
+        if scheme == 'https':
+            conn = http_client.HTTPSConnection(host, port, timeout=timeout,
+                                               context=urls.get_ssl_context(self.validate_certs))
+        else:
+            conn = http_client.HTTPConnection(host, port, timeout=timeout)
+        self.connections_opened += 1
+        self.log.debug('opening connection %s to %s://%s:%s', self.connections_opened, scheme, host, port)
+        return conn
+
+    def _checkout(self, origin, timeout):
+        with self._lock:
+            idle = self._idle.get(origin)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._connect(origin, timeout), False
+
+    def _checkin(self, origin, conn):
+        with self._lock:
+            self._idle.setdefault(origin, []).append(conn)
+
+    def _request_headers(self, headers):
+        request_headers = {'Accept': 'application/json'}
+        request_headers.update(headers or {})
+        return _accept_encoding(request_headers)
+
+    def _request_once(self, url, data, headers, method, timeout):
+        origin = self._origin(url)
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path = '%s?%s' % (path, parsed.query)
+        method = method or ('POST' if data is not None else 'GET')
+        body = to_bytes(data, nonstring='passthru')
+
+        request_headers = self._request_headers(headers)
+        if body is not None and 'Content-Type' not in request_headers:
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        conn, reused = self._checkout(origin, timeout)
+        try:
+            conn.request(method, path, body=body, headers=request_headers)
+            resp = conn.getresponse()
+            response_body = resp.read()
+        except (http_client.HTTPException, socket.error) as e:
+            conn.close()
+            if reused and method in ('GET', 'HEAD'):
+                # the server closed an idle keep-alive connection, try again on a new one
+                self.log.debug('reused connection to %s failed (%s), retrying', origin, e)
+                return self._request_once(url, data, headers, method, timeout)
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(origin, conn)
+
+        response_headers = _lower_headers(dict(resp.getheaders()))
+        return TransportResponse(resp.status, response_headers, decode_body(response_headers, response_body), url)
+
+    def _follow_redirects(self, response, method, headers, timeout):
+        redirects = 0
+        while response.status in REDIRECT_CODES and method in (None, 'GET', 'HEAD') and redirects < MAX_REDIRECTS:
+            location = response.headers.get('location')
+            if not location:
+                break
+            redirects += 1
+            new_url = urljoin(response.url, location)
+            self.log.debug('redirected to %s', new_url)
+            response = self.request(new_url, headers=headers, method=method, timeout=timeout, follow_redirects=False)
+        return response
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None, follow_redirects=True):
+        if not self._can_handle(url):
+            return self._fallback.request(url, data=data, headers=headers, method=method, timeout=timeout)
+
+        response = self._request_once(url, data, headers, method, timeout or DEFAULT_TIMEOUT)
+        if follow_redirects:
+            response = self._follow_redirects(response, method, headers, timeout)
+        return response
+
+    def _pipeline(self, origin, request_urls, headers, timeout):
+        """Send all of request_urls on one connection, then read the responses in order
+
+        :returns: a list of TransportResponse for as many requests as were answered
+        """
+        conn, reused = self._checkout(origin, timeout)
+        responses = self._pipeline_on(conn, origin, request_urls, headers)
+        if not responses and reused:
+            # the server may have closed the idle connection, try a new one
+            responses = self._pipeline_on(self._connect(origin, timeout), origin, request_urls, headers)
+        return responses
+
+    def _pipeline_on(self, conn, origin, request_urls, headers):
+        responses = []
+        try:
+            if conn.sock is None:
+                conn.connect()
+            request_headers = self._request_headers(headers)
+            request_headers['Host'] = conn.host if conn.port in (80, 443) else '%s:%s' % (conn.host, conn.port)
+
+            requests = []
+            for url in request_urls:
+                parsed = urlparse(url)
+                path = parsed.path or '/'
+                if parsed.query:
+                    path = '%s?%s' % (path, parsed.query)
+                lines = ['GET %s HTTP/1.1' % path] + ['%s: %s' % (k, v) for k, v in request_headers.items()]
+                requests.append(to_bytes('\r\n'.join(lines) + '\r\n\r\n'))
+            conn.sock.sendall(b''.join(requests))
+
+            shared = _SharedFileSocket(conn.sock.makefile('rb'))
+            will_close = False
+            for url in request_urls:
+                resp = http_client.HTTPResponse(shared, method='GET')
+                resp.begin()
+                response_headers = _lower_headers(dict(resp.getheaders()))
+                responses.append(TransportResponse(resp.status, response_headers, decode_body(response_headers, resp.read()), url))
+                if resp.will_close:
+                    will_close = True
+                    break
+        except (http_client.HTTPException, socket.error) as e:
+            self.log.debug('pipelined requests to %s failed after %d responses: %s', origin, len(responses), e)
+            conn.close()
+            return responses
+
+        # the http_client connection did not see these requests, so it is only
+        # reused if the server will keep it open
+        if will_close:
+            conn.close()
+        else:
+            self._checkin(origin, conn)
+        return responses
+
+    def _get_batch(self, origin, request_urls, headers, timeout):
+        responses = []
+        pending = list(request_urls)
+        while pending:
+            if origin in self._no_pipelining:
+                responses.extend(self.request(url, headers=headers, timeout=timeout, follow_redirects=False) for url in pending)
+                break
+
+            batch = pending[:self.pipeline_depth]
+            answered = self._pipeline(origin, batch, headers, timeout)
+            if not answered:
+                self.log.debug('%s does not handle pipelined requests', origin)
+                self._no_pipelining.add(origin)
+                continue
+            responses.extend(answered)
+            pending = pending[len(answered):]
+        return responses
+
+    def get_many(self, request_urls, headers=None, timeout=None):
+        """GET each url, overlapping the requests
+
+        :returns: a list of TransportResponse, in the same order as request_urls
+        """
+        timeout = timeout or DEFAULT_TIMEOUT
+        results = [None] * len(request_urls)
+
+        # (origin, [(index, url), ...]) for each connection to use
+        batches = []
+        by_origin = {}
+        for index, url in enumerate(request_urls):
+            if not self._can_handle(url):
+                results[index] = self._fallback.request(url, headers=headers, timeout=timeout)
+                continue
+            by_origin.setdefault(self._origin(url), []).append((index, url))
+
+        for origin, items in by_origin.items():
+            connections = min(self.max_connections, len(items))
+            for i in range(connections):
+                batches.append((origin, items[i::connections]))
+
+        def _run(batch):
+            origin, items = batch
+            return items, self._get_batch(origin, [url for index, url in items], headers, timeout)
+
+        if len(batches) == 1:
+            batch_results = [_run(batches[0])]
+        elif batches:
+            pool = ThreadPool(len(batches))
+            try:
+                batch_results = pool.map(_run, batches)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            batch_results = []
+
+        for items, responses in batch_results:
+            for (index, url), response in zip(items, responses):
+                results[index] = self._follow_redirects(response, 'GET', headers, timeout)
+        return results
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class Http2Transport(object):
+    """HTTP/2 requests with httpx, get_many() multiplexes them over one connection per host"""
+
+    def __init__(self, validate_certs=True, max_streams=None):
+        if not HAS_HTTPX_HTTP2:
+            raise exceptions.GalaxyClientError("The http2 transport needs the 'httpx' and 'h2' python modules. "
+                                               "Install them with 'pip install httpx[http2]'")
+        self.validate_certs = validate_certs
+        self.max_streams = max_streams or DEFAULT_PIPELINE_DEPTH
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self._client = httpx.Client(http2=True, verify=urls.get_ssl_context(validate_certs) or validate_certs,
+                                    follow_redirects=True, timeout=DEFAULT_TIMEOUT)
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None):
+        method = method or ('POST' if data is not None else 'GET')
+        request_headers = dict(headers or {})
+        if data is not None and 'Content-Type' not in request_headers:
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        resp = self._client.request(method, url, content=to_bytes(data, nonstring='passthru'), headers=request_headers,
+                                    timeout=timeout or DEFAULT_TIMEOUT)
+        self.log.debug('%s %s %s %s', resp.http_version, method, url, resp.status_code)
+        return TransportResponse(resp.status_code, _lower_headers(resp.headers), resp.content, str(resp.url))
+
+    def get_many(self, request_urls, headers=None, timeout=None):
+        if len(request_urls) < 2:
+            return [self.request(url, headers=headers, timeout=timeout) for url in request_urls]
+
+        pool = ThreadPool(min(self.max_streams, len(request_urls)))
+        try:
+            return pool.map(lambda url: self.request(url, headers=headers, timeout=timeout), request_urls)
+        finally:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        self._client.close()
+
+
+def get_transport(name=None, validate_certs=True):
+    """Create the transport named name, one of TRANSPORTS"""
+    if name in (None, 'urllib'):
+        return UrllibTransport(validate_certs=validate_certs)
+    if name == 'pipelined':
+        return PipelinedTransport(validate_certs=validate_certs)
+    if name == 'http2':
+        return Http2Transport(validate_certs=validate_certs)
+    raise exceptions.GalaxyClientError("Unknown transport %s, expected one of: %s" % (name, ', '.join(TRANSPORTS)))
@@ -32,7 +32,9 @@ for users making use of a module. If possible, avoid third party libraries by us
 this code instead.
 '''
 
+import atexit
 import base64
+import logging
 import netrc
 import os
 import platform
@@ -40,6 +42,7 @@ import re
 import socket
 import sys
 import tempfile
+import threading
 import traceback
 
 try:
@@ -56,6 +59,8 @@ import six.moves.urllib.error as urllib_error
 # from ansible.module_utils.basic import get_distribution
 from ansible_galaxy.utils.text import to_bytes, to_native, to_text
 
+log = logging.getLogger(__name__)
+
 try:
     # python3
     import urllib.request as urllib_request
@@ -105,6 +110,9 @@ except ImportError:
     except ImportError:
         pass
 
+# TLS session resumption needs python3.6's SSLSocket.session
+HAS_TLS_SESSION = HAS_SSLCONTEXT and hasattr(ssl.SSLSocket, 'session')
+
 # Select a protocol that includes all secure tls protocols
 # Exclude insecure ssl protocols if possible
 
@@ -133,8 +141,6 @@ if not HAS_SSLCONTEXT and HAS_SSL:
         del libssl
 
 
-LOADED_VERIFY_LOCATIONS = set()
-
 HAS_MATCH_HOSTNAME = True
 try:
     from ssl import match_hostname, CertificateError
@@ -300,13 +306,16 @@ if hasattr(httplib, 'HTTPSConnection') and hasattr(urllib_request, 'HTTPSHandler
     class CustomHTTPSConnection(httplib.HTTPSConnection):
         def __init__(self, *args, **kwargs):
             httplib.HTTPSConnection.__init__(self, *args, **kwargs)
-            self.context = None
-            if HAS_SSLCONTEXT:
-                self.context = create_default_context()
-            elif HAS_URLLIB3_PYOPENSSLCONTEXT:
-                self.context = PyOpenSSLContext(PROTOCOL)
-            if self.context and self.cert_file:
-                self.context.load_cert_chain(self.cert_file, self.key_file)
+            # a context passed in (see CustomHTTPSHandler) is shared with other
+            # connections, so it is used as is
+            self.context = kwargs.get('context', None)
+            if self.context is None:
+                if HAS_SSLCONTEXT:
+                    self.context = create_default_context()
+                elif HAS_URLLIB3_PYOPENSSLCONTEXT:
+                    self.context = PyOpenSSLContext(PROTOCOL)
+                if self.context and self.cert_file:
+                    self.context.load_cert_chain(self.cert_file, self.key_file)
 
         def connect(self):
             "Connect to a host on a given (SSL) port."
@@ -324,7 +333,14 @@ if hasattr(httplib, 'HTTPSConnection') and hasattr(urllib_request, 'HTTPSHandler
                 self._tunnel()
                 server_hostname = self._tunnel_host
 
-            if HAS_SSLCONTEXT or HAS_URLLIB3_PYOPENSSLCONTEXT:
+            if HAS_SSLCONTEXT and HAS_TLS_SESSION:
+                port = self._tunnel_port if self._tunnel_host else self.port
+                self._session_key = (server_hostname, port)
+                session = TLS_SESSION_CACHE.get(self.context, self._session_key)
+                self.sock = self.context.wrap_socket(sock, server_hostname=server_hostname, session=session)
+                if session is not None:
+                    log.debug('TLS session to %s:%s resumed: %s', server_hostname, port, self.sock.session_reused)
+            elif HAS_SSLCONTEXT or HAS_URLLIB3_PYOPENSSLCONTEXT:
                 self.sock = self.context.wrap_socket(sock, server_hostname=server_hostname)
             elif HAS_URLLIB3_SSL_WRAP_SOCKET:
                 self.sock = ssl_wrap_socket(sock, keyfile=self.key_file, cert_reqs=ssl.CERT_NONE, certfile=self.cert_file, ssl_version=PROTOCOL,
@@ -332,10 +348,34 @@ if hasattr(httplib, 'HTTPSConnection') and hasattr(urllib_request, 'HTTPSHandler
             else:
                 self.sock = ssl.wrap_socket(sock, keyfile=self.key_file, certfile=self.cert_file, ssl_version=PROTOCOL)
 
+        def getresponse(self, *args, **kwargs):
+            # TLS 1.3 servers send session tickets after the handshake, so the
+            # session is saved for reuse once the response has been read from the socket
+            sock = self.sock
+            response = httplib.HTTPSConnection.getresponse(self, *args, **kwargs)
+            if HAS_TLS_SESSION and getattr(self, '_session_key', None) and sock is not None:
+                TLS_SESSION_CACHE.put(self.context, self._session_key, sock.session)
+            return response
+
     class CustomHTTPSHandler(urllib_request.HTTPSHandler):
 
+        def __init__(self, context=None, **kwargs):
+            urllib_request.HTTPSHandler.__init__(self, **kwargs)
+            self._custom_context = context
+
         def https_open(self, req):
-            return self.do_open(CustomHTTPSConnection, req)
+            if self._custom_context is None:
+                return self.do_open(CustomHTTPSConnection, req)
+
+            try:
+                return self.do_open(CustomHTTPSConnection, req, context=self._custom_context)
+            except urllib_error.URLError as e:
+                # the certificate is verified as part of the real connection's
+                # handshake, report failures the same way SSLValidationHandler does
+                if self._custom_context.verify_mode != ssl.CERT_NONE and isinstance(e.reason, (ssl.SSLError, CertificateError)):
+                    parsed = generic_urlparse(urlparse(req.get_full_url()))
+                    build_ssl_validation_error(parsed.hostname, parsed.port or 443, get_ca_cert_paths(), e.reason)
+                raise
 
         https_request = AbstractHTTPHandler.do_request_
 
@@ -477,7 +517,9 @@ def RedirectHandlerFactory(follow_redirects=None, validate_certs=True):
         def redirect_request(self, req, fp, code, msg, hdrs, newurl):
             handler = maybe_add_ssl_handler(newurl, validate_certs)
             if handler:
-                urllib_request._opener.add_handler(handler)
+                # add to the opener handling this request rather than the
+                # module global one, open_url() no longer installs its opener
+                self.parent.add_handler(handler)
 
             if follow_redirects == 'urllib2':
                 return urllib_request.HTTPRedirectHandler.redirect_request(self, req, fp, code, msg, hdrs, newurl)
@@ -545,6 +587,202 @@ def build_ssl_validation_error(hostname, port, paths, exc=None):
     raise SSLValidationError(' '.join(msg) % (hostname, port, ", ".join(paths)))
 
 
+def get_ca_cert_paths():
+    """The directories searched for .crt/.pem CA cert files on this platform"""
+    paths = ['/etc/ssl/certs']
+
+    system = to_text(platform.system(), errors='surrogate_or_strict')
+    if system == u'Linux':
+        paths.append('/etc/pki/ca-trust/extracted/pem')
+        paths.append('/etc/pki/tls/certs')
+        paths.append('/usr/share/ca-certificates/cacert.org')
+    elif system == u'FreeBSD':
+        paths.append('/usr/local/share/certs')
+    elif system == u'OpenBSD':
+        paths.append('/etc/ssl')
+    elif system == u'NetBSD':
+        paths.append('/etc/openssl/certs')
+    elif system == u'SunOS':
+        paths.append('/opt/local/etc/openssl/certs')
+    elif system == u'Darwin':
+        # Default Homebrew path for OpenSSL certs
+        paths.append('/usr/local/etc/openssl')
+
+    # fall back to a user-deployed cert in a standard
+    # location if the OS platform one is not available
+    paths.append('/etc/ansible')
+    return paths
+
+
+class CACertStore(object):
+    """The CA certs from get_ca_cert_paths(), found and loaded once per process
+
+    The SSL context (and, for old pythons that need it, the bundle file) is
+    built on first use and kept until the mtime of one of the cert directories
+    changes, which happens when a cert file is added to or removed from it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        # (client_cert, client_key) -> context
+        self._contexts = {}
+        self._bundle_path = None
+
+    def _current_key(self):
+        key = []
+        for path in get_ca_cert_paths():
+            try:
+                key.append((path, os.stat(path).st_mtime))
+            except OSError:
+                pass
+        return tuple(key)
+
+    def _cert_files(self):
+        for path in get_ca_cert_paths():
+            if not os.path.isdir(path):
+                continue
+            for f in sorted(os.listdir(path)):
+                full_path = os.path.join(path, f)
+                if os.path.isfile(full_path) and os.path.splitext(f)[1] in ('.crt', '.pem'):
+                    yield full_path
+
+    def _check_key(self):
+        key = self._current_key()
+        if key != self._key:
+            self._key = key
+            self._contexts = {}
+            if self._bundle_path:
+                try:
+                    os.remove(self._bundle_path)
+                except OSError:
+                    pass
+                self._bundle_path = None
+
+    def context(self, client_cert=None, client_key=None):
+        """A validating SSL context that trusts the default and the platform CA certs
+
+        :returns: the shared context, or None if this python can not create one
+        """
+        with self._lock:
+            self._check_key()
+            context = self._contexts.get((client_cert, client_key))
+            if context is None:
+                if HAS_SSLCONTEXT:
+                    context = create_default_context()
+                elif HAS_URLLIB3_PYOPENSSLCONTEXT:
+                    context = PyOpenSSLContext(PROTOCOL)
+                else:
+                    return None
+
+                for cert_path in self._cert_files():
+                    try:
+                        context.load_verify_locations(cert_path)
+                    except Exception:
+                        # not a cert (or not one openssl can load), skip it
+                        pass
+                if client_cert:
+                    context.load_cert_chain(client_cert, client_key)
+                self._contexts[(client_cert, client_key)] = context
+            return context
+
+    def bundle_path(self):
+        """The path of a file with all of the platform CA certs, for pythons without SSL contexts"""
+        with self._lock:
+            self._check_key()
+            if self._bundle_path is None:
+                tmp_fd, tmp_path = tempfile.mkstemp()
+                # Write the dummy ca cert if we are running on Mac OS X
+                if platform.system() == 'Darwin':
+                    os.write(tmp_fd, b_DUMMY_CA_CERT)
+                for cert_path in self._cert_files():
+                    try:
+                        with open(cert_path, 'rb') as cert_file:
+                            os.write(tmp_fd, cert_file.read())
+                        os.write(tmp_fd, b'\n')
+                    except (OSError, IOError):
+                        pass
+                os.close(tmp_fd)
+                self._bundle_path = tmp_path
+            return self._bundle_path
+
+    def cleanup(self):
+        if self._bundle_path:
+            try:
+                os.remove(self._bundle_path)
+            except OSError:
+                pass
+            self._bundle_path = None
+
+
+CA_CERT_STORE = CACertStore()
+atexit.register(CA_CERT_STORE.cleanup)
+
+_unverified_contexts = {}
+_unverified_contexts_lock = threading.Lock()
+
+
+def get_ssl_context(validate_certs=True, client_cert=None, client_key=None):
+    """The SSL context shared by every connection with these settings
+
+    Sharing the context lets connections to the same server resume TLS
+    sessions (see TLSSessionCache) instead of doing a full handshake each time.
+
+    :returns: an SSLContext, or None if this python does not have them
+    """
+    if not HAS_SSLCONTEXT:
+        return None
+
+    if validate_certs:
+        return CA_CERT_STORE.context(client_cert=client_cert, client_key=client_key)
+
+    with _unverified_contexts_lock:
+        context = _unverified_contexts.get((client_cert, client_key))
+        if context is None:
+            # In 2.7.9, the default context validates certificates
+            context = SSLContext(ssl.PROTOCOL_SSLv23)
+            context.options |= ssl.OP_NO_SSLv2
+            context.options |= ssl.OP_NO_SSLv3
+            context.verify_mode = ssl.CERT_NONE
+            context.check_hostname = False
+            if client_cert:
+                context.load_cert_chain(client_cert, client_key)
+            _unverified_contexts[(client_cert, client_key)] = context
+        return context
+
+
+class TLSSessionCache(object):
+    """The most recent TLS session for each (SSL context, host, port)
+
+    A session can only be resumed with the context that created it, so the
+    context is stored with the session and checked on the way out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, context, key):
+        with self._lock:
+            entry = self._sessions.get((id(context), key))
+        if entry and entry[0] is context:
+            return entry[1]
+        return None
+
+    def put(self, context, key, session):
+        if session is None:
+            return
+        with self._lock:
+            self._sessions[(id(context), key)] = (context, session)
+
+    def clear(self):
+        with self._lock:
+            self._sessions = {}
+
+
+TLS_SESSION_CACHE = TLSSessionCache()
+
+
 class SSLValidationHandler(urllib_request.BaseHandler):
     '''
     A custom handler class for SSL validation.
@@ -560,73 +798,8 @@ class SSLValidationHandler(urllib_request.BaseHandler):
         self.port = port
 
     def get_ca_certs(self):
-        # tries to find a valid CA cert in one of the
-        # standard locations for the current distribution
-
-        ca_certs = []
-        paths_checked = []
-
-        system = to_text(platform.system(), errors='surrogate_or_strict')
-        # build a list of paths to check for .crt/.pem files
-        # based on the platform type
-        paths_checked.append('/etc/ssl/certs')
-        if system == u'Linux':
-            paths_checked.append('/etc/pki/ca-trust/extracted/pem')
-            paths_checked.append('/etc/pki/tls/certs')
-            paths_checked.append('/usr/share/ca-certificates/cacert.org')
-        elif system == u'FreeBSD':
-            paths_checked.append('/usr/local/share/certs')
-        elif system == u'OpenBSD':
-            paths_checked.append('/etc/ssl')
-        elif system == u'NetBSD':
-            ca_certs.append('/etc/openssl/certs')
-        elif system == u'SunOS':
-            paths_checked.append('/opt/local/etc/openssl/certs')
-
-        # fall back to a user-deployed cert in a standard
-        # location if the OS platform one is not available
-        paths_checked.append('/etc/ansible')
-
-        tmp_fd, tmp_path = tempfile.mkstemp()
-        to_add_fd, to_add_path = tempfile.mkstemp()
-        to_add = False
-
-        # Write the dummy ca cert if we are running on Mac OS X
-        if system == u'Darwin':
-            os.write(tmp_fd, b_DUMMY_CA_CERT)
-            # Default Homebrew path for OpenSSL certs
-            paths_checked.append('/usr/local/etc/openssl')
-
-        # for all of the paths, find any  .crt or .pem files
-        # and compile them into single temp file for use
-        # in the ssl check to speed up the test
-        for path in paths_checked:
-            if os.path.exists(path) and os.path.isdir(path):
-                dir_contents = os.listdir(path)
-                for f in dir_contents:
-                    full_path = os.path.join(path, f)
-                    if os.path.isfile(full_path) and os.path.splitext(f)[1] in ('.crt', '.pem'):
-                        try:
-                            cert_file = open(full_path, 'rb')
-                            cert = cert_file.read()
-                            cert_file.close()
-                            os.write(tmp_fd, cert)
-                            os.write(tmp_fd, b'\n')
-                            if full_path not in LOADED_VERIFY_LOCATIONS:
-                                to_add = True
-                                os.write(to_add_fd, cert)
-                                os.write(to_add_fd, b'\n')
-                                LOADED_VERIFY_LOCATIONS.add(full_path)
-                        except (OSError, IOError):
-                            pass
-
-        if not to_add:
-            try:
-                os.remove(to_add_path)
-            except OSError:
-                pass
-            to_add_path = None
-        return (tmp_path, to_add_path, paths_checked)
+        # the bundle is shared and cached, it is not for the caller to remove
+        return (CA_CERT_STORE.bundle_path(), None, get_ca_cert_paths())
 
     def validate_proxy_response(self, response, valid_codes=None):
         '''
@@ -657,24 +830,12 @@ class SSLValidationHandler(urllib_request.BaseHandler):
                     return False
         return True
 
-    def _make_context(self, to_add_ca_cert_path):
-        if HAS_SSLCONTEXT:
-            context = create_default_context()
-        elif HAS_URLLIB3_PYOPENSSLCONTEXT:
-            context = PyOpenSSLContext(PROTOCOL)
-        else:
-            raise NotImplementedError('Host libraries are too old to support creating an sslcontext')
-
-        if to_add_ca_cert_path:
-            context.load_verify_locations(to_add_ca_cert_path)
-        return context
-
     def http_request(self, req):
         tmp_ca_cert_path, to_add_ca_cert_path, paths_checked = self.get_ca_certs()
         https_proxy = os.environ.get('https_proxy')
         context = None
         try:
-            context = self._make_context(to_add_ca_cert_path)
+            context = CA_CERT_STORE.context()
         except Exception:
             # We'll make do with no context below
             pass
@@ -684,16 +845,6 @@ class SSLValidationHandler(urllib_request.BaseHandler):
 
         if not use_proxy:
             # ignore proxy settings for this host request
-            if tmp_ca_cert_path:
-                try:
-                    os.remove(tmp_ca_cert_path)
-                except OSError:
-                    pass
-            if to_add_ca_cert_path:
-                try:
-                    os.remove(to_add_ca_cert_path)
-                except OSError:
-                    pass
             return req
 
         try:
@@ -740,21 +891,6 @@ class SSLValidationHandler(urllib_request.BaseHandler):
         except socket.error as e:
             raise ConnectionError('Failed to connect to %s at port %s: %s' % (self.hostname, self.port, to_native(e)))
 
-        try:
-            # cleanup the temp file created, don't worry
-            # if it fails for some reason
-            os.remove(tmp_ca_cert_path)
-        except:
-            pass
-
-        try:
-            # cleanup the temp file created, don't worry
-            # if it fails for some reason
-            if to_add_ca_cert_path:
-                os.remove(to_add_ca_cert_path)
-        except:
-            pass
-
         return req
 
     https_request = http_request
@@ -767,6 +903,11 @@ def maybe_add_ssl_handler(url, validate_certs):
             raise NoSSLError('SSL validation is not available in your version of python. You can use validate_certs=False,'
                              ' however this is unsafe and not recommended')
 
+        if HAS_SSLCONTEXT and CustomHTTPSHandler and hasattr(socket, 'create_connection'):
+            # the certificate is validated during the real connection's
+            # handshake, by the CustomHTTPSHandler open_url() adds
+            return None
+
         # do the cert validation
         netloc = parsed.netloc
         if '@' in netloc:
@@ -856,25 +997,19 @@ def open_url(url, data=None, headers=None, method=None, use_proxy=True,
         proxyhandler = urllib_request.ProxyHandler({})
         handlers.append(proxyhandler)
 
-    if HAS_SSLCONTEXT and not validate_certs:
-        # In 2.7.9, the default context validates certificates
-        context = SSLContext(ssl.PROTOCOL_SSLv23)
-        context.options |= ssl.OP_NO_SSLv2
-        context.options |= ssl.OP_NO_SSLv3
-        context.verify_mode = ssl.CERT_NONE
-        context.check_hostname = False
-        handlers.append(HTTPSClientAuthHandler(client_cert=client_cert,
-                                               client_key=client_key,
-                                               context=context))
-    elif client_cert:
-        handlers.append(HTTPSClientAuthHandler(client_cert=client_cert,
-                                               client_key=client_key))
-
     # pre-2.6 versions of python cannot use the custom https
     # handler, since the socket class is lacking create_connection.
     # Some python builds lack HTTPS support.
-    if hasattr(socket, 'create_connection') and CustomHTTPSHandler:
-        handlers.append(CustomHTTPSHandler)
+    if HAS_SSLCONTEXT and hasattr(socket, 'create_connection') and CustomHTTPSHandler:
+        # one shared context per (validate_certs, client_cert, client_key), so
+        # TLS sessions are resumed across open_url() calls
+        handlers.append(CustomHTTPSHandler(context=get_ssl_context(validate_certs, client_cert, client_key)))
+    else:
+        if client_cert:
+            handlers.append(HTTPSClientAuthHandler(client_cert=client_cert,
+                                                   client_key=client_key))
+        if hasattr(socket, 'create_connection') and CustomHTTPSHandler:
+            handlers.append(CustomHTTPSHandler)
 
     handlers.append(RedirectHandlerFactory(follow_redirects, validate_certs))
 
@@ -882,8 +1017,10 @@ def open_url(url, data=None, headers=None, method=None, use_proxy=True,
     if cookies is not None:
         handlers.append(urllib_request.HTTPCookieProcessor(cookies))
 
+    # NOTE: the opener is used directly instead of install_opener() so that
+    # concurrent open_url() calls from different threads do not race on
+    # the module global opener (and the ssl handler for another host)
     opener = urllib_request.build_opener(*handlers)
-    urllib_request.install_opener(opener)
 
     data = to_bytes(data, nonstring='passthru')
     if method:
@@ -920,7 +1057,7 @@ def open_url(url, data=None, headers=None, method=None, use_proxy=True,
         # have a timeout parameter
         urlopen_args.append(timeout)
 
-    r = urllib_request.urlopen(*urlopen_args)
+    r = opener.open(*urlopen_args)
     return r
 
 #
@@ -0,0 +1,408 @@
+"""Install content from a list of requirement specs, for programs that use ansible_galaxy as a library
+
+    from ansible_galaxy import installer
+
+    galaxy_installer = installer.Installer(options=installer.InstallOptions(force=True), workers=8)
+    for result in galaxy_installer.install(['geerlingguy.apache,2.0.0', 'git+https://github.com/alikins/some-role,v1']):
+        print(result.name, result.status, result.error)
+
+A requirement spec is what 'install' takes on the command line (a role name,
+optionally with ',version[,name]', an scm url, or the path of a tar file), or
+a dict as returned by GalaxyContent.yaml_parse().
+
+The dependencies of installed roles are installed after the requirements, a
+round (one level of the dependency tree) at a time. With workers > 1, the
+content of each round is installed at once.
+
+With options.roles_path, everything is installed into each of those roles
+paths. Each piece of content is looked up and downloaded once, installed into
+the first roles path it isn't already in, then into the rest of them at once
+(see options.target_workers). Whether it is already installed, and so skipped
+or replaced, is decided for each roles path on its own.
+
+Each step is reported by calling progress_callback with an InstallEvent. When
+workers > 1, it is called from the worker threads.
+
+Galaxy lookups go through the process wide shared api (see
+flat_rest_api.api.get_shared_api), so installers in a long lived process
+share its api version, token and memoized responses (for up to
+runtime.GALAXY_API_MEMO_TTL seconds each). Archives come from
+options.mirrors, and with options.link_mode roles are linked from the shared
+content store (see store.py) instead of extracted again.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import logging
+import os
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from ansible_galaxy import exceptions
+from ansible_galaxy import scm
+from ansible_galaxy.config import runtime
+from ansible_galaxy.flat_rest_api.content import GalaxyContent
+from ansible_galaxy.models.context import GalaxyContext
+
+log = logging.getLogger(__name__)
+
+# InstallResult.status
+INSTALLED = 'installed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# InstallEvent.kind, besides INSTALLED, SKIPPED and FAILED
+CHANGING = 'changing'
+DEPENDENCY = 'dependency'
+
+
+class InstallOptions(object):
+    """The options installing reads, with the defaults the CLI has
+
+    Any of them can be given as keyword arguments.
+    """
+
+    def __init__(self, **kwargs):
+        self.api_server = runtime.GALAXY_SERVER
+        self.ignore_certs = runtime.GALAXY_IGNORE_CERTS
+        self.transport = runtime.GALAXY_TRANSPORT
+        self.retries = runtime.GALAXY_RETRIES
+        # install into each of these, instead of the default content path
+        self.roles_path = []
+        # how many of roles_path to install into at once
+        self.target_workers = runtime.GALAXY_INSTALL_TARGET_WORKERS
+        # replace installed content, even at the same version
+        self.force = False
+        # don't install the dependencies of roles
+        self.no_deps = False
+        self.mirrors = list(runtime.GALAXY_ARCHIVE_MIRRORS)
+        self.fastest_mirror = runtime.GALAXY_FASTEST_MIRROR
+        self.download_segments = runtime.GALAXY_DOWNLOAD_SEGMENTS
+        self.fsync = runtime.GALAXY_EXTRACT_FSYNC
+        self.extract_workers = runtime.GALAXY_EXTRACT_WORKERS
+        self.decompressor = runtime.GALAXY_DECOMPRESSOR
+        self.link_mode = runtime.GALAXY_LINK_MODE
+
+        for name, value in kwargs.items():
+            if not hasattr(self, name):
+                raise TypeError("Unknown install option '%s'" % name)
+            setattr(self, name, value)
+
+
+class InstallResult(object):
+    """The outcome of installing one requirement or dependency"""
+
+    def __init__(self, content, required_by=None):
+        self.content = content
+        # the name of the role that depends on content, None for the requirements given to install()
+        self.required_by = required_by
+        self.status = None
+        self.error = None
+
+    @property
+    def name(self):
+        return self.content.name
+
+    @property
+    def version(self):
+        return self.content.version
+
+    @property
+    def path(self):
+        return self.content.path
+
+    def __repr__(self):
+        return '%s(%s, status=%s, required_by=%s, error=%s)' % (
+            self.__class__.__name__, self.content, self.status, self.required_by, self.error)
+
+
+class InstallEvent(object):
+    """Something that happened while installing
+
+    :param kind: one of INSTALLED, SKIPPED, FAILED, CHANGING or DEPENDENCY
+    :param level: 'info' for messages the user should see (the CLI displays
+        them), 'warning' for problems, 'debug' for the rest
+    """
+
+    def __init__(self, kind, content, message=None, level='info', error=None):
+        self.kind = kind
+        self.content = content
+        self.message = message
+        self.level = level
+        self.error = error
+
+    def __repr__(self):
+        return '%s(%s, %s, %r)' % (self.__class__.__name__, self.kind, self.content, self.message)
+
+
+class Installer(object):
+    """Install requirements and their dependencies, reporting each step to progress_callback
+
+    :param galaxy: a GalaxyContext, made from options if it isn't given
+    :param options: an InstallOptions, or any object with the same attributes
+    :param workers: how many pieces of content to install at once
+    :param progress_callback: called with an InstallEvent for each step
+    :param display_callback: passed on to GalaxyContent, for its download and extract messages
+    """
+
+    def __init__(self, galaxy=None, options=None, workers=None, progress_callback=None, display_callback=None):
+        self.galaxy = galaxy or GalaxyContext(options or InstallOptions())
+        self.workers = max(1, workers or 1)
+        self.progress_callback = progress_callback
+        self.display_callback = display_callback
+
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+        self._lock = threading.Lock()
+        # (content, required_by) of everything install() has queued, installed or not
+        self._queue = []
+        # the content in _queue, by name
+        self._queued = {}
+        self._only = None
+
+    @property
+    def options(self):
+        return self.galaxy.options
+
+    def _emit(self, kind, content, message=None, level='info', error=None):
+        if self.progress_callback:
+            self.progress_callback(InstallEvent(kind, content, message=message, level=level, error=error))
+
+    def _map(self, func, items, workers=None):
+        workers = workers or self.workers
+        if workers <= 1 or len(items) < 2:
+            return [func(item) for item in items]
+
+        pool = ThreadPool(min(workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _content(self, spec, content_type=None):
+        if not isinstance(spec, dict):
+            spec = GalaxyContent.yaml_parse(spec.strip())
+        spec = dict(spec)
+        if content_type:
+            spec['type'] = content_type
+        return GalaxyContent(self.galaxy, display_callback=self.display_callback, **spec)
+
+    def install(self, specs, content_type=None, only=None):
+        """Install specs, and the roles they depend on
+
+        :param specs: list of requirement specs
+        :param content_type: the type of content the specs are, defaults to 'role'
+        :param only: if given, content (and dependencies) with names not in only are skipped
+        :returns: list of InstallResult, for the requirements in the order
+            given, then for the dependencies in the order they were found. With
+            options.roles_path, there is one for each roles path.
+        """
+        requirements = [self._content(spec, content_type=content_type) for spec in specs]
+        self._queue = [(content, None) for content in requirements]
+        self._queued = {}
+        for content in requirements:
+            self._queued.setdefault(content.name, content)
+        self._only = frozenset(only) if only else None
+
+        self.prefetch_scm_archives([content for content in requirements if not only or content.name in only])
+
+        results = []
+        start = 0
+        try:
+            while start < len(self._queue):
+                # installing this round queues the next one
+                round_items = self._queue[start:]
+                start = len(self._queue)
+                for item_results in self._map(lambda item: self._install_one(*item), round_items):
+                    results.extend(item_results)
+        finally:
+            self._remove_scm_archives(requirements)
+        return results
+
+    def prefetch_scm_archives(self, contents):
+        """Archive all of the scm requirements at once, before they are installed one at a time
+
+        Failures are left for install() to retry and report.
+        """
+        if getattr(self.options, 'force', False):
+            scm_contents = [c for c in contents if c.scm]
+        else:
+            scm_contents = [c for c in contents if c.scm and c.install_info is None]
+        if len(scm_contents) < 2:
+            return
+
+        self.log.debug('archiving %d scm repos', len(scm_contents))
+        results = scm.archive_many([c.spec for c in scm_contents])
+        for galaxy_content, (archive_path, error) in zip(scm_contents, results):
+            galaxy_content.scm_archive = archive_path
+
+    def _target_content(self, content, roles_path):
+        """A copy of content, to be installed into roles_path"""
+        path = os.path.expanduser(roles_path)
+        if content.content_type == "role":
+            path = os.path.join(path, content.name)
+        target_content = GalaxyContent(self.galaxy, path=path, type=content.content_type,
+                                       display_callback=self.display_callback, **content.spec)
+        target_content.scm_archive = content.scm_archive
+        return target_content
+
+    def _remove_scm_archives(self, contents):
+        """Remove the prefetched archives of contents that weren't installed from them"""
+        for galaxy_content in contents:
+            if not galaxy_content.scm_archive:
+                continue
+            try:
+                os.unlink(galaxy_content.scm_archive)
+            except OSError as e:
+                # installing a copy of it for a roles path removed it
+                if e.errno != errno.ENOENT:
+                    self.log.warning('Unable to remove scm archive %s: %s', galaxy_content.scm_archive, e)
+            galaxy_content.scm_archive = None
+
+    def _install_one(self, content, required_by=None):
+        """Install content into each roles path, or the default content path
+
+        :returns: list of InstallResult, one for each roles path
+        """
+        if self._only and content.name not in self._only:
+            result = InstallResult(content, required_by=required_by)
+            result.status = SKIPPED
+            self._emit(SKIPPED, content, 'Skipping role %s' % content.name, level='debug')
+            return [result]
+
+        self.log.info('Processing %s %s', content.content_type, content.name)
+
+        roles_paths = getattr(self.options, 'roles_path', None) or []
+        if roles_paths:
+            results = [InstallResult(self._target_content(content, roles_path), required_by=required_by) for roles_path in roles_paths]
+        else:
+            results = [InstallResult(content, required_by=required_by)]
+
+        pending = [result for result in results if not self._already_installed(result)]
+        if len(pending) == 1:
+            self._install_result(pending[0])
+        elif pending:
+            self._install_targets(content, pending)
+
+        # FIXME - Galaxy Content Types handle dependencies in the GalaxyContent type itself because
+        #         a content repo can contain many types and many of any single type and it's just
+        #         easier to have that introspection there. In the future this should be more
+        #         unified and have a clean API
+        installed = [result.content for result in pending if result.status == INSTALLED]
+        if installed and installed[0].content_type == "role" and not getattr(self.options, 'no_deps', False):
+            self._queue_dependencies(installed[0])
+        return results
+
+    def _already_installed(self, result):
+        """Mark result SKIPPED if its content is installed already, removing it instead with options.force"""
+        content = result.content
+        # FIXME - Unsure if we want to handle the install info for all galaxy
+        #         content. Skipping for non-role types for now.
+        if content.content_type != "role" or content.install_info is None:
+            return False
+
+        installed_version = content.install_info['version']
+        if installed_version != content.version or getattr(self.options, 'force', False):
+            if getattr(self.options, 'force', False):
+                self._emit(CHANGING, content, '- changing role %s from %s to %s' %
+                           (content.name, installed_version, content.version or "unspecified"))
+                content.remove()
+                return False
+            self._emit(SKIPPED, content, '- %s (%s) is already installed - use --force to change version to %s' %
+                       (content.name, installed_version, content.version or "unspecified"), level='warning')
+        else:
+            self._emit(SKIPPED, content, '- %s is already installed, skipping.' % str(content))
+        result.status = SKIPPED
+        return True
+
+    def _failed(self, result, error=None):
+        result.status = FAILED
+        result.error = error
+        if error:
+            message = "- %s was NOT installed successfully: %s" % (result.name, error)
+        else:
+            message = "- %s was NOT installed successfully." % result.name
+        self._emit(FAILED, result.content, message, level='warning', error=error)
+
+    def _install_result(self, result, archive=None):
+        try:
+            installed = result.content.install(archive=archive)
+        except exceptions.GalaxyError as e:
+            self.log.exception(e)
+            self._failed(result, e)
+            return
+
+        if not installed:
+            self._failed(result)
+            return
+
+        result.status = INSTALLED
+        self._emit(INSTALLED, result.content, level='debug')
+
+    def _install_targets(self, content, pending):
+        """Look up and download content once, and install it for each of the pending results"""
+        try:
+            archive, local_file = content.fetch_archive()
+        except exceptions.GalaxyError as e:
+            self.log.exception(e)
+            for result in pending:
+                self._failed(result, e)
+            return
+
+        if not archive:
+            for result in pending:
+                self._failed(result)
+            return
+
+        try:
+            for result in pending:
+                # the version looking content up found
+                result.content.content.version = content.version
+            # with a link mode, the first install stores the role, and the rest link it from the store
+            self._install_result(pending[0], archive=archive)
+            self._map(lambda result: self._install_result(result, archive=archive), pending[1:],
+                      workers=getattr(self.options, 'target_workers', None))
+        finally:
+            content._remove_tmp_file(archive, local_file)
+
+    def _queue_dependencies(self, content):
+        if not content.metadata:
+            self._emit(DEPENDENCY, content, "Meta file %s is empty. Skipping dependencies." % content.path, level='warning')
+            return
+
+        for dep in content.metadata.get('dependencies') or []:
+            self.log.debug('Installing dep %s', dep)
+            dep_info = GalaxyContent.yaml_parse(dep)
+            dep_name = dep_info.get('name')
+            if '.' not in dep_name and '.' not in (dep_info.get('src') or dep_name) and dep_info.get('scm') is None:
+                # we know we can skip this, as it's not going to
+                # be found on galaxy.ansible.com
+                continue
+
+            # checked before making a GalaxyContent, most dependencies of a big tree are shared
+            with self._lock:
+                pending = self._queued.get(dep_name)
+            if pending is not None:
+                self._emit(DEPENDENCY, pending, '- dependency %s already pending installation.' % dep_name)
+                continue
+
+            dep_role = GalaxyContent(self.galaxy, display_callback=self.display_callback, **dep_info)
+            # with roles paths, each roles path is checked when the dependency is installed
+            if dep_role.install_info is None or getattr(self.options, 'roles_path', None):
+                with self._lock:
+                    pending = self._queued.setdefault(dep_role.name, dep_role)
+                    if pending is dep_role:
+                        self._queue.append((dep_role, content.name))
+                if pending is not dep_role:
+                    self._emit(DEPENDENCY, pending, '- dependency %s already pending installation.' % dep_role.name)
+                else:
+                    self._emit(DEPENDENCY, dep_role, '- adding dependency: %s' % str(dep_role))
+            elif dep_role.install_info['version'] != dep_role.version:
+                self._emit(DEPENDENCY, dep_role, '- dependency %s from role %s differs from already installed version (%s), skipping' %
+                           (str(dep_role), content.name, dep_role.install_info['version']), level='warning')
+            else:
+                self._emit(DEPENDENCY, dep_role, '- dependency %s is already installed, skipping.' % dep_role.name)
@@ -0,0 +1,134 @@
+"""Manifests of installed files, and checking installed content against them
+
+A manifest maps the path of each file, relative to the content's directory, to
+what was installed there:
+
+    {'tasks/main.yml': {'size': 52, 'mtime': 1530000000, 'sha256': '9f86...'},
+     'tasks/link.yml': {'link': 'main.yml'}}
+
+verify() trusts a file whose size and mtime still match its manifest entry, the
+way make and rsync do, so checking an unchanged tree costs one stat per file.
+Only files whose mtime changed are hashed, and files whose size changed are
+modified without hashing them. full=True hashes every file, to catch edits
+that kept the size and put the mtime back.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import collections
+import logging
+import os
+
+from multiprocessing.pool import ThreadPool
+
+from ansible_galaxy.config import runtime
+from ansible_galaxy.store import file_checksum
+
+log = logging.getLogger(__name__)
+
+MISSING = 'missing'
+MODIFIED = 'modified'
+ADDED = 'added'
+
+Drift = collections.namedtuple('Drift', ['path', 'reason'])
+
+
+def _files(root, exclude=None):
+    """The relative paths of the files and symlinks under root"""
+    exclude = set(exclude or [])
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_dir = os.path.relpath(dir_path, root)
+        # os.walk lists symlinks to dirs as dirs, but doesn't walk them
+        for name in file_names + [d for d in dir_names if os.path.islink(os.path.join(dir_path, d))]:
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+            if rel_path not in exclude:
+                paths.append(rel_path)
+    return paths
+
+
+def file_entry(path):
+    st = os.lstat(path)
+    if os.path.islink(path):
+        return {'link': os.readlink(path)}
+    return {'size': st.st_size, 'mtime': int(st.st_mtime), 'sha256': file_checksum(path)}
+
+
+def build(root, exclude=None, workers=None):
+    """The manifest of the files under root
+
+    :param exclude: relative paths to leave out
+    :param workers: how many files to hash at once
+    """
+    workers = runtime.GALAXY_VERIFY_WORKERS if workers is None else workers
+    paths = _files(root, exclude=exclude)
+    if workers > 1 and len(paths) > 1:
+        pool = ThreadPool(min(workers, len(paths)))
+        try:
+            entries = pool.map(lambda rel_path: file_entry(os.path.join(root, rel_path)), paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        entries = [file_entry(os.path.join(root, rel_path)) for rel_path in paths]
+    return dict(zip(paths, entries))
+
+
+def _check(path, entry, full):
+    """The reason path no longer matches entry, or None if it does"""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return MISSING
+
+    if 'link' in entry:
+        if not os.path.islink(path) or os.readlink(path) != entry['link']:
+            return MODIFIED
+        return None
+
+    if os.path.islink(path) or st.st_size != entry.get('size'):
+        return MODIFIED
+    if not full and int(st.st_mtime) == entry.get('mtime'):
+        return None
+    if file_checksum(path) != entry.get('sha256'):
+        return MODIFIED
+    return None
+
+
+def verify(root, manifest, full=False, exclude=None):
+    """Check the files under root against manifest
+
+    :param full: hash every file, instead of only the ones whose mtime changed
+    :param exclude: relative paths that aren't expected to be in manifest
+    :returns: a sorted list of Drift, empty if nothing changed
+    """
+    drift = []
+    for rel_path, entry in manifest.items():
+        reason = _check(os.path.join(root, rel_path), entry, full)
+        if reason:
+            drift.append(Drift(rel_path, reason))
+
+    for rel_path in _files(root, exclude=exclude):
+        if rel_path not in manifest:
+            drift.append(Drift(rel_path, ADDED))
+
+    return sorted(drift)
+
+
+def verify_all(items, full=False, exclude=None, workers=None):
+    """verify() many trees at once
+
+    :param items: list of (root, manifest)
+    :returns: a list of the drift of each item, in the same order
+    """
+    workers = runtime.GALAXY_VERIFY_WORKERS if workers is None else workers
+    if workers <= 1 or len(items) <= 1:
+        return [verify(root, manifest, full=full, exclude=exclude) for root, manifest in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(lambda item: verify(item[0], item[1], full=full, exclude=exclude), items)
+    finally:
+        pool.close()
+        pool.join()
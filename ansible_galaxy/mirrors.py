@@ -0,0 +1,165 @@
+"""Download content archives from mirrors of their upstream urls
+
+A mirror is a base url (http, https or file) or a local directory that holds
+copies of archives laid out as '<mirror>/<host>/<path of the upstream url>'.
+For example, with the mirror 'https://artifacts.example.com/galaxy', the
+archive 'https://github.com/alikins/awx/archive/1.0.tar.gz' is looked for at
+'https://artifacts.example.com/galaxy/github.com/alikins/awx/archive/1.0.tar.gz'.
+
+That is the layout of a 'serve' proxy too, so its '/archives' url, or the
+'archives' dir in its store, can be used as a mirror.
+
+Sources are tried in the order the mirrors are listed, with the upstream url
+last, and a source that fails is skipped for the next one. With fastest=True
+they are tried fastest first instead, by the time they take to answer a HEAD
+request.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from six.moves.urllib.parse import urlparse
+from six.moves.urllib.request import url2pathname
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.config import runtime
+from ansible_galaxy.download import Downloader
+from ansible_galaxy.flat_rest_api import retry
+from ansible_galaxy.flat_rest_api.urls import open_url
+
+log = logging.getLogger(__name__)
+
+PROBE_TIMEOUT = 3
+
+URL_SCHEMES = ('http', 'https', 'file')
+
+
+def is_local(source):
+    return urlparse(source).scheme not in URL_SCHEMES or source.startswith('file://')
+
+
+def _local_path(source):
+    if source.startswith('file://'):
+        return url2pathname(urlparse(source).path)
+    return os.path.expanduser(source)
+
+
+def mirror_source(mirror, archive_url):
+    """Where mirror keeps a copy of archive_url, or None if archive_url can't be mirrored"""
+    parsed = urlparse(archive_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return None
+
+    parts = [parsed.netloc] + [p for p in parsed.path.split('/') if p]
+    if any(p in ('.', '..') for p in parts):
+        return None
+
+    if urlparse(mirror).scheme in URL_SCHEMES:
+        return '%s/%s' % (mirror.rstrip('/'), '/'.join(parts))
+    return os.path.join(os.path.expanduser(mirror), *parts)
+
+
+def download(source, validate_certs=True, policy=None, segments=None):
+    """Copy source (a url or a local path) to a new temp file, and return its path
+
+    urls are downloaded by a download.Downloader, in segments if they are large.
+    """
+    temp_file = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        if is_local(source):
+            with open(_local_path(source), 'rb') as src_file:
+                shutil.copyfileobj(src_file, temp_file)
+            temp_file.close()
+        else:
+            temp_file.close()
+            Downloader(segments=segments, validate_certs=validate_certs, policy=policy).download(source, temp_file.name)
+    except Exception:
+        temp_file.close()
+        os.unlink(temp_file.name)
+        raise
+    return temp_file.name
+
+
+def probe(source, validate_certs=True, timeout=None):
+    """Seconds source took to answer a HEAD request, or None if it didn't"""
+    if is_local(source):
+        return 0.0 if os.path.isfile(_local_path(source)) else None
+
+    start = time.time()
+    try:
+        open_url(source, method='HEAD', validate_certs=validate_certs, timeout=timeout or PROBE_TIMEOUT).close()
+    except Exception as e:
+        log.debug('probe of %s failed: %s', source, e)
+        return None
+    return time.time() - start
+
+
+class ArchiveSources(object):
+    """Find and download archives from a list of mirrors, failing over to the upstream url
+
+    :param mirrors: list of mirror base urls or directories, in the order to try them
+    :param fastest: probe the sources and try the fastest first
+    """
+
+    def __init__(self, mirrors=None, fastest=None, validate_certs=True, policy=None, segments=None):
+        self.mirrors = list(runtime.GALAXY_ARCHIVE_MIRRORS if mirrors is None else mirrors)
+        self.fastest = runtime.GALAXY_FASTEST_MIRROR if fastest is None else fastest
+        self.validate_certs = validate_certs
+        self.policy = policy or retry.RetryPolicy()
+        self.segments = segments
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def sources(self, archive_url):
+        """The urls and paths to try for archive_url, in order"""
+        sources = [mirror_source(mirror, archive_url) for mirror in self.mirrors]
+        sources = [source for source in sources if source] + [archive_url]
+        if self.fastest and len(sources) > 1:
+            sources = self.by_latency(sources)
+        return sources
+
+    def by_latency(self, sources):
+        pool = ThreadPool(len(sources))
+        try:
+            latencies = pool.map(lambda source: probe(source, validate_certs=self.validate_certs), sources)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.log.debug('source latencies: %s', list(zip(sources, latencies)))
+        # the ones that didn't answer are still tried, last and in the configured order
+        answered = sorted((latency, i) for i, latency in enumerate(latencies) if latency is not None)
+        unanswered = [i for i, latency in enumerate(latencies) if latency is None]
+        return [sources[i] for _, i in answered] + [sources[i] for i in unanswered]
+
+    def fetch(self, archive_url):
+        """Download archive_url from the first source that has it
+
+        :returns: (path of the downloaded temp file, the source it came from)
+        """
+        errors = []
+        sources = self.sources(archive_url)
+        for source in sources:
+            if source != archive_url and is_local(source) and not os.path.isfile(_local_path(source)):
+                errors.append('%s: not found' % source)
+                continue
+            # fail over to the next source straight away, only the last one is worth waiting on
+            policy = self.policy if source == sources[-1] else retry.RetryPolicy(retries=0)
+            try:
+                path = download(source, validate_certs=self.validate_certs, policy=policy, segments=self.segments)
+            except Exception as e:
+                self.log.warning('Unable to download %s from %s: %s', archive_url, source, e)
+                errors.append('%s: %s' % (source, e))
+                continue
+            if source != archive_url:
+                self.log.info('downloaded %s from the mirror %s', archive_url, source)
+            return path, source
+
+        raise exceptions.GalaxyClientError('Unable to download %s from any source (%s)' % (archive_url, '; '.join(errors)))
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 
 VALID_ROLE_SPEC_KEYS = [
     'name',
@@ -26,10 +28,20 @@ CONTENT_TYPE_DIR_MAP = dict([(k, '%ss' % k) for k in CONTENT_TYPES])
 
 
 class GalaxyContentMeta(object):
+    """The name, version and location of a piece of content
+
+    The version and path are filled in while installing, the name never
+    changes. Metas hash by their name, so they can be kept in sets and dicts
+    while the rest changes.
+    """
+
+    __slots__ = ('_name', '_hash', 'version', 'src', 'scm', 'content_type', 'content_dir', 'path')
+
     def __init__(self, name=None, version=None,
                  src=None, scm=None, content_type=None,
                  path=None, content_dir=None):
-        self.name = name
+        self._name = name
+        self._hash = hash(name)
         self.version = version
         self.src = src or name
         self.scm = scm
@@ -37,8 +49,45 @@ class GalaxyContentMeta(object):
         self.content_dir = content_dir
         self.path = path
 
+    @property
+    def name(self):
+        return self._name
+
+    def __hash__(self):
+        return self._hash
+
     def __eq__(self, other):
-        return (self.name, self.version, self.src, self.scm,
-                self.content_type, self.content_dir, self.path) == \
-            (other.name, other.version, other.src, other.scm,
-             other.content_type, other.content_dir, other.path)
+        if not isinstance(other, GalaxyContentMeta):
+            return NotImplemented
+        return self._name == other._name and self.version == other.version and \
+            self.src == other.src and self.scm == other.scm and \
+            self.content_type == other.content_type and self.content_dir == other.content_dir and \
+            self.path == other.path
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+
+class ContentRepoSummary(namedtuple('ContentRepoSummary', ['id', 'name', 'role_type', 'github_user', 'github_repo',
+                                                           'github_branch', 'versions_url', 'repository_url'])):
+    """The few parts of a galaxy content object that installing it needs"""
+
+    __slots__ = ()
+
+    # the fields of the galaxy api object to request, see GalaxyAPI.lookup_content_repo_summary()
+    API_FIELDS = ('id', 'name', 'role_type', 'github_user', 'github_repo', 'github_branch', 'related')
+
+    @classmethod
+    def from_api(cls, data):
+        related = data.get('related', None) or {}
+        return cls(id=data.get('id', None),
+                   name=data.get('name', None),
+                   role_type=data.get('role_type', None),
+                   github_user=data.get('github_user', None),
+                   github_repo=data.get('github_repo', None),
+                   github_branch=data.get('github_branch', None),
+                   versions_url=related.get('versions', None),
+                   repository_url=related.get('repository', None))
@@ -0,0 +1,218 @@
+"""Create archives of git and hg repos, using a persistent local cache of each repo
+
+Every repo url gets a bare mirror (a 'git init --bare' repo, or an 'hg clone -U')
+in the scm cache dir. Installing a tag or branch only fetches that ref, shallowly,
+and installing a commit that is already in the cache does not touch the network
+at all, so repeat installs of the same repo don't pay for a full clone each time.
+
+Updating a mirror takes a lock file next to it, so processes sharing the cache
+take turns too.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import contextlib
+import errno
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.config import defaults
+from ansible_galaxy.utils.text import to_bytes, to_text
+
+log = logging.getLogger(__name__)
+
+SUPPORTED_SCMS = ('git', 'hg')
+
+DEFAULT_WORKERS = 4
+
+# a full or abbreviated commit id
+COMMIT_ID_RE = re.compile(r'^[0-9a-fA-F]{7,40}$')
+
+_url_locks = {}
+_url_locks_lock = threading.Lock()
+
+
+def _url_lock(cache_dir):
+    """One lock per cached repo, so concurrent archives of the same repo take turns updating it"""
+    with _url_locks_lock:
+        return _url_locks.setdefault(cache_dir, threading.Lock())
+
+
+def _makedirs(path):
+    """os.makedirs, that doesn't mind another process making path first"""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on the file at path, between processes"""
+    if not HAS_FCNTL:
+        yield
+        return
+
+    _makedirs(os.path.dirname(path))
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _run(cmd, cwd=None):
+    log.debug('running: %s (cwd=%s)', ' '.join(cmd), cwd)
+    try:
+        popen = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except (IOError, OSError):
+        raise exceptions.GalaxyClientError("error executing: %s" % " ".join(cmd))
+    stdout, stderr = popen.communicate()
+    if popen.returncode != 0:
+        raise exceptions.GalaxyClientError("- command %s failed in directory %s (rc=%s): %s" %
+                                           (' '.join(cmd), cwd, popen.returncode, to_text(stderr).strip()))
+    return to_text(stdout)
+
+
+def _succeeds(cmd, cwd=None):
+    try:
+        _run(cmd, cwd=cwd)
+    except exceptions.GalaxyClientError:
+        return False
+    return True
+
+
+class ScmCache(object):
+    """A directory of bare mirrors of scm repos, keyed by repo url"""
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or defaults.DEFAULT_SCM_CACHE_PATH)
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def repo_dir(self, scm, src):
+        digest = hashlib.sha1(to_bytes(src, errors='surrogate_or_strict')).hexdigest()
+        return os.path.join(self.path, scm, digest)
+
+    def archive(self, src, scm='git', name=None, version='HEAD'):
+        """Archive version of the repo at src to a temp tar file, with a 'name/' prefix
+
+        :returns: the path of the tar file. The caller is responsible for removing it.
+        """
+        if scm not in SUPPORTED_SCMS:
+            raise exceptions.GalaxyClientError("- scm %s is not currently supported" % scm)
+
+        repo_dir = self.repo_dir(scm, src)
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.tar')
+        temp_file.close()
+
+        with _url_lock(repo_dir), _file_lock(repo_dir + '.lock'):
+            try:
+                if scm == 'git':
+                    self._git_archive(repo_dir, src, name, version, temp_file.name)
+                else:
+                    self._hg_archive(repo_dir, src, name, version, temp_file.name)
+            except Exception:
+                os.unlink(temp_file.name)
+                raise
+
+        return temp_file.name
+
+    def _git_archive(self, repo_dir, src, name, version, archive_path):
+        if not os.path.isdir(os.path.join(repo_dir, 'objects')):
+            _makedirs(repo_dir)
+            _run(['git', 'init', '--quiet', '--bare'], cwd=repo_dir)
+
+        if not version or version == 'HEAD':
+            _run(['git', 'fetch', '--quiet', '--depth', '1', src, 'HEAD'], cwd=repo_dir)
+            treeish = 'FETCH_HEAD'
+        elif COMMIT_ID_RE.match(version) and self._git_has_commit(repo_dir, version):
+            # commits don't change, if we have it there is nothing to fetch
+            self.log.debug('%s is already in the cache for %s', version, src)
+            treeish = version
+        elif COMMIT_ID_RE.match(version):
+            # most servers allow fetching a commit by its full id. A tag or
+            # branch with a name that looks like one is fetched the same way.
+            # Either way only FETCH_HEAD moves.
+            if _succeeds(['git', 'fetch', '--quiet', '--depth', '1', src, version], cwd=repo_dir):
+                treeish = 'FETCH_HEAD'
+            else:
+                # the server doesn't allow it, or the id is abbreviated, fetch everything
+                fetch_cmd = ['git', 'fetch', '--quiet', '--tags', src, '+refs/heads/*:refs/heads/*']
+                if os.path.exists(os.path.join(repo_dir, 'shallow')):
+                    fetch_cmd.insert(2, '--unshallow')
+                _run(fetch_cmd, cwd=repo_dir)
+                treeish = version
+        else:
+            # a tag or branch name, only fetch that one ref
+            _run(['git', 'fetch', '--quiet', '--depth', '1', src, version], cwd=repo_dir)
+            treeish = 'FETCH_HEAD'
+
+        _run(['git', '--git-dir', repo_dir, 'archive', '--prefix=%s/' % name, '--output=%s' % archive_path, treeish])
+
+    def _git_has_commit(self, repo_dir, version):
+        """If the cache has the commit with the id version, and version isn't the name of a tag or branch"""
+        try:
+            commit_id = _run(['git', 'rev-parse', '--verify', '--quiet', '%s^{commit}' % version], cwd=repo_dir).strip()
+        except exceptions.GalaxyClientError:
+            return False
+        return commit_id.startswith(version.lower())
+
+    def _hg_archive(self, repo_dir, src, name, version, archive_path):
+        if not os.path.isdir(repo_dir):
+            _makedirs(os.path.dirname(repo_dir))
+            _run(['hg', 'clone', '--quiet', '-U', src, repo_dir])
+        elif not (version and COMMIT_ID_RE.match(version) and _succeeds(['hg', 'log', '-R', repo_dir, '-r', version])):
+            _run(['hg', 'pull', '--quiet', '-R', repo_dir, src])
+
+        archive_cmd = ['hg', 'archive', '-R', repo_dir, '--prefix', '%s/' % name, '-t', 'tar']
+        # an update-less clone has no working dir revision, so default to the tip
+        archive_cmd.extend(['-r', version if version and version != 'HEAD' else 'tip'])
+        archive_cmd.append(archive_path)
+        _run(archive_cmd)
+
+
+def archive(src, scm='git', name=None, version='HEAD', cache_path=None):
+    return ScmCache(cache_path).archive(src, scm=scm, name=name, version=version)
+
+
+def archive_many(specs, workers=None, cache_path=None):
+    """Archive several repos at once
+
+    :param specs: list of dicts with the src, scm, name and version keys
+    :returns: a list of (archive path, None) or (None, exception), in the order of specs
+    """
+    if not specs:
+        return []
+
+    scm_cache = ScmCache(cache_path)
+
+    def _archive_one(spec):
+        try:
+            return scm_cache.archive(**spec), None
+        except Exception as e:
+            log.exception(e)
+            return None, e
+
+    pool = ThreadPool(min(max(1, workers or DEFAULT_WORKERS), len(specs)))
+    try:
+        return pool.map(_archive_one, specs)
+    finally:
+        pool.close()
+        pool.join()
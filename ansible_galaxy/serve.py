@@ -0,0 +1,364 @@
+"""A local caching proxy for a galaxy server and the archives it points to
+
+Clients point --server at the proxy. API GET responses are kept in memory
+for a short ttl, archive downloads are kept in an on-disk store, and
+concurrent identical requests are coalesced so each is made upstream once.
+
+So that archive downloads go through the proxy too, 'external_url' values in
+proxied JSON (and the github url of repository objects that don't have one)
+are rewritten to point at the proxy's /archives/ path. An archive for
+'https://github.com/alikins/awx/archive/1.0.tar.gz' is served (and stored)
+as '/archives/github.com/alikins/awx/archive/1.0.tar.gz'.
+
+Only archives under a url the proxy rewrote, or on one of allowed_hosts, are
+downloaded, with the scheme of the url they came from. The proxy doesn't
+fetch urls for any host a client names.
+
+GET requests with an Authorization header are passed through, uncached.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import collections
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import urlparse
+
+from ansible_galaxy.config import defaults
+from ansible_galaxy.flat_rest_api.urls import open_url
+from ansible_galaxy.utils.singleflight import SingleFlight
+from ansible_galaxy.utils.text import to_bytes, to_text
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LISTEN = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_TTL = 300
+# the most api responses kept in memory
+MAX_API_CACHE_ENTRIES = 1000
+
+# the most rewritten archive urls remembered at once, the oldest are dropped first,
+# enough for every url in a full api cache
+MAX_ARCHIVE_ORIGINS = 100000
+
+ARCHIVE_PREFIX = '/archives/'
+
+# hop by hop and length headers are not passed through
+SKIP_RESPONSE_HEADERS = ('connection', 'content-length', 'keep-alive', 'transfer-encoding', 'content-encoding')
+
+
+class ProxyResponse(object):
+    def __init__(self, status, headers, body=None, path=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # for archives, the path of the file in the store to send
+        self.path = path
+
+
+class GalaxyProxy(object):
+    """Fetch and cache upstream galaxy api responses and archives"""
+
+    def __init__(self, upstream, store_path=None, cache_ttl=None, archive_ttl=None, validate_certs=True, allowed_hosts=None):
+        self.upstream = upstream.rstrip('/')
+        self.store_path = os.path.expanduser(store_path or defaults.DEFAULT_SERVE_STORE_PATH)
+        self.cache_ttl = DEFAULT_CACHE_TTL if cache_ttl is None else cache_ttl
+        # None means stored archives never expire
+        self.archive_ttl = archive_ttl
+        self.validate_certs = validate_certs
+        # hosts archives can be downloaded from, besides those of the urls rewritten
+        self.allowed_hosts = frozenset(allowed_hosts or [])
+
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+        # key -> (expires, response), oldest first
+        self._api_cache = collections.OrderedDict()
+        self._api_cache_lock = threading.Lock()
+        # '<netloc>/<path>' of each url rewritten -> its scheme, oldest first
+        self._archive_origins = collections.OrderedDict()
+        self._archive_origins_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+
+        # counters, mostly for debugging and tests
+        self.upstream_requests = 0
+
+    def _upstream_open(self, url, **kwargs):
+        self.upstream_requests += 1
+        self.log.debug('upstream request %s', url)
+        return open_url(url, validate_certs=self.validate_certs, timeout=60, **kwargs)
+
+    # api responses
+
+    def get_api(self, path, proxy_url, headers=None):
+        """GET an api path, from the cache if possible
+
+        :param path: the request path and query string
+        :param proxy_url: the base url clients use to reach the proxy, for rewriting archive urls
+        :param headers: request headers to pass on, requests with an Authorization header are not cached
+        """
+        if headers and any(k.lower() == 'authorization' for k in headers):
+            return self._fetch_api(path, proxy_url, headers=headers)
+
+        key = (path, proxy_url)
+        now = time.time()
+        with self._api_cache_lock:
+            cached = self._api_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        response = self._single_flight.do(key, self._fetch_api, path, proxy_url)
+        if response.status == 200 and self.cache_ttl > 0:
+            self._cache_api(key, response)
+        return response
+
+    def _cache_api(self, key, response):
+        now = time.time()
+        with self._api_cache_lock:
+            self._api_cache.pop(key, None)
+            self._api_cache[key] = (now + self.cache_ttl, response)
+            # every entry has the same ttl, so the oldest expire first
+            while self._api_cache:
+                oldest_key, (expires, _) = next(iter(self._api_cache.items()))
+                if expires > now and len(self._api_cache) <= MAX_API_CACHE_ENTRIES:
+                    break
+                del self._api_cache[oldest_key]
+
+    def _fetch_api(self, path, proxy_url, headers=None):
+        try:
+            resp = self._upstream_open(self.upstream + path, headers=headers)
+            status = resp.getcode()
+        except HTTPError as e:
+            resp = e
+            status = e.code
+
+        headers = [(k, v) for k, v in resp.info().items() if k.lower() not in SKIP_RESPONSE_HEADERS]
+        body = resp.read()
+
+        content_type = resp.info().get('Content-Type', '')
+        if status == 200 and 'json' in content_type:
+            body = self.rewrite_archive_urls(body, proxy_url)
+
+        return ProxyResponse(status, headers, body=body)
+
+    def forward(self, method, path, body=None, headers=None):
+        """Pass a non GET request through to the upstream server, uncached"""
+        try:
+            resp = self._upstream_open(self.upstream + path, method=method, data=body, headers=headers)
+            status = resp.getcode()
+        except HTTPError as e:
+            resp = e
+            status = e.code
+        headers = [(k, v) for k, v in resp.info().items() if k.lower() not in SKIP_RESPONSE_HEADERS]
+        return ProxyResponse(status, headers, body=resp.read())
+
+    def proxy_archive_url(self, url, proxy_url):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            return url
+        origin = '%s%s' % (parsed.netloc, parsed.path.rstrip('/'))
+        with self._archive_origins_lock:
+            self._archive_origins.pop(origin, None)
+            self._archive_origins[origin] = parsed.scheme
+            while len(self._archive_origins) > MAX_ARCHIVE_ORIGINS:
+                self._archive_origins.popitem(last=False)
+        return '%s%s%s' % (proxy_url, ARCHIVE_PREFIX, origin)
+
+    def archive_url(self, archive_path):
+        """The upstream url of '<netloc>/<path>', or None if the proxy shouldn't download it"""
+        parts = archive_path.split('/')
+        # the longest url rewritten that archive_path is under
+        for end in range(len(parts), 0, -1):
+            with self._archive_origins_lock:
+                scheme = self._archive_origins.get('/'.join(parts[:end]))
+            if scheme:
+                return '%s://%s' % (scheme, archive_path)
+        if parts[0] in self.allowed_hosts:
+            return 'https://%s' % archive_path
+        return None
+
+    def _rewrite(self, data, proxy_url):
+        if isinstance(data, list):
+            for item in data:
+                self._rewrite(item, proxy_url)
+        elif isinstance(data, dict):
+            if 'external_url' in data:
+                external_url = data['external_url']
+                if not external_url and data.get('github_user') and data.get('github_repo'):
+                    external_url = 'https://github.com/%s/%s' % (data['github_user'], data['github_repo'])
+                if external_url:
+                    data['external_url'] = self.proxy_archive_url(external_url, proxy_url)
+            for value in data.values():
+                if isinstance(value, (dict, list)):
+                    self._rewrite(value, proxy_url)
+
+    def rewrite_archive_urls(self, body, proxy_url):
+        try:
+            data = json.loads(to_text(body, errors='surrogate_or_strict'))
+        except ValueError:
+            return body
+        self._rewrite(data, proxy_url)
+        return to_bytes(json.dumps(data), errors='surrogate_or_strict')
+
+    # archives
+
+    def archive_store_path(self, archive_path):
+        """Map '<netloc>/<path>' to a file in the store, or None if it is not a safe path"""
+        parts = [p for p in archive_path.split('/') if p]
+        if len(parts) < 2 or any(p in ('.', '..') or p.startswith('~') for p in parts):
+            return None
+        return os.path.join(self.store_path, 'archives', *parts)
+
+    def get_archive(self, archive_path):
+        store_file = self.archive_store_path(archive_path)
+        if not store_file:
+            return ProxyResponse(404, [], body=b'Not Found')
+
+        if not self._is_fresh(store_file):
+            url = self.archive_url(archive_path)
+            if not url:
+                return ProxyResponse(403, [], body=b'Forbidden')
+            try:
+                self._single_flight.do(store_file, self._download_archive, url, store_file)
+            except HTTPError as e:
+                return ProxyResponse(e.code, [], body=to_bytes(str(e)))
+
+        return ProxyResponse(200, [('Content-Type', 'application/octet-stream')], path=store_file)
+
+    def _is_fresh(self, store_file):
+        try:
+            mtime = os.path.getmtime(store_file)
+        except OSError:
+            return False
+        return self.archive_ttl is None or mtime + self.archive_ttl > time.time()
+
+    def _download_archive(self, url, store_file):
+        # another request may have stored it while we waited for our turn
+        if self._is_fresh(store_file):
+            return store_file
+
+        store_dir = os.path.dirname(store_file)
+        if not os.path.isdir(store_dir):
+            try:
+                os.makedirs(store_dir)
+            except OSError:
+                if not os.path.isdir(store_dir):
+                    raise
+
+        resp = self._upstream_open(url)
+
+        # write to a temp file in the same dir and rename it into place, so a
+        # partial download is never served
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                shutil.copyfileobj(resp, tmp_file)
+            os.rename(tmp_path, store_file)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self.log.info('stored %s as %s', url, store_file)
+        return store_file
+
+
+class GalaxyProxyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def proxy(self):
+        return self.server.galaxy_proxy
+
+    @property
+    def proxy_url(self):
+        host = self.headers.get('Host') or '%s:%s' % self.server.server_address[:2]
+        return 'http://%s' % host
+
+    def log_message(self, format, *args):
+        log.info('%s - %s', self.address_string(), format % args)
+
+    def _send(self, response):
+        self.send_response(response.status)
+        for header, value in response.headers:
+            self.send_header(header, value)
+
+        if response.path:
+            size = os.path.getsize(response.path)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            if self.command != 'HEAD':
+                with open(response.path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile)
+            return
+
+        body = response.body or b''
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _handle_error(self, e):
+        log.exception(e)
+        body = to_bytes('Upstream request failed: %s' % e, errors='surrogate_or_strict')
+        self._send(ProxyResponse(502, [('Content-Type', 'text/plain')], body=body))
+
+    def do_GET(self):
+        try:
+            if self.path.startswith(ARCHIVE_PREFIX):
+                response = self.proxy.get_archive(self.path[len(ARCHIVE_PREFIX):].split('?', 1)[0])
+            else:
+                response = self.proxy.get_api(self.path, self.proxy_url, headers=self._pass_headers())
+        except Exception as e:
+            return self._handle_error(e)
+        self._send(response)
+
+    do_HEAD = do_GET
+
+    def _pass_headers(self):
+        return dict((k, v) for k, v in self.headers.items() if k.lower() in ('authorization', 'content-type'))
+
+    def _forward(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        try:
+            response = self.proxy.forward(self.command, self.path, body=body, headers=self._pass_headers())
+        except Exception as e:
+            return self._handle_error(e)
+        self._send(response)
+
+    do_POST = do_PUT = do_DELETE = do_PATCH = _forward
+
+
+class GalaxyProxyServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, galaxy_proxy):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, GalaxyProxyRequestHandler)
+        self.galaxy_proxy = galaxy_proxy
+
+
+def serve(upstream, listen=None, port=None, **kwargs):
+    """Run a caching proxy for upstream until interrupted"""
+    galaxy_proxy = GalaxyProxy(upstream, **kwargs)
+    server = GalaxyProxyServer((listen or DEFAULT_LISTEN, DEFAULT_PORT if port is None else port), galaxy_proxy)
+    log.info('serving %s on %s:%s, archives stored in %s', upstream, server.server_address[0],
+             server.server_address[1], galaxy_proxy.store_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    return server
@@ -0,0 +1,174 @@
+"""A shared store of extracted roles, linked into roles paths instead of extracted again
+
+Each entry is the extracted tree of one role archive, kept under
+'<store>/<name>/<version>/<sha256 of the archive>'. Installing a role whose
+archive is already in the store creates the role's directories in the roles
+path and links each file to the store's copy, so it takes no decompression,
+no extraction, and (with hardlinks or reflinks) next to no disk space.
+
+Link modes:
+- 'hardlink': hard link each file. The files are shared, editing an installed
+  file in place edits the store's copy (and every other install of it).
+- 'reflink': a copy on write clone of each file, on filesystems that support
+  it (btrfs, xfs). Falls back to copying.
+- 'symlink': a symlink to each file in the store.
+- 'copy': copy each file, only saves the extraction.
+- 'none': don't use the store.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from ansible_galaxy.config import defaults
+from ansible_galaxy.config import runtime
+
+log = logging.getLogger(__name__)
+
+LINK_MODES = ('none', 'hardlink', 'reflink', 'symlink', 'copy')
+
+# the linux ioctl that clones a file's extents, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# errors that mean 'can not link here', the file is copied instead
+LINK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _safe_part(part):
+    return (part or '_').replace(os.sep, '_').replace('..', '_')
+
+
+def _reflink(src, dest):
+    if not HAS_FCNTL:
+        raise OSError(errno.EOPNOTSUPP, 'reflinks are not supported on this platform')
+    with open(src, 'rb') as src_file:
+        with open(dest, 'wb') as dest_file:
+            try:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            except (IOError, OSError):
+                dest_file.close()
+                os.unlink(dest)
+                raise
+    shutil.copystat(src, dest)
+
+
+class ContentStore(object):
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or defaults.DEFAULT_CONTENT_STORE_PATH)
+        self.log = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+
+    def entry_path(self, name, version, checksum):
+        return os.path.join(self.path, _safe_part(name), _safe_part(version), checksum)
+
+    def get(self, name, version, checksum):
+        """The path of the stored tree for the archive with checksum, or None if it isn't stored"""
+        entry = self.entry_path(name, version, checksum)
+        if os.path.isdir(entry):
+            return entry
+        return None
+
+    def add(self, name, version, checksum, populate):
+        """Store a tree, populated by calling populate(dir)
+
+        The tree is built in a temp dir and renamed into place, so a partly
+        written entry is never used.
+
+        :returns: the path of the entry
+        """
+        entry = self.entry_path(name, version, checksum)
+        parent = os.path.dirname(entry)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not os.path.isdir(parent):
+                    raise
+
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            populate(tmp_dir)
+            os.rename(tmp_dir, entry)
+        except OSError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # another install stored the same archive first
+            if not (e.errno in (errno.EEXIST, errno.ENOTEMPTY) and os.path.isdir(entry)):
+                raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.log.debug('stored %s %s (%s) in %s', name, version, checksum, entry)
+        return entry
+
+    def materialize(self, entry, dest, link_mode=None):
+        """Recreate the tree at entry under dest, linking its files with link_mode
+
+        :returns: the number of files linked (or copied)
+        """
+        link_mode = link_mode or runtime.GALAXY_LINK_MODE
+        link = self._linker(link_mode)
+        count = 0
+        for dir_path, dir_names, file_names in os.walk(entry):
+            rel_dir = os.path.relpath(dir_path, entry)
+            dest_dir = os.path.normpath(os.path.join(dest, rel_dir))
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir)
+            # os.walk lists symlinks to dirs as dirs, but doesn't walk them
+            for name in dir_names + file_names:
+                src = os.path.join(dir_path, name)
+                if os.path.islink(src):
+                    os.symlink(os.readlink(src), os.path.join(dest_dir, name))
+                    count += 1
+                elif name in file_names:
+                    link(src, os.path.join(dest_dir, name))
+                    count += 1
+        return count
+
+    def _linker(self, link_mode):
+        if link_mode == 'symlink':
+            return os.symlink
+        if link_mode == 'copy':
+            return shutil.copy2
+
+        link = os.link if link_mode == 'hardlink' else _reflink
+        state = {'fallback': False}
+
+        def _link(src, dest):
+            if not state['fallback']:
+                try:
+                    return link(src, dest)
+                except (IOError, OSError) as e:
+                    if e.errno not in LINK_ERRNOS:
+                        raise
+                    self.log.info('unable to %s %s to %s (%s), copying files instead', link_mode, src, dest, e)
+                    # if one file can't be linked, none of them can
+                    state['fallback'] = True
+            shutil.copy2(src, dest)
+
+        return _link
+
+
+CONTENT_STORE = ContentStore()
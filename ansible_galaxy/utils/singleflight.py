@@ -0,0 +1,73 @@
+"""Duplicate call suppression for concurrent identical requests"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import logging
+import sys
+import threading
+
+import six
+
+log = logging.getLogger(__name__)
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+        # callers waiting on this call, besides the one running it
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Make concurrent calls with the same key share one execution
+
+    The first caller for a key runs the function, any callers that arrive
+    with the same key while it is running wait for it and get the same
+    result (or the same exception). Nothing is remembered once the call
+    finishes, caching results is left to the caller.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            log.debug('waiting on in flight call for %s', key)
+            call.done.wait()
+            if call.exc_info:
+                six.reraise(*call.exc_info)
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def waiters(self, key):
+        """How many callers are waiting on the in flight call for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            return call.waiters if call else 0
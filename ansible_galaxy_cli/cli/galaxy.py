@@ -22,6 +22,7 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+import json
 import logging
 import os.path
 import re
@@ -33,18 +34,28 @@ import yaml
 from jinja2 import Environment, FileSystemLoader
 
 from ansible_galaxy_cli import cli
+from ansible_galaxy_cli import daemon
+from ansible_galaxy_cli import main as cli_main
+from ansible_galaxy import bulk_import
+from ansible_galaxy import catalog
+from ansible_galaxy import installer
+from ansible_galaxy import manifest
+from ansible_galaxy import serve
+from ansible_galaxy import store
+from ansible_galaxy.archive import decompress
+from ansible_galaxy.archive import extract
 from ansible_galaxy.config import defaults
 from ansible_galaxy.config import runtime
-from ansible_galaxy import exceptions
 from ansible_galaxy_cli import exceptions as cli_exceptions
 from ansible_galaxy.models.context import GalaxyContext
 from ansible_galaxy.utils.text import to_text
 
 # FIXME: importing class, fix name collision later or use this style
 # TODO: replace flat_rest_api with a OO interface
-from ansible_galaxy.flat_rest_api.api import GalaxyAPI
+from ansible_galaxy.flat_rest_api.api import GalaxyAPI, clear_shared_apis, get_shared_api
 from ansible_galaxy.flat_rest_api.login import GalaxyLogin
-from ansible_galaxy.flat_rest_api.content import GalaxyContent
+from ansible_galaxy.flat_rest_api.content import GalaxyContent, load_install_info
+from ansible_galaxy.flat_rest_api import transport
 from ansible_galaxy.flat_rest_api.token import GalaxyToken
 
 # FIXME: not a model...
@@ -57,7 +68,10 @@ class GalaxyCLI(cli.CLI):
     '''command to manage Ansible roles in shared repostories, the default of which is Ansible Galaxy *https://galaxy.ansible.com*.'''
 
     SKIP_INFO_KEYS = ("name", "description", "readme_html", "related", "summary_fields", "average_aw_composite", "average_aw_score", "url")
-    VALID_ACTIONS = ("delete", "import", "info", "init", "install", "content-install", "list", "login", "remove", "search", "setup")
+    VALID_ACTIONS = ("catalog", "delete", "import", "info", "init", "install", "content-install", "list", "login", "remove", "search", "serve", "setup",
+                     "verify", "daemon")
+    CATALOG_ACTIONS = ("status", "sync")
+    SEARCH_FORMATS = ('text', 'json', 'tsv')
 
     def __init__(self, args):
         self.api = None
@@ -69,11 +83,27 @@ class GalaxyCLI(cli.CLI):
         super(GalaxyCLI, self).set_action()
 
         # specific to actions
-        if self.action == "delete":
+        if self.action == "catalog":
+            self.parser.set_usage("usage: %prog catalog [options] sync|status")
+            self.parser.add_option('--full', dest='full', action='store_true', default=False,
+                                   help='Discard the local catalog and mirror everything again instead of only what changed since the last sync.')
+            self.parser.add_option('--kind', dest='catalog_kinds', action='append', choices=catalog.CATALOG_KINDS, type='choice', default=[],
+                                   help='What to mirror, one of: %s. May be used more than once. Default is all of them.' % ', '.join(catalog.CATALOG_KINDS))
+        elif self.action == "daemon":
+            self.parser.set_usage("usage: %prog daemon [options]")
+            self.parser.add_option('--cache-ttl', dest='cache_ttl', type='int', default=runtime.GALAXY_DAEMON_CACHE_TTL,
+                                   help='How many seconds to reuse galaxy API responses for, across commands. '
+                                        'The default is %s' % runtime.GALAXY_DAEMON_CACHE_TTL)
+        elif self.action == "delete":
             self.parser.set_usage("usage: %prog delete [options] github_user github_repo")
         elif self.action == "import":
-            self.parser.set_usage("usage: %prog import [options] github_user github_repo")
+            self.parser.set_usage("usage: %prog import [options] [-r FILE | github_user github_repo]")
             self.parser.add_option('--no-wait', dest='wait', action='store_false', default=True, help='Don\'t wait for import results.')
+            self.parser.add_option('-r', '--repo-file', dest='repo_file',
+                                   help='A file containing a list of repos to import, one "github_user github_repo [branch [role_name]]" per line. '
+                                        'Use "-" to read the list from stdin.')
+            self.parser.add_option('--workers', dest='workers', type='int', default=bulk_import.DEFAULT_WORKERS,
+                                   help='The number of import requests to submit or check at once when using --repo-file.')
             self.parser.add_option('--branch', dest='reference',
                                    help='The name of a branch to import. Defaults to the repository\'s default branch (usually master)')
             self.parser.add_option('--role-name', dest='role_name', help='The name the role should have, if different than the repo name')
@@ -97,6 +127,9 @@ class GalaxyCLI(cli.CLI):
             self.parser.add_option('-r', '--role-file', dest='role_file', help='A file containing a list of roles to be imported')
             self.parser.add_option('-g', '--keep-scm-meta', dest='keep_scm_meta', action='store_true',
                                    default=False, help='Use tar instead of the scm archive option when packaging the role')
+            self.parser.add_option('--roles-paths-file', dest='roles_paths_file', default=None,
+                                   help='A YAML file listing roles paths to install into, besides any given with --roles-path. '
+                                        'Relative paths are relative to the directory of the file.')
         elif self.action == "content-install":
             self.parser.set_usage("usage: %prog content-install [options] [-r FILE | role_name(s)[,version] | scm+role_repo_url[,version] | tar_file(s)]")
             self.parser.add_option('-i', '--ignore-errors', dest='ignore_errors', action='store_true', default=False,
@@ -119,17 +152,48 @@ class GalaxyCLI(cli.CLI):
             self.parser.add_option('--platforms', dest='platforms', help='list of OS platforms to filter by')
             self.parser.add_option('--galaxy-tags', dest='galaxy_tags', help='list of galaxy tags to filter by')
             self.parser.add_option('--author', dest='author', help='GitHub username')
+            self.parser.add_option('--limit', dest='limit', type='int', default=None, help='The maximum number of roles to show. Default is all matches.')
+            self.parser.add_option('--offset', dest='offset', type='int', default=0, help='The number of matching roles to skip before showing results.')
+            self.parser.add_option('--format', dest='output_format', type='choice', choices=self.SEARCH_FORMATS, default='text',
+                                   help='The output format, one of: %s. json writes one role per line.' % ', '.join(self.SEARCH_FORMATS))
+        elif self.action == "serve":
+            self.parser.set_usage("usage: %prog serve [options]")
+            self.parser.add_option('--listen', dest='listen', default=serve.DEFAULT_LISTEN,
+                                   help='The address to listen on. The default is %s' % serve.DEFAULT_LISTEN)
+            self.parser.add_option('--port', dest='port', type='int', default=serve.DEFAULT_PORT,
+                                   help='The port to listen on. The default is %s' % serve.DEFAULT_PORT)
+            self.parser.add_option('--store-path', dest='store_path', default=defaults.DEFAULT_SERVE_STORE_PATH,
+                                   help='The directory downloaded archives are stored in. The default is %s' % defaults.DEFAULT_SERVE_STORE_PATH)
+            self.parser.add_option('--cache-ttl', dest='cache_ttl', type='int', default=serve.DEFAULT_CACHE_TTL,
+                                   help='How many seconds to cache galaxy API responses for. The default is %s' % serve.DEFAULT_CACHE_TTL)
+            self.parser.add_option('--archive-ttl', dest='archive_ttl', type='int', default=None,
+                                   help='How many seconds to keep stored archives before downloading them again. The default is to keep them.')
+            self.parser.add_option('--allow-host', dest='allowed_hosts', action='append', default=[],
+                                   help='A host archives can be downloaded from, besides those in the urls of api responses. '
+                                        'Can be used more than once.')
         elif self.action == "setup":
             self.parser.set_usage("usage: %prog setup [options] source github_user github_repo secret")
             self.parser.add_option('--remove', dest='remove_id', default=None,
                                    help='Remove the integration matching the provided ID value. Use --list to see ID values.')
             self.parser.add_option('--list', dest="setup_list", action='store_true', default=False, help='List all of your integrations.')
+        elif self.action == "verify":
+            self.parser.set_usage("usage: %prog verify [options] [role_name ...]")
+            self.parser.add_option('--checksum', dest='full', action='store_true', default=False,
+                                   help='Hash every file, instead of only the files whose modification time changed since they were installed.')
+            self.parser.add_option('--workers', dest='verify_workers', type='int', default=runtime.GALAXY_VERIFY_WORKERS,
+                                   help='How many roles to check at once. The default is %s' % runtime.GALAXY_VERIFY_WORKERS)
 
         # options that apply to more than one action
         if self.action in ['init', 'info']:
             self.parser.add_option('--offline', dest='offline', default=False, action='store_true', help="Don't query the galaxy API when creating roles")
-
-        if self.action not in ("delete", "import", "init", "login", "setup"):
+        if self.action == 'search':
+            self.parser.add_option('--offline', dest='offline', default=False, action='store_true',
+                                   help="Search the local catalog (see 'catalog sync') instead of querying the galaxy API")
+        if self.action in ['catalog', 'info', 'search']:
+            self.parser.add_option('--catalog-path', dest='catalog_path', default=defaults.DEFAULT_CATALOG_PATH,
+                                   help='The path to the local catalog database. The default is %s' % defaults.DEFAULT_CATALOG_PATH)
+
+        if self.action not in ("catalog", "daemon", "delete", "import", "init", "login", "serve", "setup"):
             # NOTE: while the option type=str, the default is a list, and the
             # callback will set the value to a list.
             self.parser.add_option('-p', '--roles-path', dest='roles_path', action="append", default=[],
@@ -137,6 +201,32 @@ class GalaxyCLI(cli.CLI):
                                         'file (/etc/ansible/roles if not configured)', type='str')
         if self.action in ("init", "install", "content-install"):
             self.parser.add_option('-f', '--force', dest='force', action='store_true', default=False, help='Force overwriting an existing role')
+        if self.action in ("install", "content-install"):
+            self.parser.add_option('--mirror', dest='mirrors', action='append', default=list(runtime.GALAXY_ARCHIVE_MIRRORS),
+                                   help='A base url or directory with copies of archives, laid out as <mirror>/<host>/<path of the archive url>. '
+                                        'Mirrors are tried in the order given, before the archive url itself. Can be used more than once.')
+            self.parser.add_option('--fastest-mirror', dest='fastest_mirror', action='store_true', default=runtime.GALAXY_FASTEST_MIRROR,
+                                   help='Try the mirrors that respond fastest first, instead of in the order given')
+            self.parser.add_option('--download-segments', dest='download_segments', type='int', default=runtime.GALAXY_DOWNLOAD_SEGMENTS,
+                                   help='Download large archives in this many parts at once, from servers that support byte ranges. '
+                                        'The default is %s' % runtime.GALAXY_DOWNLOAD_SEGMENTS)
+            self.parser.add_option('--fsync', dest='fsync', type='choice', choices=extract.FSYNC_POLICIES, default=runtime.GALAXY_EXTRACT_FSYNC,
+                                   help='When to flush extracted files to disk, one of: %s. "file" syncs each file as it is written, '
+                                        '"final" syncs once after all of them. The default is %s' % (', '.join(extract.FSYNC_POLICIES),
+                                                                                                     runtime.GALAXY_EXTRACT_FSYNC))
+            self.parser.add_option('--target-workers', dest='target_workers', type='int', default=runtime.GALAXY_INSTALL_TARGET_WORKERS,
+                                   help='How many of the roles paths given to install each role into at once. '
+                                        'The default is %s' % runtime.GALAXY_INSTALL_TARGET_WORKERS)
+            self.parser.add_option('--extract-workers', dest='extract_workers', type='int', default=runtime.GALAXY_EXTRACT_WORKERS,
+                                   help='How many threads write the files of an archive. The default is %s' % runtime.GALAXY_EXTRACT_WORKERS)
+            self.parser.add_option('--decompressor', dest='decompressor', type='choice', choices=decompress.DECOMPRESSORS,
+                                   default=runtime.GALAXY_DECOMPRESSOR,
+                                   help='What to decompress archives with, one of: %s. auto uses the fastest one available for the '
+                                        'archive format. The default is %s' % (', '.join(decompress.DECOMPRESSORS), runtime.GALAXY_DECOMPRESSOR))
+            self.parser.add_option('--link-mode', dest='link_mode', type='choice', choices=store.LINK_MODES, default=runtime.GALAXY_LINK_MODE,
+                                   help='Keep extracted roles in a shared store, and install them by linking their files from it, one of: %s. '
+                                        'With hardlink, editing an installed file edits every install of it. '
+                                        'The default is %s' % (', '.join(store.LINK_MODES), runtime.GALAXY_LINK_MODE))
 
     def parse(self):
         ''' create an options parser for bin/ansible '''
@@ -150,6 +240,12 @@ class GalaxyCLI(cli.CLI):
         self.parser.add_option('-s', '--server', dest='api_server', default=runtime.GALAXY_SERVER, help='The API server destination')
         self.parser.add_option('-c', '--ignore-certs', action='store_true', dest='ignore_certs', default=runtime.GALAXY_IGNORE_CERTS,
                                help='Ignore SSL certificate validation errors.')
+        self.parser.add_option('--transport', dest='transport', type='choice', choices=transport.TRANSPORTS, default=runtime.GALAXY_TRANSPORT,
+                               help='How to make galaxy API requests, one of: %s. pipelined and http2 overlap requests to the same server. '
+                                    'The default is %s' % (', '.join(transport.TRANSPORTS), runtime.GALAXY_TRANSPORT))
+        self.parser.add_option('--retries', dest='retries', type='int', default=runtime.GALAXY_RETRIES,
+                               help='How many times to retry a download or API request that failed with a server error, timeout or rate limit. '
+                                    'The default is %s' % runtime.GALAXY_RETRIES)
         self.set_action()
 
         super(GalaxyCLI, self).parse()
@@ -161,7 +257,7 @@ class GalaxyCLI(cli.CLI):
 
         super(GalaxyCLI, self).run()
 
-        self.api = GalaxyAPI(self.galaxy)
+        self.api = get_shared_api(self.galaxy)
         self.execute()
 
     def exit_without_ignore(self, rc=1):
@@ -295,41 +391,60 @@ class GalaxyCLI(cli.CLI):
             raise cli_exceptions.CliOptionsError("- you must specify a user/role name")
 
         roles_path = self.options.roles_path
+        role_catalog = catalog.GalaxyCatalog(self.api.api_server, path=self.options.catalog_path)
 
         data = ''
-        for role in self.args:
-
-            role_info = {'path': roles_path}
-            gr = GalaxyContent(self.galaxy, role)
-
-            install_info = gr.install_info
-            if install_info:
-                if 'version' in install_info:
-                    install_info['intalled_version'] = install_info['version']
-                    del install_info['version']
-                role_info.update(install_info)
-
-            remote_data = False
-            if not self.options.offline:
-                remote_data = self.api.lookup_role_by_name(role, False)
+        try:
+            for role in self.args:
 
-            if remote_data:
-                role_info.update(remote_data)
+                role_info = {'path': roles_path}
+                gr = GalaxyContent(self.galaxy, role)
 
-            if gr.metadata:
-                role_info.update(gr.metadata)
+                install_info = gr.install_info
+                if install_info:
+                    if 'version' in install_info:
+                        install_info['intalled_version'] = install_info['version']
+                        del install_info['version']
+                    role_info.update(install_info)
+
+                remote_data = False
+                if not self.options.offline:
+                    remote_data = self.api.lookup_role_by_name(role, False)
+                elif role_catalog.exists:
+                    remote_data = role_catalog.lookup_role_by_name(role)
+
+                if remote_data:
+                    role_info.update(remote_data)
+
+                if gr.metadata:
+                    role_info.update(gr.metadata)
+
+                role_spec = GalaxyContent.yaml_parse({'role': role})
+                if role_spec:
+                    role_info.update(role_spec)
+
+                data = self._display_role_info(role_info)
+                # FIXME: This is broken in both 1.9 and 2.0 as
+                # _display_role_info() always returns something
+                if not data:
+                    data = u"\n- the role %s was not found" % role
+        finally:
+            role_catalog.close()
 
-            role_spec = GalaxyContent.yaml_parse({'role': role})
-            if role_spec:
-                role_info.update(role_spec)
+        self.display(data)
 
-            data = self._display_role_info(role_info)
-            # FIXME: This is broken in both 1.9 and 2.0 as
-            # _display_role_info() always returns something
-            if not data:
-                data = u"\n- the role %s was not found" % role
+    def _install_progress(self, event):
+        """Display what an installer.Installer is doing, and stop at the first failure unless --ignore-errors"""
+        if event.message:
+            if event.level == 'warning':
+                log.warning(event.message)
+            elif event.level == 'debug':
+                log.info(event.message)
+            else:
+                self.display(event.message)
 
-        self.display(data)
+        if event.kind == installer.FAILED:
+            self.exit_without_ignore()
 
     def execute_content_install(self):
         """
@@ -354,10 +469,10 @@ class GalaxyCLI(cli.CLI):
 
         self.log.debug('galaxy.options: %s', self.galaxy.options)
         # If someone provides a --roles-path at the command line, we assume this is
-        # for use with a legacy role and we want to maintain backwards compat
+        # for use with a legacy role and we want to maintain backwards compat.
+        # The installer installs into the roles paths.
         if self.options.roles_path:
             self.log.warn('Assuming content is of type "role" since --role-path was used')
-            self.galaxy.content_paths = self.options.roles_path
             # self.galaxy.options['content_type'] = 'role'
             self.galaxy.options.content_type = 'role'
 
@@ -367,99 +482,28 @@ class GalaxyCLI(cli.CLI):
             # the user needs to specify one of either --role-file or specify a single user/role name
             raise cli_exceptions.CliOptionsError("- you must specify user/content name or a ansible-galaxy.yml file")
 
-        no_deps = self.options.no_deps
-        force = self.options.force
-
-        content_left = []
-
         # FIXME - Need to handle role files here for backwards compat
 
         # roles were specified directly, so we'll just go out grab them
         # (and their dependencies, unless the user doesn't want us to).
-        for content in self.args:
-            galaxy_content = GalaxyContent.yaml_parse(content.strip())
-            galaxy_content["type"] = self.options.content_type
-            self.log.debug('content install galaxy_content: %s', galaxy_content)
-            content_left.append(GalaxyContent(self.galaxy, **galaxy_content))
-
-        for content in content_left:
-            # only process roles in roles files when names matches if given
-
-            # FIXME - not sure how to handle this scenario for ansible galaxy files
-            #         here or if we even want to handle that scenario because of
-            #         the galaxy content allowing blank repos to be inspected
-            #
-            #         maybe we want this but only for role types for backwards
-            #         compat
-            #
-            # if role_file and self.args and role.name not in self.args:
-            #    display.vvv('Skipping role %s' % role.name)
-            #    continue
-
-            log.debug('Processing %s %s ', content.content_type, content.name)
-
-            # FIXME - Unsure if we want to handle the install info for all galaxy
-            #         content. Skipping for non-role types for now.
-            if content.content_type == "role":
-                if content.install_info is not None:
-                    if content.install_info['version'] != content.version or force:
-                        if force:
-                            self.display('- changing role %s from %s to %s' %
-                                         (content.name, content.install_info['version'], content.version or "unspecified"))
-                            content.remove()
-                        else:
-                            log.warn('- %s (%s) is already installed - use --force to change version to %s',
-                                     content.name, content.install_info['version'], content.version or "unspecified")
-                            continue
-                    else:
-                        if not force:
-                            self.display('- %s is already installed, skipping.' % str(content))
-                            continue
+        galaxy_installer = installer.Installer(self.galaxy, progress_callback=self._install_progress)
+        galaxy_installer.install(self.args, content_type=self.options.content_type)
 
-            try:
-                installed = content.install()
-            except cli_exceptions.GalaxyCliError as e:
-                log.warning("- %s was NOT installed successfully: %s ", content.name, str(e))
-                self.exit_without_ignore()
-                continue
+        return 0
 
-            # install dependencies, if we want them
-            # FIXME - Galaxy Content Types handle dependencies in the GalaxyContent type itself because
-            #         a content repo can contain many types and many of any single type and it's just
-            #         easier to have that introspection there. In the future this should be more
-            #         unified and have a clean API
-            if content.content_type == "role":
-                if not no_deps and installed:
-                    if not content.metadata:
-                        log.warning("Meta file %s is empty. Skipping dependencies.", content.path)
-                    else:
-                        role_dependencies = content.metadata.get('dependencies') or []
-                        for dep in role_dependencies:
-                            log.debug('Installing dep %s', dep)
-                            dep_info = GalaxyContent.yaml_parse(dep)
-                            dep_role = GalaxyContent(self.galaxy, **dep_info)
-                            if '.' not in dep_role.name and '.' not in dep_role.src and dep_role.scm is None:
-                                # we know we can skip this, as it's not going to
-                                # be found on galaxy.ansible.com
-                                continue
-                            if dep_role.install_info is None:
-                                if dep_role not in content_left:
-                                    self.display('- adding dependency: %s' % str(dep_role))
-                                    content_left.append(dep_role)
-                                else:
-                                    self.display('- dependency %s already pending installation.' % dep_role.name)
-                            else:
-                                if dep_role.install_info['version'] != dep_role.version:
-                                    log.warning('- dependency %s from role %s differs from already installed version (%s), skipping',
-                                                str(dep_role), content.name, dep_role.install_info['version'])
-                                else:
-                                    self.display('- dependency %s is already installed, skipping.' % dep_role.name)
-
-            if not installed:
-                log.warning("- %s was NOT installed successfully.", content.name)
-                self.exit_without_ignore()
+    def _read_roles_paths_file(self, paths_file):
+        """The roles paths listed in paths_file, with relative ones made relative to its directory"""
+        try:
+            with open(paths_file, 'r') as f:
+                roles_paths = yaml.safe_load(f)
+        except (IOError, OSError, yaml.YAMLError) as e:
+            raise cli_exceptions.GalaxyCliError('Unable to load roles paths from %s: %s' % (paths_file, e))
 
-        return 0
+        if not isinstance(roles_paths, list):
+            raise cli_exceptions.GalaxyCliError('%s should be a list of roles paths' % paths_file)
+
+        base_dir = os.path.dirname(os.path.abspath(paths_file))
+        return [os.path.join(base_dir, os.path.expanduser(str(roles_path))) for roles_path in roles_paths]
 
     def execute_install(self):
         """
@@ -472,10 +516,10 @@ class GalaxyCLI(cli.CLI):
             # the user needs to specify one of either --role-file or specify a single user/role name
             raise cli_exceptions.CliOptionsError("- you must specify a user/role name or a roles file")
 
-        no_deps = self.options.no_deps
-        force = self.options.force
+        if self.options.roles_paths_file:
+            self.options.roles_path.extend(self._read_roles_paths_file(self.options.roles_paths_file))
 
-        roles_left = []
+        specs = []
         if role_file:
             try:
                 f = open(role_file, 'r')
@@ -494,14 +538,11 @@ class GalaxyCLI(cli.CLI):
                             log.info("found role %s in yaml file", str(role))
                             if "name" not in role and "scm" not in role:
                                 raise cli_exceptions.GalaxyCliError("Must specify name or src for role")
-                            roles_left.append(GalaxyContent(self.galaxy, **role))
+                            specs.append(role)
                         else:
                             with open(role["include"]) as f_include:
                                 try:
-                                    roles_left += [
-                                        GalaxyContent(self.galaxy, **r) for r in
-                                        (GalaxyContent.yaml_parse(i) for i in yaml.safe_load(f_include))
-                                    ]
+                                    specs += [GalaxyContent.yaml_parse(i) for i in yaml.safe_load(f_include)]
                                 except Exception as e:
                                     msg = "Unable to load data from the include requirements file: %s %s"
                                     raise cli_exceptions.GalaxyCliError(msg % (role_file, e))
@@ -513,80 +554,18 @@ class GalaxyCLI(cli.CLI):
                             continue
                         log.debug('found role %s in text file', str(rline))
                         role = GalaxyContent.yaml_parse(rline.strip())
-                        roles_left.append(GalaxyContent(self.galaxy, **role))
+                        specs.append(role)
                 f.close()
             except (IOError, OSError) as e:
                 raise cli_exceptions.GalaxyCliError('Unable to open %s: %s' % (role_file, str(e)))
         else:
             # roles were specified directly, so we'll just go out grab them
             # (and their dependencies, unless the user doesn't want us to).
-            for rname in self.args:
-                role = GalaxyContent.yaml_parse(rname.strip())
-                roles_left.append(GalaxyContent(self.galaxy, **role))
-
-        for role in roles_left:
-            # only process roles in roles files when names matches if given
-            if role_file and self.args and role.name not in self.args:
-                log.info('Skipping role %s', role.name)
-                continue
-
-            log.info('Processing role %s ', role.name)
+            specs = self.args
 
-            # query the galaxy API for the role data
-
-            if role.install_info is not None:
-                if role.install_info['version'] != role.version or force:
-                    if force:
-                        self.display('- changing role %s from %s to %s' %
-                                     role.name, role.install_info['version'], role.version or "unspecified")
-                        role.remove()
-                    else:
-                        log.warn('- %s (%s) is already installed - use --force to change version to %s',
-                                 role.name, role.install_info['version'], role.version or "unspecified")
-                        continue
-                else:
-                    if not force:
-                        self.display('- %s is already installed, skipping.' % str(role))
-                        continue
-
-            try:
-                installed = role.install()
-            except exceptions.GalaxyError as e:
-                self.log.exception(e)
-                log.warn("- %s was NOT installed successfully: %s ", role.name, str(e))
-                self.exit_without_ignore()
-                continue
-
-            # install dependencies, if we want them
-            if not no_deps and installed:
-                if not role.metadata:
-                    log.warn("Meta file %s is empty. Skipping dependencies.", role.path)
-                else:
-                    role_dependencies = role.metadata.get('dependencies') or []
-                    for dep in role_dependencies:
-                        log.debug('Installing dep %s', dep)
-                        dep_info = GalaxyContent.yaml_parse(dep)
-                        dep_role = GalaxyContent(self.galaxy, **dep_info)
-                        if '.' not in dep_role.name and '.' not in dep_role.src and dep_role.scm is None:
-                            # we know we can skip this, as it's not going to
-                            # be found on galaxy.ansible.com
-                            continue
-                        if dep_role.install_info is None:
-                            if dep_role not in roles_left:
-                                self.display('- adding dependency: %s' % str(dep_role))
-                                roles_left.append(dep_role)
-                            else:
-                                self.display('- dependency %s already pending installation.' % dep_role.name)
-                        else:
-                            if dep_role.install_info['version'] != dep_role.version:
-                                log.warning('- dependency %s from role %s differs from already installed version (%s), skipping' %
-                                            str(dep_role), role.name, dep_role.install_info['version'])
-                            else:
-                                self.display('- dependency %s is already installed, skipping.' % dep_role.name)
-
-            if not installed:
-                log.warning("- %s was NOT installed successfully.", role.name)
-                self.exit_without_ignore()
+        galaxy_installer = installer.Installer(self.galaxy, progress_callback=self._install_progress)
+        # with a roles file, role names on the command line pick which of its roles to install
+        galaxy_installer.install(specs, only=self.args if role_file else None)
 
         return 0
 
@@ -655,9 +634,57 @@ class GalaxyCLI(cli.CLI):
                         self.display("- %s, %s" % (path_file, version))
         return 0
 
+    def execute_verify(self):
+        """
+        checks the files of installed roles against the manifest recorded in their install info when they were installed
+        """
+
+        roles_paths = [os.path.expanduser(p) for p in self.options.roles_path] or \
+            [os.path.join(os.path.expanduser(p), 'roles') for p in defaults.DEFAULT_CONTENT_PATH]
+        names = set(self.args)
+
+        roles = []
+        # every installed role found, with a manifest or not
+        found = set()
+        for roles_path in roles_paths:
+            if not os.path.isdir(roles_path):
+                continue
+            for name in sorted(os.listdir(roles_path)):
+                if names and name not in names:
+                    continue
+                info_path = os.path.join(roles_path, name, GalaxyContent.META_INSTALL)
+                if not os.path.isfile(info_path):
+                    continue
+                found.add(name)
+                install_info = load_install_info(info_path) or {}
+                if 'files' not in install_info:
+                    self.display("- %s was installed without a manifest, reinstall it to verify it" % name)
+                    continue
+                roles.append((name, os.path.join(roles_path, name), install_info['files']))
+
+        missing = names - found
+        for name in sorted(missing):
+            self.display("- %s is not installed, skipping." % name)
+
+        results = manifest.verify_all([(path, files) for _, path, files in roles], full=self.options.full,
+                                      exclude=[GalaxyContent.META_INSTALL], workers=self.options.verify_workers)
+
+        changed = 0
+        for (name, path, _), drift in zip(roles, results):
+            if not drift:
+                self.display("- %s ok" % name)
+                continue
+            changed += 1
+            self.display("- %s: %d files changed since it was installed in %s" % (name, len(drift), path))
+            for item in drift:
+                self.display("    %s: %s" % (item.reason, item.path))
+
+        if changed:
+            raise cli_exceptions.GalaxyCliError("- %d of %d roles do not match what was installed" % (changed, len(roles)))
+        return 0
+
     def execute_search(self):
         ''' searches for roles on the Ansible Galaxy server'''
-        page_size = 1000
         search = None
 
         if len(self.args):
@@ -669,35 +696,159 @@ class GalaxyCLI(cli.CLI):
         if not search and not self.options.platforms and not self.options.galaxy_tags and not self.options.author:
             raise cli_exceptions.GalaxyCliError("Invalid query. At least one search term, platform, galaxy tag or author must be provided.")
 
-        response = self.api.search_roles(search, platforms=self.options.platforms,
-                                         tags=self.options.galaxy_tags, author=self.options.author, page_size=page_size)
+        if self.options.limit is not None and self.options.limit < 0:
+            raise cli_exceptions.CliOptionsError("- --limit must be >= 0")
+        if self.options.offset < 0:
+            raise cli_exceptions.CliOptionsError("- --offset must be >= 0")
 
-        if response['count'] == 0:
-            self.display("No roles match your search.")
-            return True
+        if self.options.offline:
+            role_catalog = catalog.GalaxyCatalog(self.api.api_server, path=self.options.catalog_path)
+            if not role_catalog.exists:
+                raise cli_exceptions.GalaxyCliError("No local catalog found at %s. Use 'catalog sync' to create it." % role_catalog.path)
+            try:
+                pages = [role_catalog.search_roles(search, platforms=self.options.platforms,
+                                                   tags=self.options.galaxy_tags, author=self.options.author,
+                                                   offset=self.options.offset, limit=self.options.limit)]
+            finally:
+                role_catalog.close()
+        else:
+            pages = self.api.search_roles_pages(search, platforms=self.options.platforms,
+                                                tags=self.options.galaxy_tags, author=self.options.author,
+                                                offset=self.options.offset, limit=self.options.limit)
+
+        output_format = self.options.output_format
+        format_str = None
+        for page in pages:
+            if format_str is None:
+                # first page, print the header
+                if page['count'] == 0:
+                    if output_format == 'text':
+                        self.display("No roles match your search.")
+                    return True
+
+                if output_format == 'text':
+                    self.display(u'')
+                    self.display(self._search_summary(page['count']))
+                    if not page['results']:
+                        return True
+
+                    # the column width comes from the first page, later pages are
+                    # printed as they arrive and long names just overflow
+                    name_len = max([len(u'%s.%s' % (role['username'], role['name'])) for role in page['results']] or [4])
+                    format_str = u" %%-%ds %%s" % name_len
+                    self.display(u'')
+                    self.display(format_str % (u"Name", u"Description"))
+                    self.display(format_str % (u"----", u"-----------"))
+                else:
+                    format_str = u''
+
+            for role in page['results']:
+                name = u'%s.%s' % (role['username'], role['name'])
+                if output_format == 'json':
+                    self.display(json.dumps(role, sort_keys=True))
+                elif output_format == 'tsv':
+                    description = u' '.join((role.get('description') or u'').split())
+                    self.display(u'%s\t%s' % (name, description))
+                else:
+                    self.display(format_str % (name, role['description']))
 
-        data = [u'']
+            sys.stdout.flush()
 
-        if response['count'] > page_size:
-            data.append(u"Found %d roles matching your search. Showing first %s." % (response['count'], page_size))
-        else:
-            data.append(u"Found %d roles matching your search:" % response['count'])
-
-        max_len = []
-        for role in response['results']:
-            max_len.append(len(role['username'] + '.' + role['name']))
-        name_len = max(max_len)
-        format_str = u" %%-%ds %%s" % name_len
-        data.append(u'')
-        data.append(format_str % (u"Name", u"Description"))
-        data.append(format_str % (u"----", u"-----------"))
-        for role in response['results']:
-            data.append(format_str % (u'%s.%s' % (role['username'], role['name']), role['description']))
-
-        data = u'\n'.join(data)
-        self.display(data)
         return True
 
+    def _search_summary(self, count):
+        offset = self.options.offset
+        limit = self.options.limit
+        last = count if limit is None else min(count, offset + limit)
+
+        if offset >= count:
+            return u"Found %d roles matching your search, none after the first %d." % (count, offset)
+        if offset == 0 and last == count:
+            return u"Found %d roles matching your search:" % count
+        return u"Found %d roles matching your search. Showing %d to %d." % (count, min(offset + 1, count), last)
+
+    def execute_catalog(self):
+        """
+        mirrors role and content metadata from the galaxy server into a local catalog, for use with search --offline and info --offline
+        """
+
+        if len(self.args) != 1 or self.args[0] not in self.CATALOG_ACTIONS:
+            raise cli_exceptions.CliOptionsError("- expected one of: %s" % ', '.join(self.CATALOG_ACTIONS))
+
+        catalog_action = self.args.pop()
+        kinds = self.options.catalog_kinds or catalog.CATALOG_KINDS
+        galaxy_catalog = catalog.GalaxyCatalog(self.api.api_server, path=self.options.catalog_path)
+
+        if catalog_action == 'status':
+            if not galaxy_catalog.exists:
+                self.display("- no catalog found at %s" % galaxy_catalog.path)
+                return 0
+            self.display("Catalog %s for %s" % (galaxy_catalog.path, self.api.api_server))
+            try:
+                for kind in kinds:
+                    synced_at = galaxy_catalog.last_synced(kind)
+                    synced_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(synced_at)) if synced_at else 'never'
+                    self.display("- %s: %d items, last synced %s" % (kind, galaxy_catalog.count(kind), synced_str))
+            finally:
+                galaxy_catalog.close()
+            return 0
+
+        def progress(kind, synced):
+            self.log.info('catalog sync %s: %d items', kind, synced)
+
+        try:
+            for kind in kinds:
+                synced = galaxy_catalog.sync(self.api, kind=kind, full=self.options.full, progress_callback=progress)
+                self.display("- synced %d %s, %d in catalog" % (synced, kind, galaxy_catalog.count(kind)))
+        finally:
+            galaxy_catalog.close()
+
+        return 0
+
+    def execute_serve(self):
+        """
+        runs a local caching proxy for the galaxy server. Point other clients at it with --server http://<listen>:<port>
+        """
+
+        if self.args:
+            raise cli_exceptions.CliOptionsError("- serve does not take any arguments")
+
+        self.display("- serving %s on http://%s:%s, press Ctrl-C to stop" % (self.options.api_server, self.options.listen, self.options.port))
+        try:
+            serve.serve(self.options.api_server,
+                        listen=self.options.listen,
+                        port=self.options.port,
+                        store_path=self.options.store_path,
+                        cache_ttl=self.options.cache_ttl,
+                        archive_ttl=self.options.archive_ttl,
+                        allowed_hosts=self.options.allowed_hosts,
+                        validate_certs=not self.options.ignore_certs)
+        except KeyboardInterrupt:
+            self.display("- stopped")
+
+        return 0
+
+    def execute_daemon(self):
+        """
+        runs the commands of other ansible-galaxy-cli processes, keeping galaxy api sessions and responses, and install info, between them
+        """
+
+        if self.args:
+            raise cli_exceptions.CliOptionsError("- daemon does not take any arguments")
+
+        # apis are shared for the life of the process, which is now long, so their responses have to expire
+        GalaxyAPI.MEMO_TTL = self.options.cache_ttl
+        clear_shared_apis()
+
+        path = daemon.socket_path()
+        self.display("- running commands sent to %s, press Ctrl-C to stop" % path)
+        try:
+            daemon.serve(cli_main.run, path=path)
+        except KeyboardInterrupt:
+            self.display("- stopped")
+
+        return 0
+
     def execute_login(self):
         """
         verify user's identify via Github and retrieve an auth token from Ansible Galaxy.
@@ -738,6 +889,9 @@ class GalaxyCLI(cli.CLI):
             'DEBUG': runtime.COLOR_DEBUG,
         }
 
+        if self.options.repo_file:
+            return self._execute_bulk_import()
+
         if len(self.args) < 2:
             raise cli_exceptions.GalaxyCliError("Expected a github_username and github_repository. Use --help.")
 
@@ -783,6 +937,40 @@ class GalaxyCLI(cli.CLI):
 
         return 0
 
+    def _execute_bulk_import(self):
+        """ import every repo listed in --repo-file and wait on all of them at once """
+
+        repo_file = self.options.repo_file
+        try:
+            if repo_file == '-':
+                repos = bulk_import.parse_repo_list(sys.stdin)
+            else:
+                with open(repo_file, 'r') as f:
+                    repos = bulk_import.parse_repo_list(f)
+        except (IOError, OSError) as e:
+            raise cli_exceptions.GalaxyCliError('Unable to open %s: %s' % (repo_file, str(e)))
+
+        if not repos:
+            raise cli_exceptions.GalaxyCliError("No repos found in %s" % repo_file)
+
+        importer = bulk_import.BulkImporter(self.api, workers=self.options.workers,
+                                            display_callback=self.display)
+        importer.submit(repos)
+
+        if self.options.wait:
+            importer.wait()
+
+        self.display(u'')
+        self.display("Import summary: %d succeeded, %d failed, %d not finished" %
+                     (len(importer.succeeded), len(importer.failed), len(importer.pending)))
+        for result in importer.failed:
+            self.display("- %s: %s" % (result.repo, result.error or 'FAILED'), color=runtime.COLOR_ERROR)
+
+        if importer.failed:
+            raise cli_exceptions.GalaxyCliError("%d of %d imports failed" % (len(importer.failed), len(importer.results)))
+
+        return 0
+
     def execute_setup(self):
         """ Setup an integration from Github or Travis for Ansible Galaxy roles"""
 
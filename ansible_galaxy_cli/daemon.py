@@ -0,0 +1,271 @@
+"""Run CLI commands in a long lived daemon, reached over a unix socket
+
+Started with 'daemon', it listens on a unix socket (DEFAULT_DAEMON_SOCKET_PATH)
+that only its user can connect to. While it runs, main() forwards each
+command to it instead of running it itself, so a command skips the python
+startup, imports and logging setup, and reuses what earlier commands looked
+up: the galaxy api sessions, tokens and memoized responses, and the parsed
+install info of installed content. If the socket is missing or nobody answers
+on it, the command runs locally as before.
+
+The protocol is one JSON object per line. The client sends
+{"args": [...], "cwd": "...", "env": {...}}, and the daemon answers with
+{"stdout": "..."} and {"stderr": "..."} lines as the command prints, then
+{"exit": code}.
+
+Commands run one at a time, in the client's working directory and with the
+client's proxy and netrc environment (FORWARDED_ENV), with stdout and stderr
+sent back to the client, along with what they log to the console. Commands
+that prompt (login), that run their own server, or that read a role or repo
+list from stdin ('-r -') are never forwarded, nothing is read from the
+client's stdin.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import json
+import logging
+import os
+import socket
+import sys
+
+from six.moves import socketserver
+
+from ansible_galaxy.config import defaults
+from ansible_galaxy.utils.text import to_bytes, to_text
+
+log = logging.getLogger(__name__)
+
+# actions that always run in the calling process
+LOCAL_ACTIONS = frozenset(['daemon', 'login', 'serve'])
+
+# options that read their file from stdin when given '-'
+STDIN_SHORT_OPTIONS = ('-r',)
+STDIN_LONG_OPTIONS = ('--repo-file', '--role-file')
+
+# the loggers with a console handler (see ansible_galaxy_cli.logger.setup), whose output goes to the client
+CONSOLE_LOGGERS = ('ansible_galaxy', 'ansible_galaxy_cli')
+
+# environment variables that change how requests are made, sent with each command
+FORWARDED_ENV = tuple(name for proxy in ('http', 'https', 'ftp', 'all', 'no')
+                      for name in (proxy + '_proxy', proxy.upper() + '_PROXY')) + ('NETRC',)
+
+
+def socket_path(path=None):
+    return os.path.expanduser(path or defaults.DEFAULT_DAEMON_SOCKET_PATH)
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def _reads_stdin(args):
+    """True if args give '-' (stdin) to one of the STDIN_*_OPTIONS"""
+    for arg, value in zip(args, list(args[1:]) + [None]):
+        if arg.startswith('--') and '=' in arg:
+            arg, value = arg.split('=', 1)
+        elif arg[:2] in STDIN_SHORT_OPTIONS and len(arg) > 2:
+            arg, value = arg[:2], arg[2:]
+        if value != '-':
+            continue
+        # optparse accepts any unambiguous prefix of a long option
+        if arg in STDIN_SHORT_OPTIONS or (len(arg) > 2 and any(option.startswith(arg) for option in STDIN_LONG_OPTIONS)):
+            return True
+    return False
+
+
+def forward(args, path=None):
+    """Run the command args in the daemon, printing what it prints
+
+    :returns: the command's exit code, or None if there is no daemon to run it
+    """
+    path = socket_path(path)
+    if LOCAL_ACTIONS.intersection(args[1:]) or _reads_stdin(args[1:]) or not os.path.exists(path):
+        return None
+
+    try:
+        sock = _connect(path)
+    except socket.error as e:
+        log.debug('daemon socket %s is not answering (%s), running locally', path, e)
+        return None
+
+    stdout, stderr = sys.stdout, sys.stderr
+    try:
+        env = dict((name, os.environ[name]) for name in FORWARDED_ENV if name in os.environ)
+        sock.sendall(to_bytes(json.dumps({'args': list(args), 'cwd': os.getcwd(), 'env': env})) + b'\n')
+        for line in sock.makefile('rb'):
+            message = json.loads(to_text(line))
+            if 'exit' in message:
+                return message['exit']
+            stream = stderr if 'stderr' in message else stdout
+            stream.write(message.get('stderr', message.get('stdout')))
+            stream.flush()
+    finally:
+        sock.close()
+
+    stderr.write('the daemon at %s exited before the command finished\n' % path)
+    return os.EX_SOFTWARE
+
+
+class _MessageWriter(object):
+    """A file like object that sends what is written to it to the client, as {name: text} lines"""
+
+    def __init__(self, wfile, name):
+        self.wfile = wfile
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.wfile.write(to_bytes(json.dumps({self.name: to_text(text)})) + b'\n')
+
+    def flush(self):
+        self.wfile.flush()
+
+    def isatty(self):
+        return False
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(to_text(self.rfile.readline()))
+        except ValueError as e:
+            log.warning('ignoring a request that is not json: %s', e)
+            return
+
+        exit_code = self.server.run_request(request['args'], request.get('cwd'), request.get('env'),
+                                            _MessageWriter(self.wfile, 'stdout'), _MessageWriter(self.wfile, 'stderr'))
+        try:
+            self.wfile.write(to_bytes(json.dumps({'exit': exit_code})) + b'\n')
+        except socket.error as e:
+            log.debug('client went away before the exit code was sent: %s', e)
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """Run commands sent over a unix socket with run(args), one at a time
+
+    They are not run in threads, stdout, stderr and the working directory belong to the whole process.
+    """
+
+    def __init__(self, path, run):
+        self.run = run
+        socketserver.UnixStreamServer.__init__(self, path, DaemonRequestHandler, bind_and_activate=False)
+        old_umask = os.umask(0o177)
+        try:
+            self.server_bind()
+        finally:
+            os.umask(old_umask)
+        self.server_activate()
+
+    def run_request(self, args, cwd, env, stdout, stderr):
+        """Run args in cwd, with the FORWARDED_ENV variables set as they are in env (None leaves them alone)"""
+        log.info('running %s in %s', args, cwd)
+        old_cwd = os.getcwd()
+        old_env = dict((name, os.environ.get(name)) for name in FORWARDED_ENV)
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        console_handlers = _swap_console_handlers(stderr)
+        try:
+            if env is not None:
+                _set_env(dict((name, env.get(name)) for name in FORWARDED_ENV))
+            if cwd:
+                os.chdir(cwd)
+            exit_code = self.run(args)
+        except SystemExit as e:
+            # optparse exits on bad options and --help
+            exit_code = e.code
+        except Exception as e:
+            log.exception(e)
+            stderr.write('%s\n' % e)
+            exit_code = os.EX_SOFTWARE
+        finally:
+            _restore_console_handlers(console_handlers)
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+            os.chdir(old_cwd)
+            _set_env(old_env)
+        return exit_code or 0
+
+
+def _is_console_handler(handler):
+    return isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)
+
+
+def _swap_console_handlers(stream):
+    """Send the console output of the CONSOLE_LOGGERS to stream instead of the daemon's stderr
+
+    The new handlers log at the level and in the format of the console handlers they replace.
+
+    :returns: what _restore_console_handlers() needs to undo it
+    """
+    swapped = []
+    for name in CONSOLE_LOGGERS:
+        logger = logging.getLogger(name)
+        console_handlers = [handler for handler in logger.handlers if _is_console_handler(handler)]
+        client_handler = logging.StreamHandler(stream)
+        if console_handlers:
+            client_handler.setLevel(console_handlers[0].level)
+            client_handler.setFormatter(console_handlers[0].formatter)
+        else:
+            client_handler.setLevel(logging.WARNING)
+        for handler in console_handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(client_handler)
+        swapped.append((logger, client_handler, console_handlers))
+    return swapped
+
+
+def _restore_console_handlers(swapped):
+    for logger, client_handler, console_handlers in swapped:
+        logger.removeHandler(client_handler)
+        for handler in console_handlers:
+            logger.addHandler(handler)
+
+
+def _set_env(env):
+    """Set each variable in env, unsetting the ones that are None"""
+    for name, value in env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+def _remove_stale_socket(path):
+    """Remove the socket at path if no daemon is listening on it"""
+    if not os.path.exists(path):
+        return
+    try:
+        _connect(path).close()
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+        os.unlink(path)
+        return
+    raise socket.error(errno.EADDRINUSE, 'a daemon is already running on %s' % path)
+
+
+def serve(run, path=None):
+    """Run commands sent to the socket at path with run(args) until interrupted"""
+    path = socket_path(path)
+    parent = os.path.dirname(path)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent)
+    _remove_stale_socket(path)
+
+    server = DaemonServer(path, run)
+    log.info('daemon listening on %s', path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+    return server
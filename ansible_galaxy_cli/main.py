@@ -3,22 +3,18 @@ import os
 import sys
 
 from ansible_galaxy import exceptions
+from ansible_galaxy_cli import daemon
 from ansible_galaxy_cli.logger.setup import setup_default
-from ansible_galaxy_cli.cli import galaxy
 from ansible_galaxy_cli import exceptions as cli_exceptions
 
 log = logging.getLogger(__name__)
 
 
-def main(args=None):
-    setup_default()
-
-    args = args or sys.argv[:]
-
-    # import logging_tree
-    # logging_tree.printout()
+def run(args):
+    """Parse and run one command, and return its exit code"""
+    # imported here, so a command forwarded to the daemon doesn't pay for it
+    from ansible_galaxy_cli.cli import galaxy
 
-    log.debug('args: %s', args)
     cli = galaxy.GalaxyCLI(args)
     try:
         cli.parse()
@@ -37,3 +33,20 @@ def main(args=None):
 
     # do any return code setup we need here
     return exit_code
+
+
+def main(args=None):
+    args = args or sys.argv[:]
+
+    # a running daemon does the work, and already has logging set up
+    exit_code = daemon.forward(args)
+    if exit_code is not None:
+        return exit_code
+
+    setup_default()
+
+    # import logging_tree
+    # logging_tree.printout()
+
+    log.debug('args: %s', args)
+    return run(args)
@@ -0,0 +1,97 @@
+import io
+import logging
+import subprocess
+import tarfile
+import zlib
+
+import pytest
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.archive import decompress
+
+log = logging.getLogger(__name__)
+
+FILES = [('role/meta/main.yml', b'galaxy_info: {}\n'), ('role/tasks/main.yml', b'- debug: msg=hi\n' * 1000)]
+
+
+def make_tar(path, mode):
+    with tarfile.open(path, mode) as tar:
+        for name, data in FILES:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def assert_contents(tar_file):
+    assert [(m.name, tar_file.extractfile(m).read()) for m in tar_file.getmembers()] == FILES
+    # reading the first member again is a seek in the decompressed file
+    assert tar_file.extractfile(FILES[0][0]).read() == FILES[0][1]
+
+
+@pytest.mark.parametrize('mode,compression', [('w:gz', 'gzip'), ('w:xz', 'xz'), ('w:bz2', 'bzip2'), ('w:', None)])
+def test_open_tar(tmpdir, mode, compression):
+    path = make_tar(tmpdir.join('content.tar').strpath, mode)
+
+    assert decompress.detect_format(path) == compression
+    tar_file = decompress.open_tar(path)
+    assert_contents(tar_file)
+    tar_file.close()
+    assert tar_file.fileobj.closed
+
+
+@pytest.mark.parametrize('decompressor', ['zlib', 'pigz', 'isal'])
+def test_gzip_backends(tmpdir, decompressor):
+    path = make_tar(tmpdir.join('content.tar.gz').strpath, 'w:gz')
+
+    assert_contents(decompress.open_tar(path, decompressor=decompressor))
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def test_multi_member_gzip(tmpdir):
+    path = tmpdir.join('multi.gz')
+    path.write_binary(gzip_compress(b'first ') + gzip_compress(b'second') + b'\0' * 10)
+
+    dest = io.BytesIO()
+    assert decompress.decompress(path.strpath, dest, decompressor='zlib') == 'zlib'
+    assert dest.getvalue() == b'first second'
+
+
+def test_zstd(tmpdir):
+    if not (decompress.available('zstandard') or decompress.available('zstd')):
+        pytest.skip('no zstd decompressor')
+    tar_path = make_tar(tmpdir.join('content.tar').strpath, 'w:')
+    zst_path = tmpdir.join('content.tar.zst').strpath
+    if decompress.available('zstandard'):
+        import zstandard
+        with open(tar_path, 'rb') as src, open(zst_path, 'wb') as dest:
+            zstandard.ZstdCompressor().copy_stream(src, dest)
+    else:
+        subprocess.check_call(['zstd', '-q', tar_path, '-o', zst_path])
+
+    assert decompress.detect_format(zst_path) == 'zstd'
+    assert_contents(decompress.open_tar(zst_path))
+
+
+def test_choose_backend(monkeypatch):
+    monkeypatch.setattr(decompress, 'available', lambda backend: backend in ('pigz', 'zlib'))
+
+    assert decompress.choose_backend('gzip') == 'pigz'
+    assert decompress.choose_backend('gzip', 'zlib') == 'zlib'
+    # not available, or not for this format
+    assert decompress.choose_backend('gzip', 'isal') == 'pigz'
+    assert decompress.choose_backend('gzip', 'lzma') == 'pigz'
+    with pytest.raises(exceptions.GalaxyClientError, match='Unable to decompress a zstd archive'):
+        decompress.choose_backend('zstd')
+
+
+def test_not_a_tar(tmpdir):
+    path = tmpdir.join('index.html')
+    path.write('<html>Not Found</html>')
+
+    with pytest.raises(exceptions.GalaxyClientError, match='not a valid tar archive'):
+        decompress.open_tar(path.strpath)
@@ -0,0 +1,93 @@
+import errno
+import io
+import logging
+import os
+import tarfile
+
+import pytest
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.archive import extract
+
+log = logging.getLogger(__name__)
+
+
+def make_tar(tmpdir, files, symlinks=None, compression='gz'):
+    path = tmpdir.join('content.tar.%s' % compression).strpath
+    with tarfile.open(path, 'w:%s' % compression) as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o755 if name.endswith('.sh') else 0o644
+            info.mtime = 1500000000
+            tar.addfile(info, io.BytesIO(data))
+        for name, linkname in symlinks or []:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = linkname
+            tar.addfile(info)
+    return tarfile.open(path, 'r:%s' % compression)
+
+
+@pytest.mark.parametrize('compression', ['gz', ''])
+@pytest.mark.parametrize('workers,fsync', [(1, 'none'), (4, 'none'), (4, 'file'), (2, 'final')])
+def test_extract(tmpdir, workers, fsync, compression):
+    files = [('role/tasks/main.yml', b'- debug: msg=hi\n'), ('role/files/run.sh', b'#!/bin/sh\n')]
+    files += [('role/files/deep/%s/file%s' % (i % 7, i), b'x' * i) for i in range(50)]
+    tar = make_tar(tmpdir, files, symlinks=[('role/files/link', 'run.sh')], compression=compression)
+    dest = tmpdir.join('dest').strpath
+
+    members = [(member, member.name.split('/', 1)[1]) for member in tar.getmembers()]
+    written = extract.extract(tar, members, dest, workers=workers, fsync=fsync)
+
+    assert len(written) == len(files) + 1
+    for name, data in files:
+        path = os.path.join(dest, name.split('/', 1)[1])
+        assert open(path, 'rb').read() == data
+        assert os.stat(path).st_mtime == 1500000000
+    assert os.stat(os.path.join(dest, 'files/run.sh')).st_mode & 0o777 == 0o755
+    assert os.stat(os.path.join(dest, 'tasks/main.yml')).st_mode & 0o777 == 0o644
+    assert os.readlink(os.path.join(dest, 'files/link')) == 'run.sh'
+
+
+def test_extract_large_file_and_replace_symlink(tmpdir, monkeypatch):
+    monkeypatch.setattr(extract, 'MAX_BUFFERED_SIZE', 10)
+    tar = make_tar(tmpdir, [('role/big', b'y' * 100), ('role/small', b'z')])
+    dest = tmpdir.mkdir('dest')
+    # left over from an earlier install, must not be written through
+    outside = tmpdir.join('outside')
+    outside.write('keep')
+    dest.join('big').mksymlinkto(outside)
+
+    extract.extract(tar, [(member, member.name.split('/', 1)[1]) for member in tar.getmembers()], dest.strpath)
+
+    assert dest.join('big').read_binary() == b'y' * 100
+    assert not dest.join('big').islink()
+    assert outside.read() == 'keep'
+
+
+def test_unknown_fsync_policy(tmpdir):
+    with pytest.raises(exceptions.GalaxyClientError, match='Unknown fsync policy'):
+        extract.Extractor(tmpdir.strpath, fsync='sometimes')
+
+
+def test_archive_fd(tmpdir):
+    assert extract.archive_fd(make_tar(tmpdir, [('role/a', b'a')])) is None
+    plain_tar = make_tar(tmpdir, [('role/a', b'a')], compression='')
+    assert extract.archive_fd(plain_tar) == plain_tar.fileobj.fileno()
+
+
+def test_copy_range_falls_back(tmpdir, monkeypatch):
+    def unsupported(src_fd, dest_fd, offset, size):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    monkeypatch.setattr(extract, 'RANGE_COPIERS', [unsupported, extract._pread])
+    files = [('role/a', b'a' * 100000), ('role/b', b'b' * 10)]
+    tar = make_tar(tmpdir, files, compression='')
+    dest = tmpdir.join('dest')
+
+    extract.extract(tar, [(member, member.name.split('/', 1)[1]) for member in tar.getmembers()], dest.strpath, workers=1)
+
+    assert dest.join('a').read_binary() == b'a' * 100000
+    assert dest.join('b').read_binary() == b'b' * 10
+    assert extract.RANGE_COPIERS == [extract._pread]
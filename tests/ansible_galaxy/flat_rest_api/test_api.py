@@ -0,0 +1,318 @@
+import logging
+import threading
+
+import pytest
+import yaml
+
+from ansible_galaxy import exceptions
+from ansible_galaxy.flat_rest_api import api
+from ansible_galaxy.flat_rest_api import server_version
+from ansible_galaxy.models.content import ContentRepoSummary
+from ansible_galaxy.models.context import GalaxyContext
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture(autouse=True)
+def version_cache(tmpdir, monkeypatch):
+    # never read or write the real ~/.ansible/galaxy/server_versions.yml
+    cache = server_version.ServerVersionCache(path=tmpdir.join('server_versions.yml').strpath)
+    monkeypatch.setattr(api, 'SERVER_VERSION_CACHE', cache)
+    return cache
+
+
+class FauxOptions(object):
+    ignore_certs = False
+    api_server = 'http://galaxy.example.com'
+
+
+def faux_search_server(count):
+    roles = [{'username': 'user%s' % i, 'name': 'role%s' % i, 'description': 'desc %s' % i} for i in range(count)]
+    calls = []
+
+    def call_galaxy(self, url, args=None, headers=None, method=None):
+        calls.append(url)
+        params = dict(p.split('=', 1) for p in url.split('?', 1)[1].split('&') if '=' in p)
+        page_size = int(params['page_size'])
+        page = int(params.get('page', 1))
+        start = (page - 1) * page_size
+        data = {'count': count, 'results': roles[start:start + page_size], 'next_link': None}
+        if start + page_size < count:
+            data['next_link'] = '/api/v1/search/roles/?page_size=%s&page=%s' % (page_size, page + 1)
+        return data
+
+    return call_galaxy, calls
+
+
+def faux_galaxy_api(monkeypatch, count):
+    call_galaxy, calls = faux_search_server(count)
+    monkeypatch.setattr(api.GalaxyAPI, '_GalaxyAPI__call_galaxy', call_galaxy)
+
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()))
+    galaxy_api.initialized = True
+    galaxy_api.baseurl = '%s/api/v1' % galaxy_api.api_server
+    return galaxy_api, calls
+
+
+def test_search_roles_pages(monkeypatch):
+    galaxy_api, calls = faux_galaxy_api(monkeypatch, 25)
+
+    pages = list(galaxy_api.search_roles_pages('foo', page_size=10))
+
+    log.debug('calls: %s', calls)
+    assert len(pages) == 3
+    assert len(calls) == 3
+    assert [r['name'] for r in pages[-1]['results']] == ['role%s' % i for i in range(20, 25)]
+
+
+def test_search_roles_pages_offset_limit(monkeypatch):
+    galaxy_api, calls = faux_galaxy_api(monkeypatch, 25)
+
+    pages = galaxy_api.search_roles_pages('foo', offset=12, limit=5)
+    results = [role['name'] for page in pages for role in page['results']]
+
+    log.debug('calls: %s', calls)
+    assert results == ['role%s' % i for i in range(12, 17)]
+    # page_size is capped by the limit so the offset lands on page 3
+    assert 'page_size=5' in calls[0]
+    assert 'page=3' in calls[0]
+    assert len(calls) == 2
+
+
+def test_search_roles_pages_is_lazy(monkeypatch):
+    galaxy_api, calls = faux_galaxy_api(monkeypatch, 250)
+
+    pages = galaxy_api.search_roles_pages('foo')
+    assert calls == []
+
+    first_page = next(pages)
+    assert len(first_page['results']) == api.GalaxyAPI.SEARCH_PAGE_SIZE
+    assert len(calls) == 1
+
+
+def faux_content_server(sparse_fields=True, error=None):
+    content = {'id': 1, 'name': 'awx', 'role_type': 'ANS', 'github_user': 'alikins', 'github_repo': 'awx',
+               'github_branch': 'devel', 'description': 'a long description' * 100,
+               'related': {'versions': '/api/v1/content/1/versions/', 'repository': '/api/v1/repositories/1/'},
+               'summary_fields': {'tags': ['a'] * 100}}
+    calls = []
+
+    def call_galaxy(self, url, args=None, headers=None, method=None):
+        calls.append(url)
+        if error:
+            raise error
+        if 'fields=' in url and not sparse_fields:
+            raise exceptions.GalaxyHTTPError('Invalid filter field: fields', http_status=400, detail='Invalid filter field: fields')
+        return {'count': 1, 'next_link': None, 'results': [content]}
+
+    return call_galaxy, calls
+
+
+@pytest.mark.parametrize('sparse_fields', [True, False])
+def test_lookup_content_repo_summary(monkeypatch, sparse_fields):
+    call_galaxy, calls = faux_content_server(sparse_fields=sparse_fields)
+    monkeypatch.setattr(api.GalaxyAPI, '_GalaxyAPI__call_galaxy', call_galaxy)
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()))
+    galaxy_api.initialized = True
+    galaxy_api.baseurl = '%s/api/v1' % galaxy_api.api_server
+
+    summary = galaxy_api.lookup_content_repo_summary('alikins', 'awx')
+    galaxy_api.lookup_content_repo_summary('alikins', 'awx')
+
+    log.debug('calls: %s', calls)
+    assert summary == ContentRepoSummary(id=1, name='awx', role_type='ANS', github_user='alikins', github_repo='awx', github_branch='devel',
+                                         versions_url='/api/v1/content/1/versions/', repository_url='/api/v1/repositories/1/')
+    assert 'fields=id,name,role_type,github_user,github_repo,github_branch,related' in calls[0]
+    # a server that rejects the fields param is only asked once, and the repeat lookup is memoized
+    assert len(calls) == (1 if sparse_fields else 2)
+    assert galaxy_api.sparse_fields is sparse_fields
+
+
+@pytest.mark.parametrize('error', [
+    exceptions.GalaxyHTTPError('Not found.', http_status=404, detail='Not found.'),
+    exceptions.GalaxyHTTPError('HTTP Error 503: url', http_status=503),
+    exceptions.GalaxyHTTPError('Invalid filter field: owner', http_status=400, detail='Invalid filter field: owner'),
+    exceptions.GalaxyClientError('Failed to get data from the API server'),
+])
+def test_lookup_content_repo_summary_errors_keep_sparse_fields(monkeypatch, error):
+    call_galaxy, calls = faux_content_server(error=error)
+    monkeypatch.setattr(api.GalaxyAPI, '_GalaxyAPI__call_galaxy', call_galaxy)
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()))
+    galaxy_api.initialized = True
+    galaxy_api.baseurl = '%s/api/v1' % galaxy_api.api_server
+
+    with pytest.raises(exceptions.GalaxyClientError):
+        galaxy_api.lookup_content_repo_summary('alikins', 'awx')
+
+    assert len(calls) == 1
+    assert galaxy_api.sparse_fields is True
+
+
+def test_project_fields():
+    data = {'count': 2, 'results': [{'name': 'a', 'description': 'x'}, {'name': 'b'}]}
+
+    assert api.project_fields(data, ('name',)) == {'count': 2, 'results': [{'name': 'a'}, {'name': 'b'}]}
+    assert api.project_fields({'name': 'a', 'id': 1}, ('id', 'missing')) == {'id': 1}
+    assert api.project_fields(data, None) is data
+
+
+def faux_related_server(delay=None):
+    calls = []
+    lock = threading.Lock()
+
+    def call_galaxy(self, url, args=None, headers=None, method=None):
+        with lock:
+            calls.append(url)
+        if delay:
+            delay.wait(5)
+        if 'owner__username' in url:
+            return {'results': [{'id': 1, 'name': 'awx'}]}
+        return {'results': [{'version': '1.0'}], 'next_link': None}
+
+    return call_galaxy, calls
+
+
+def connected_api(monkeypatch, call_galaxy, **kwargs):
+    monkeypatch.setattr(api.GalaxyAPI, '_GalaxyAPI__call_galaxy', call_galaxy)
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()), **kwargs)
+    galaxy_api.initialized = True
+    galaxy_api.baseurl = '%s/api/v1' % galaxy_api.api_server
+    return galaxy_api
+
+
+def test_lookups_are_memoized(monkeypatch):
+    call_galaxy, calls = faux_related_server()
+    galaxy_api = connected_api(monkeypatch, call_galaxy)
+
+    assert galaxy_api.lookup_content_by_name('alikins', 'awx', 'awx', notify=False) == {'id': 1, 'name': 'awx'}
+    assert galaxy_api.lookup_content_by_name('alikins', 'awx', 'awx', notify=False) == {'id': 1, 'name': 'awx'}
+
+    versions = galaxy_api.fetch_content_related('/api/v1/content/1/versions/')
+    versions.append({'version': 'local'})
+    # the memoized page was not changed by the caller
+    assert galaxy_api.fetch_content_related('/api/v1/content/1/versions/') == [{'version': '1.0'}]
+    assert galaxy_api.fetch_content_related_many(['/api/v1/content/1/versions/', None]) == [[{'version': '1.0'}], None]
+
+    log.debug('calls: %s', calls)
+    assert len(calls) == 2
+
+    galaxy_api.clear_memo()
+    galaxy_api.lookup_content_by_name('alikins', 'awx', 'awx', notify=False)
+    assert len(calls) == 3
+
+
+def test_memo_ttl(monkeypatch):
+    call_galaxy, calls = faux_related_server()
+    galaxy_api = connected_api(monkeypatch, call_galaxy, memo_ttl=0)
+
+    galaxy_api.fetch_content_related('/api/v1/content/1/versions/')
+    galaxy_api.fetch_content_related('/api/v1/content/1/versions/')
+
+    assert len(calls) == 2
+
+
+def test_memo_expires_by_default(monkeypatch):
+    call_galaxy, calls = faux_related_server()
+    monkeypatch.setattr(api.runtime, 'GALAXY_API_MEMO_TTL', 60)
+    galaxy_api = connected_api(monkeypatch, call_galaxy)
+    now = [1000.0]
+    monkeypatch.setattr(api.time, 'time', lambda: now[0])
+
+    galaxy_api.fetch_content_related('/api/v1/content/1/versions/')
+    now[0] += 61
+    galaxy_api.fetch_content_related('/api/v1/content/1/versions/')
+
+    assert galaxy_api.memo_ttl == 60
+    assert len(calls) == 2
+
+
+def test_memo_evicts(monkeypatch):
+    call_galaxy, calls = faux_related_server()
+    monkeypatch.setattr(api.GalaxyAPI, 'MAX_MEMO_ENTRIES', 2)
+    galaxy_api = connected_api(monkeypatch, call_galaxy, memo_ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(api.time, 'time', lambda: now[0])
+
+    for i in range(3):
+        galaxy_api.fetch_content_related('/api/v1/content/%s/versions/' % i)
+    assert len(galaxy_api._memo) == 2
+
+    # expired entries are dropped by the next response memoized
+    now[0] += 61
+    galaxy_api.fetch_content_related('/api/v1/content/3/versions/')
+    assert list(galaxy_api._memo) == ['http://galaxy.example.com/api/v1/content/3/versions/?page_size=50']
+
+
+def test_concurrent_lookups_share_a_request(monkeypatch):
+    release = threading.Event()
+    call_galaxy, calls = faux_related_server(delay=release)
+    galaxy_api = connected_api(monkeypatch, call_galaxy)
+
+    results = []
+
+    def lookup():
+        results.append(galaxy_api.fetch_content_related('/api/v1/content/1/versions/'))
+
+    threads = [threading.Thread(target=lookup) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    # let the first request finish once the others are waiting on it
+    while not galaxy_api._single_flight.in_flight('http://galaxy.example.com/api/v1/content/1/versions/?page_size=50'):
+        release.wait(0.01)
+    release.wait(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[{'version': '1.0'}]] * 4
+    assert len(calls) == 1
+
+
+def test_get_shared_api(monkeypatch):
+    monkeypatch.setattr(api, '_shared_apis', {})
+
+    galaxy_api = api.get_shared_api(GalaxyContext(FauxOptions()))
+
+    assert api.get_shared_api(GalaxyContext(FauxOptions())) is galaxy_api
+
+    class OtherServerOptions(FauxOptions):
+        api_server = 'http://other.example.com'
+
+    assert api.get_shared_api(GalaxyContext(OtherServerOptions())) is not galaxy_api
+
+
+def test_token_is_read_lazily(monkeypatch):
+    tokens = []
+
+    class FauxToken(object):
+        def __init__(self):
+            tokens.append(self)
+
+    monkeypatch.setattr(api, 'GalaxyToken', FauxToken)
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()))
+
+    assert tokens == []
+    assert galaxy_api.token is galaxy_api.token
+    assert len(tokens) == 1
+
+
+def test_server_version_is_cached(monkeypatch, tmpdir):
+    probes = []
+
+    def get_server_api_version(self):
+        probes.append(self.api_server)
+        return 'v1'
+
+    def call_galaxy(self, url, args=None, headers=None, method=None):
+        return {'results': []}
+
+    monkeypatch.setattr(api.GalaxyAPI, '_get_server_api_version', get_server_api_version)
+
+    for i in range(3):
+        galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()))
+        monkeypatch.setattr(api.GalaxyAPI, '_GalaxyAPI__call_galaxy', call_galaxy)
+        galaxy_api.lookup_content_by_name('alikins', 'awx', 'awx', notify=False)
+        assert galaxy_api.baseurl == 'http://galaxy.example.com/api/v1'
+
+    assert probes == ['http://galaxy.example.com']
+    assert 'http://galaxy.example.com' in yaml.safe_load(tmpdir.join('server_versions.yml').read())
@@ -46,3 +46,56 @@ def test_parse_content_name():
 
     assert user_name == 'somedotuser.dotuser'
     assert content_name == 'testing-content'
+
+
+def test_load_install_info(tmpdir):
+    info_file = tmpdir.join('.galaxy_install_info')
+    info_file.write('version: 1.0\n')
+
+    info = content.load_install_info(info_file.strpath)
+    assert info == {'version': 1.0}
+    # changing what is returned doesn't change the cache
+    del info['version']
+    assert content.load_install_info(info_file.strpath) == {'version': 1.0}
+
+    info_file.write('version: 2.0\nsource: somewhere\n')
+    assert content.load_install_info(info_file.strpath)['version'] == 2.0
+
+
+class Options(object):
+    ignore_certs = False
+
+
+class Galaxy(object):
+    def __init__(self):
+        self.options = Options()
+        self.content_paths = [':']
+
+
+def test_galaxy_content_paths_are_lazy(tmpdir, monkeypatch):
+    monkeypatch.setattr(content.defaults, 'DEFAULT_CONTENT_PATH', [tmpdir.strpath])
+    galaxy = Galaxy()
+
+    def no_io(*args, **kwargs):
+        raise AssertionError('the filesystem was used')
+
+    with monkeypatch.context() as no_io_patch:
+        no_io_patch.setattr(content.os.path, 'isfile', no_io)
+        no_io_patch.setattr(content.os.path, 'expanduser', no_io)
+        galaxy_content = content.GalaxyContent(galaxy, 'alikins.role')
+
+    assert galaxy_content.path == tmpdir.join('roles', 'alikins.role').strpath
+    assert galaxy_content.paths == [galaxy_content.path]
+    assert galaxy.content_paths == [':']
+
+    role_path = tmpdir.join('other_roles', 'alikins.role')
+    role_path.join('meta', 'main.yml').write('dependencies: []\n', ensure=True)
+    galaxy_content = content.GalaxyContent(galaxy, 'alikins.role', path=role_path.strpath, type='all')
+    # the meta/main.yml makes it a role, even when content_type is read before path
+    assert galaxy_content.content_type == 'role'
+    assert galaxy_content._install_all_content is False
+    assert galaxy_content.path == role_path.strpath
+
+    galaxy_content = content.GalaxyContent(galaxy, 'alikins.role', path=role_path.strpath, type='all')
+    assert galaxy_content._install_all_content is False
+    assert galaxy_content.content_type == 'role'
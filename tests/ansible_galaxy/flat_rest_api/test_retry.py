@@ -0,0 +1,163 @@
+import errno
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+from six.moves.urllib.error import HTTPError, URLError
+
+from ansible_galaxy.flat_rest_api import retry
+from ansible_galaxy.flat_rest_api.transport import TransportResponse
+
+log = logging.getLogger(__name__)
+
+
+class FauxTransport(object):
+    def __init__(self, outcomes):
+        # a TransportResponse or status code to return, or an exception to raise, for each request in turn
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def _next(self, url):
+        self.requests.append(url)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, int):
+            outcome = TransportResponse(outcome, {}, b'{}', url)
+        return outcome
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None):
+        return self._next(url)
+
+    def get_many(self, request_urls, headers=None, timeout=None):
+        return [self._next(url) for url in request_urls]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(retry.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_retry_server_errors(sleeps):
+    faux_transport = FauxTransport([503, socket.timeout('timed out'), 200])
+    retrying = retry.RetryingTransport(faux_transport, policy=retry.RetryPolicy(retries=3, jitter=False))
+
+    resp = retrying.request('https://galaxy.example.com/api/v1/roles/')
+
+    assert resp.status == 200
+    assert len(faux_transport.requests) == 3
+    assert sleeps == [1.0, 2.0]
+
+
+def test_retry_gives_up(sleeps):
+    faux_transport = FauxTransport([500, 500, 500])
+    retrying = retry.RetryingTransport(faux_transport, policy=retry.RetryPolicy(retries=2, jitter=False))
+
+    assert retrying.request('https://galaxy.example.com/api/v1/roles/').status == 500
+    assert len(sleeps) == 2
+
+
+def test_no_retry(sleeps):
+    faux_transport = FauxTransport([404, 500])
+    retrying = retry.RetryingTransport(faux_transport, policy=retry.RetryPolicy(retries=2))
+
+    assert retrying.request('https://galaxy.example.com/api/v1/roles/').status == 404
+    # not a GET, so it may have been acted on
+    assert retrying.request('https://galaxy.example.com/api/v1/imports/', data='x=1', method='POST').status == 500
+    assert sleeps == []
+
+
+def test_retry_after(sleeps):
+    faux_transport = FauxTransport([TransportResponse(429, {'retry-after': '7'}, b'', 'u'), 200])
+    retrying = retry.RetryingTransport(faux_transport, policy=retry.RetryPolicy(retries=1))
+
+    assert retrying.request('https://galaxy.example.com/api/v1/roles/').status == 200
+    assert sleeps == [7.0]
+
+
+def test_github_rate_limit():
+    policy = retry.RetryPolicy(retries=1, max_rate_limit_wait=60)
+    reset = time.time() + 30
+    headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(reset))}
+
+    assert policy.should_retry_status(403, headers)
+    assert not policy.should_retry_status(403, {'X-RateLimit-Remaining': '10'})
+    assert 25 < policy.delay(1, 403, headers) <= 30
+    # too long to wait for
+    headers['X-RateLimit-Reset'] = str(int(time.time() + 3600))
+    assert policy.delay(1, 403, headers) is None
+
+
+def test_backoff_jitter():
+    policy = retry.RetryPolicy(retries=10, backoff=1.0, max_backoff=8.0)
+
+    for attempt, backoff in [(1, 1.0), (2, 2.0), (4, 8.0), (8, 8.0)]:
+        assert backoff / 2 <= policy.delay(attempt) <= backoff
+    assert policy.delay(11) is None
+
+
+def test_get_many_retries_failed_urls(sleeps):
+    faux_transport = FauxTransport([200, 502, 200])
+    retrying = retry.RetryingTransport(faux_transport, policy=retry.RetryPolicy(retries=1, jitter=False))
+
+    responses = retrying.get_many(['https://galaxy.example.com/1/', 'https://galaxy.example.com/2/'])
+
+    assert [r.status for r in responses] == [200, 200]
+    assert faux_transport.requests == ['https://galaxy.example.com/1/', 'https://galaxy.example.com/2/', 'https://galaxy.example.com/2/']
+    assert sleeps == [1.0]
+
+
+def test_retry_call(sleeps):
+    calls = []
+
+    def download():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPError('https://github.com/a/b/archive/1.0.tar.gz', 502, 'Bad Gateway', {}, None)
+        return 'archive.tar.gz'
+
+    assert retry.retry_call(download, 'https://github.com/a/b/archive/1.0.tar.gz', policy=retry.RetryPolicy(retries=1, jitter=False)) == 'archive.tar.gz'
+    assert sleeps == [1.0]
+
+    def not_found():
+        raise HTTPError('https://github.com/a/b/archive/1.0.tar.gz', 404, 'Not Found', {}, None)
+
+    with pytest.raises(HTTPError):
+        retry.retry_call(not_found, 'https://github.com/a/b/archive/1.0.tar.gz')
+
+
+def test_host_limiter():
+    limiter = retry.HostLimiter(limit=2)
+    in_flight = []
+    most = []
+    lock = threading.Lock()
+
+    def request(url):
+        with limiter.slot(url):
+            with lock:
+                in_flight.append(url)
+                most.append(sum(1 for u in in_flight if u == url))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(url)
+
+    threads = [threading.Thread(target=request, args=('https://%s.example.com/x' % host,)) for host in ('a', 'b') * 5]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(most) <= 2
+
+
+def test_is_transient():
+    assert retry.is_transient(socket.timeout('timed out'))
+    assert retry.is_transient(URLError('no route'))
+    assert retry.is_transient(socket.error(errno.ECONNRESET, 'Connection reset by peer'))
+    assert not retry.is_transient(OSError(errno.ENOSPC, 'No space left on device'))
+    assert not retry.is_transient(IOError(errno.EACCES, 'Permission denied'))
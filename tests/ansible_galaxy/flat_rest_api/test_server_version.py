@@ -0,0 +1,62 @@
+import logging
+import time
+
+import yaml
+
+from ansible_galaxy.flat_rest_api import server_version
+
+log = logging.getLogger(__name__)
+
+
+def test_server_version_cache(tmpdir):
+    path = tmpdir.join('server_versions.yml')
+    cache = server_version.ServerVersionCache(path=path.strpath, ttl=60)
+
+    assert cache.get('https://galaxy.example.com') is None
+    cache.set('https://galaxy.example.com', 'v1')
+    assert cache.get('https://galaxy.example.com') == 'v1'
+
+    # a later run reads what this one saved
+    next_run = server_version.ServerVersionCache(path=path.strpath, ttl=60)
+    assert next_run.get('https://galaxy.example.com') == 'v1'
+    assert next_run.get('https://other.example.com') is None
+
+
+def test_server_version_cache_expired(tmpdir):
+    path = tmpdir.join('server_versions.yml')
+    path.write(yaml.safe_dump({'https://galaxy.example.com': {'version': 'v1', 'checked': time.time() - 120}}))
+
+    assert server_version.ServerVersionCache(path=path.strpath, ttl=60).get('https://galaxy.example.com') is None
+    assert server_version.ServerVersionCache(path=path.strpath, ttl=600).get('https://galaxy.example.com') == 'v1'
+
+
+def test_server_version_cache_no_ttl(tmpdir):
+    path = tmpdir.join('server_versions.yml')
+    cache = server_version.ServerVersionCache(path=path.strpath, ttl=0)
+
+    cache.set('https://galaxy.example.com', 'v1')
+
+    assert cache.get('https://galaxy.example.com') == 'v1'
+    assert not path.check()
+
+
+def test_server_version_cache_bad_file(tmpdir):
+    path = tmpdir.join('server_versions.yml')
+    path.write('{not: [yaml')
+
+    cache = server_version.ServerVersionCache(path=path.strpath, ttl=60)
+
+    assert cache.get('https://galaxy.example.com') is None
+    cache.set('https://galaxy.example.com', 'v1')
+    assert yaml.safe_load(path.read())['https://galaxy.example.com']['version'] == 'v1'
+
+
+def test_server_version_cache_ttl_is_read_when_used(tmpdir, monkeypatch):
+    path = tmpdir.join('server_versions.yml')
+    path.write(yaml.safe_dump({'https://galaxy.example.com': {'version': 'v1', 'checked': time.time() - 120}}))
+    cache = server_version.ServerVersionCache(path=path.strpath)
+
+    monkeypatch.setattr(server_version.runtime, 'GALAXY_SERVER_VERSION_TTL', 60)
+    assert cache.get('https://galaxy.example.com') is None
+    monkeypatch.setattr(server_version.runtime, 'GALAXY_SERVER_VERSION_TTL', 600)
+    assert cache.get('https://galaxy.example.com') == 'v1'
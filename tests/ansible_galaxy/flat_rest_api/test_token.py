@@ -0,0 +1,19 @@
+import logging
+import os
+
+from ansible_galaxy.flat_rest_api import token
+
+log = logging.getLogger(__name__)
+
+
+def test_get_rereads_changed_file(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', tmpdir.strpath)
+    galaxy_token = token.GalaxyToken()
+    assert galaxy_token.get() is None
+
+    # a 'login' in another process saves a new token
+    token.GalaxyToken().set('abc123')
+    mtime = os.path.getmtime(galaxy_token.file)
+    os.utime(galaxy_token.file, (mtime + 10, mtime + 10))
+
+    assert galaxy_token.get() == 'abc123'
@@ -0,0 +1,179 @@
+
+import json
+import logging
+import threading
+import zlib
+
+import pytest
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from ansible_galaxy.flat_rest_api import api
+from ansible_galaxy.flat_rest_api import transport
+from ansible_galaxy.models.context import GalaxyContext
+
+log = logging.getLogger(__name__)
+
+
+class FauxOptions(object):
+    ignore_certs = False
+    api_server = 'http://galaxy.example.com'
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class JSONRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.requests.append(self.path)
+
+        if self.path.startswith('/missing'):
+            status, data = 404, {'detail': 'Not found.'}
+        elif self.path == '/old':
+            self.send_response(301)
+            self.send_header('Location', '/api/moved')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        else:
+            status, data = 200, {'path': self.path}
+
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.path.startswith('/gzip') and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.close_connections:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class JSONServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, close_connections=False):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), JSONRequestHandler)
+        self.close_connections = close_connections
+        self.connections = set()
+        self.requests = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server_address[1]
+
+
+def start_server(request, monkeypatch, close_connections=False):
+    for name in ('http_proxy', 'HTTP_PROXY', 'https_proxy', 'HTTPS_PROXY'):
+        monkeypatch.delenv(name, raising=False)
+
+    server = JSONServer(close_connections=close_connections)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+    return server
+
+
+@pytest.fixture
+def json_server(request, monkeypatch):
+    return start_server(request, monkeypatch)
+
+
+@pytest.fixture
+def closing_json_server(request, monkeypatch):
+    return start_server(request, monkeypatch, close_connections=True)
+
+
+def test_urllib_transport(json_server):
+    urllib_transport = transport.UrllibTransport()
+
+    resp = urllib_transport.request(json_server.url + '/api/')
+    assert resp.status == 200
+    assert json.loads(resp.body.decode('utf-8')) == {'path': '/api/'}
+
+    assert urllib_transport.request(json_server.url + '/missing').status == 404
+
+
+def test_pipelined_transport_reuses_connection(json_server):
+    pipelined = transport.PipelinedTransport()
+
+    for i in range(3):
+        resp = pipelined.request(json_server.url + '/api/%s' % i)
+        assert resp.status == 200
+
+    assert pipelined.request(json_server.url + '/old').url == json_server.url + '/api/moved'
+    assert pipelined.connections_opened == 1
+    assert len(json_server.connections) == 1
+    pipelined.close()
+
+
+def test_pipelined_transport_get_many(json_server):
+    pipelined = transport.PipelinedTransport(max_connections=2, pipeline_depth=4)
+    urls = [json_server.url + '/api/%s' % i for i in range(20)] + [json_server.url + '/missing']
+
+    responses = pipelined.get_many(urls)
+
+    log.debug('server connections: %s', json_server.connections)
+    assert [json.loads(r.body.decode('utf-8')).get('path') for r in responses[:-1]] == ['/api/%s' % i for i in range(20)]
+    assert responses[-1].status == 404
+    assert len(json_server.connections) == 2
+    assert len(json_server.requests) == 21
+    pipelined.close()
+
+
+def test_pipelined_transport_get_many_closing_server(closing_json_server):
+    pipelined = transport.PipelinedTransport(max_connections=1, pipeline_depth=4)
+    urls = [closing_json_server.url + '/api/%s' % i for i in range(5)]
+
+    responses = pipelined.get_many(urls)
+
+    assert [json.loads(r.body.decode('utf-8'))['path'] for r in responses] == ['/api/%s' % i for i in range(5)]
+
+
+def test_galaxy_api_get_many(json_server):
+    galaxy_api = api.GalaxyAPI(GalaxyContext(FauxOptions()), transport=transport.PipelinedTransport())
+    galaxy_api.initialized = True
+
+    data = galaxy_api.get_many([json_server.url + '/api/v1/roles/1/', json_server.url + '/api/v1/roles/2/'])
+
+    assert data == [{'path': '/api/v1/roles/1/'}, {'path': '/api/v1/roles/2/'}]
+
+
+def test_get_transport():
+    assert isinstance(transport.get_transport(), transport.UrllibTransport)
+    assert isinstance(transport.get_transport('pipelined'), transport.PipelinedTransport)
+    with pytest.raises(Exception, match='Unknown transport'):
+        transport.get_transport('carrier-pigeon')
+
+
+@pytest.mark.parametrize('transport_class', [transport.UrllibTransport, transport.PipelinedTransport])
+def test_gzip_response(json_server, transport_class):
+    resp = transport_class().request(json_server.url + '/gzip/api/')
+
+    assert json.loads(resp.body.decode('utf-8')) == {'path': '/gzip/api/'}
+    assert 'content-encoding' not in resp.headers
+
+
+def test_decode_body_deflate():
+    data = b'{"detail": "Not found."}'
+
+    assert transport.decode_body({'content-encoding': 'deflate'}, zlib.compress(data)) == data
+    raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    assert transport.decode_body({'content-encoding': 'deflate'}, raw.compress(data) + raw.flush()) == data
+    assert transport.decode_body({}, data) == data
@@ -0,0 +1,71 @@
+
+import logging
+import os
+
+from ansible_galaxy.flat_rest_api import urls
+
+log = logging.getLogger(__name__)
+
+
+def faux_ca_store(monkeypatch, tmpdir):
+    cert_dir = tmpdir.mkdir('certs')
+    cert_dir.join('some-ca.pem').write('not really a cert\n')
+    cert_dir.join('README').write('not a cert file\n')
+    monkeypatch.setattr(urls, 'get_ca_cert_paths', lambda: [cert_dir.strpath, tmpdir.join('missing').strpath])
+    return urls.CACertStore(), cert_dir
+
+
+def test_ca_cert_store_context_cached(monkeypatch, tmpdir):
+    ca_cert_store, cert_dir = faux_ca_store(monkeypatch, tmpdir)
+
+    context = ca_cert_store.context()
+    assert context is ca_cert_store.context()
+
+    # a new cert file changes the directory mtime, and the context is rebuilt
+    cert_dir.join('other-ca.crt').write('also not a cert\n')
+    os.utime(cert_dir.strpath, (1, 1))
+    assert context is not ca_cert_store.context()
+
+
+def test_ca_cert_store_bundle(monkeypatch, tmpdir):
+    ca_cert_store, cert_dir = faux_ca_store(monkeypatch, tmpdir)
+
+    bundle_path = ca_cert_store.bundle_path()
+    assert bundle_path == ca_cert_store.bundle_path()
+    with open(bundle_path) as bundle:
+        contents = bundle.read()
+    log.debug('bundle: %s', contents)
+
+    assert 'not really a cert' in contents
+    assert 'not a cert file' not in contents
+
+    ca_cert_store.cleanup()
+    assert not os.path.exists(bundle_path)
+
+
+def test_maybe_add_ssl_handler():
+    assert urls.maybe_add_ssl_handler('http://galaxy.example.com/', True) is None
+    assert urls.maybe_add_ssl_handler('https://galaxy.example.com/', False) is None
+    # validated on the real connection, no probe handler
+    assert urls.maybe_add_ssl_handler('https://galaxy.example.com/', True) is None
+
+
+def test_get_ssl_context_shared():
+    context = urls.get_ssl_context(validate_certs=False)
+    assert context is urls.get_ssl_context(validate_certs=False)
+    assert context is not urls.get_ssl_context(validate_certs=True)
+    assert urls.get_ssl_context(validate_certs=True) is urls.get_ssl_context(validate_certs=True)
+
+
+def test_tls_session_cache():
+    session_cache = urls.TLSSessionCache()
+    context = urls.get_ssl_context(validate_certs=False)
+    other_context = urls.get_ssl_context(validate_certs=True)
+    session = object()
+
+    session_cache.put(context, ('galaxy.example.com', 443), session)
+    session_cache.put(context, ('github.com', 443), None)
+
+    assert session_cache.get(context, ('galaxy.example.com', 443)) is session
+    assert session_cache.get(other_context, ('galaxy.example.com', 443)) is None
+    assert session_cache.get(context, ('github.com', 443)) is None
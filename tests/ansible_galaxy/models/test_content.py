@@ -1,6 +1,8 @@
 
 import logging
 
+import pytest
+
 from ansible_galaxy.models import content
 
 log = logging.getLogger(__name__)
@@ -54,3 +56,21 @@ def test_galaxy_content_equality():
     assert content_meta != content_meta_newer
     assert content_meta_newer != content_meta
     assert content_meta_newer == content_meta_newer_dupe
+
+
+def test_galaxy_content_meta_hash():
+    content_meta = content.GalaxyContentMeta(name='some_content', version='1.0.0')
+    content_meta_dupe = content.GalaxyContentMeta(name='some_content', version='1.0.0')
+
+    assert len(set([content_meta, content_meta_dupe])) == 1
+
+    # the hash doesn't change as the version is resolved and the path set
+    metas = set([content_meta])
+    content_meta.version = '2.0.0'
+    content_meta.path = '/dev/null/roles/some_content'
+    assert content_meta in metas
+
+    with pytest.raises(AttributeError):
+        content_meta.name = 'other_content'
+    with pytest.raises(AttributeError):
+        content_meta.some_attribute = True
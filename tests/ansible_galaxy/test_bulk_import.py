@@ -0,0 +1,72 @@
+
+import logging
+
+import pytest
+
+from ansible_galaxy import bulk_import
+from ansible_galaxy import exceptions
+
+log = logging.getLogger(__name__)
+
+
+class FauxImportAPI(object):
+    def __init__(self, fail_repos=None, failed_imports=None):
+        self.fail_repos = fail_repos or []
+        self.failed_imports = failed_imports or []
+        self.tasks = {}
+        self.polls = 0
+
+    def create_import_task(self, github_user, github_repo, reference=None, role_name=None):
+        if github_repo in self.fail_repos:
+            raise exceptions.GalaxyClientError('no such repo %s' % github_repo)
+        task_id = len(self.tasks) + 1
+        self.tasks[task_id] = github_repo
+        return [{'id': task_id, 'state': 'PENDING'}]
+
+    def get_import_task(self, task_id=None):
+        self.polls += 1
+        state = 'FAILED' if self.tasks[task_id] in self.failed_imports else 'SUCCESS'
+        return [{'id': task_id, 'state': state,
+                 'summary_fields': {'task_messages': [{'id': task_id, 'message_text': 'done'}]}}]
+
+
+def test_parse_repo_list():
+    lines = ['# a comment',
+             '',
+             'alikins some-role',
+             'alikins/other-role devel',
+             'alikins ansible-role-foo master foo']
+    repos = bulk_import.parse_repo_list(lines)
+
+    log.debug('repos: %s', repos)
+
+    assert len(repos) == 3
+    assert repos[0] == {'github_user': 'alikins', 'github_repo': 'some-role', 'reference': None, 'role_name': None}
+    assert repos[1]['github_repo'] == 'other-role'
+    assert repos[1]['reference'] == 'devel'
+    assert repos[2]['role_name'] == 'foo'
+
+
+def test_parse_repo_list_invalid():
+    with pytest.raises(exceptions.GalaxyClientError, match='Invalid import line 1'):
+        bulk_import.parse_repo_list(['just_a_user'])
+
+
+def test_bulk_importer():
+    api = FauxImportAPI(fail_repos=['missing'], failed_imports=['broken'])
+    repos = bulk_import.parse_repo_list(['alikins good', 'alikins missing', 'alikins broken'])
+    displayed = []
+
+    importer = bulk_import.BulkImporter(api, workers=2, poll_interval=0, display_callback=displayed.append)
+    importer.submit(repos)
+    results = importer.wait()
+
+    log.debug('results: %s', results)
+    log.debug('displayed: %s', displayed)
+
+    assert [r.repo for r in results] == ['alikins/good', 'alikins/missing', 'alikins/broken']
+    assert [r.repo for r in importer.succeeded] == ['alikins/good']
+    assert sorted(r.repo for r in importer.failed) == ['alikins/broken', 'alikins/missing']
+    assert importer.pending == []
+    # only the two successfully submitted tasks get polled, once each
+    assert api.polls == 2
@@ -0,0 +1,89 @@
+import logging
+
+from ansible_galaxy import catalog
+
+log = logging.getLogger(__name__)
+
+
+def role(role_id, namespace, name, description, modified, tags=None, platforms=None):
+    return {'id': role_id,
+            'name': name,
+            'description': description,
+            'modified': modified,
+            'summary_fields': {'namespace': {'name': namespace},
+                               'tags': [{'name': t} for t in tags or []],
+                               'platforms': [{'name': p} for p in platforms or []]}}
+
+
+class FauxListAPI(object):
+    def __init__(self, roles):
+        self.roles = roles
+        self.filters = []
+
+    def get_list_pages(self, what, filters=None):
+        self.filters.append(filters)
+        since = (filters or {}).get('modified__gt')
+        items = [r for r in self.roles if since is None or r['modified'] > since]
+        # two items per page
+        for i in range(0, len(items), 2):
+            yield items[i:i + 2]
+
+
+def test_sync_and_search(tmpdir):
+    api = FauxListAPI([role(1, 'alikins', 'awx', 'Install AWX', '2018-01-01', tags=['awx', 'tower'], platforms=['EL']),
+                       role(2, 'geerlingguy', 'nginx', 'Nginx for Linux', '2018-01-02', tags=['web'], platforms=['Ubuntu', 'EL']),
+                       role(3, 'geerlingguy', 'apache', 'Apache 2.x for Linux', '2018-01-03', tags=['web'])])
+    galaxy_catalog = catalog.GalaxyCatalog('http://galaxy.example.com', path=tmpdir.join('catalog.db').strpath)
+
+    assert galaxy_catalog.sync(api, kind='roles') == 3
+    assert galaxy_catalog.count('roles') == 3
+    assert galaxy_catalog.cursor_for('roles') == '2018-01-03'
+
+    res = galaxy_catalog.search_roles('linux')
+    assert res['count'] == 2
+    assert [r['name'] for r in res['results']] == ['apache', 'nginx']
+    assert res['results'][0]['username'] == 'geerlingguy'
+
+    assert galaxy_catalog.search_roles('ngi')['count'] == 1
+    assert galaxy_catalog.search_roles(None, tags='web', platforms='el')['count'] == 1
+    assert galaxy_catalog.search_roles(None, author='alikins')['results'][0]['name'] == 'awx'
+    assert [r['name'] for r in galaxy_catalog.search_roles('linux', offset=1, limit=5)['results']] == ['nginx']
+
+    assert galaxy_catalog.lookup_role_by_name('alikins.awx')['description'] == 'Install AWX'
+    assert galaxy_catalog.lookup_role_by_name('alikins.nope') is None
+
+
+def test_sync_incremental(tmpdir):
+    roles = [role(1, 'alikins', 'awx', 'Install AWX', '2018-01-01')]
+    api = FauxListAPI(roles)
+    galaxy_catalog = catalog.GalaxyCatalog('http://galaxy.example.com', path=tmpdir.join('catalog.db').strpath)
+    galaxy_catalog.sync(api, kind='roles')
+
+    roles[0] = role(1, 'alikins', 'awx', 'Install AWX and friends', '2018-02-01')
+    roles.append(role(2, 'alikins', 'other', 'Something else', '2018-02-02'))
+
+    assert galaxy_catalog.sync(api, kind='roles') == 2
+    log.debug('filters: %s', api.filters)
+    assert api.filters[-1]['modified__gt'] == '2018-01-01'
+
+    assert galaxy_catalog.count('roles') == 2
+    assert galaxy_catalog.search_roles('friends')['count'] == 1
+
+    # nothing changed since the last sync
+    assert galaxy_catalog.sync(api, kind='roles') == 0
+
+
+def test_first_search_uses_fts(tmpdir):
+    api = FauxListAPI([role(1, 'alikins', 'awx', 'Install AWX', '2018-01-01')])
+    path = tmpdir.join('catalog.db').strpath
+    galaxy_catalog = catalog.GalaxyCatalog('http://galaxy.example.com', path=path)
+    galaxy_catalog.sync(api, kind='roles')
+    fts_module = galaxy_catalog._fts_module
+    galaxy_catalog.close()
+
+    # a fresh catalog, as 'search --offline' makes
+    galaxy_catalog = catalog.GalaxyCatalog('http://galaxy.example.com', path=path)
+    # fts matches prefixes of words, the LIKE fallback matches anywhere in them
+    assert galaxy_catalog.search_roles('wx')['count'] == (0 if fts_module else 1)
+    assert galaxy_catalog._fts_module == fts_module
+    galaxy_catalog.close()
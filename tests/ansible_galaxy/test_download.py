@@ -0,0 +1,152 @@
+import errno
+import logging
+import re
+import threading
+
+import pytest
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from ansible_galaxy import download
+from ansible_galaxy.flat_rest_api import retry
+
+log = logging.getLogger(__name__)
+
+ARCHIVE = bytes(bytearray(i % 251 for i in range(100000)))
+
+
+class ArchiveRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get('Range')
+        server.requests.append(range_header)
+
+        etag = server.etags.pop(0) if len(server.etags) > 1 else server.etags[0]
+        match = re.match(r'bytes=(\d+)-(\d+)$', range_header or '')
+        if_range = self.headers.get('If-Range')
+        if match and server.ranges and (if_range is None or if_range == etag):
+            first, last = int(match.group(1)), min(int(match.group(2)), len(server.archive) - 1)
+            body = server.archive[first:last + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (first, last, len(server.archive)))
+        else:
+            body = server.archive
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ArchiveServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, archive, ranges=True, etags=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), ArchiveRequestHandler)
+        self.archive = archive
+        self.ranges = ranges
+        # the etag of each response in turn, the last one is repeated
+        self.etags = list(etags or ['"v1"'])
+        self.requests = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s/archive.tar.gz' % self.server_address[1]
+
+
+@pytest.fixture
+def archive_server(request, monkeypatch):
+    for name in ('http_proxy', 'HTTP_PROXY'):
+        monkeypatch.delenv(name, raising=False)
+
+    def start(**kwargs):
+        server = ArchiveServer(ARCHIVE, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+        thread.daemon = True
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+        request.addfinalizer(stop)
+        return server
+    return start
+
+
+def test_split():
+    assert download.split(10, 3) == [(0, 3), (4, 7), (8, 9)]
+    assert download.split(10, 4, min_segment_size=4) == [(0, 4), (5, 9)]
+    assert download.split(3, 4, min_segment_size=4) == [(0, 2)]
+
+
+def test_segmented_download(archive_server, tmpdir):
+    server = archive_server()
+    path = tmpdir.join('archive.tar.gz').strpath
+
+    written = download.Downloader(segments=4, min_size=10000).download(server.url, path)
+
+    assert written == len(ARCHIVE)
+    assert open(path, 'rb').read() == ARCHIVE
+    assert len(server.requests) == 4
+    assert server.requests[0] == 'bytes=0-9999'
+
+
+def test_no_range_support(archive_server, tmpdir):
+    server = archive_server(ranges=False)
+    path = tmpdir.join('archive.tar.gz').strpath
+
+    download.Downloader(segments=4, min_size=10000).download(server.url, path)
+
+    assert open(path, 'rb').read() == ARCHIVE
+    assert len(server.requests) == 1
+
+
+def test_small_file_one_request(archive_server, tmpdir):
+    server = archive_server()
+    path = tmpdir.join('archive.tar.gz').strpath
+
+    download.Downloader(segments=4, min_size=len(ARCHIVE) * 2).download(server.url, path)
+
+    assert open(path, 'rb').read() == ARCHIVE
+    assert len(server.requests) == 1
+
+
+def test_changed_during_download(archive_server, tmpdir):
+    # the archive changes after the first request, so the segments get 200s
+    server = archive_server(etags=['"v1"', '"v2"'])
+    path = tmpdir.join('archive.tar.gz').strpath
+
+    download.Downloader(segments=4, min_size=10000).download(server.url, path)
+
+    assert open(path, 'rb').read() == ARCHIVE
+    # starting over as one stream
+    assert server.requests[-1] is None
+
+
+@pytest.mark.parametrize('segments', [1, 4])
+def test_disk_full_is_not_retried(archive_server, tmpdir, monkeypatch, segments):
+    server = archive_server()
+    path = tmpdir.join('archive.tar.gz').strpath
+    sleeps = []
+    monkeypatch.setattr(retry.time, 'sleep', sleeps.append)
+
+    def disk_full(*args, **kwargs):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(download.shutil, 'copyfileobj', disk_full)
+    monkeypatch.setattr(download.Downloader, '_write_segment', disk_full)
+
+    with pytest.raises(OSError) as exc_info:
+        download.Downloader(segments=segments, min_size=10000, policy=retry.RetryPolicy(retries=3)).download(server.url, path)
+
+    assert exc_info.value.errno == errno.ENOSPC
+    assert sleeps == []
+    # each segment was asked for once, and there was no fallback to one stream
+    assert None not in server.requests[1:]
+    assert len(server.requests) == (1 if segments == 1 else 4)
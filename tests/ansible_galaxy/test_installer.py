@@ -0,0 +1,155 @@
+import logging
+import os
+import tarfile
+
+import pytest
+import yaml
+
+from ansible_galaxy import installer
+from ansible_galaxy.flat_rest_api import content
+
+log = logging.getLogger(__name__)
+
+
+class Galaxy(object):
+    def __init__(self, options):
+        self.options = options
+        self.content_paths = []
+
+
+@pytest.fixture
+def content_path(tmpdir, monkeypatch):
+    path = tmpdir.join('content').strpath
+    monkeypatch.setattr(content.defaults, 'DEFAULT_CONTENT_PATH', [path])
+    return path
+
+
+def _role_archive(tmpdir, name='myrole', dependencies=None):
+    role_dir = tmpdir.mkdir('src_%s' % name).mkdir('%s-1.0' % name)
+    role_dir.join('meta', 'main.yml').write(yaml.safe_dump({'galaxy_info': {'author': 'me'}, 'dependencies': dependencies or []}),
+                                            ensure=True)
+    role_dir.join('tasks', 'main.yml').write('- debug: msg=hi\n', ensure=True)
+    archive = tmpdir.join('%s.tar.gz' % name).strpath
+    with tarfile.open(archive, 'w:gz') as tar_file:
+        tar_file.add(role_dir.strpath, arcname='%s-1.0' % name)
+    return archive
+
+
+def _installer(**kwargs):
+    events = []
+    galaxy = Galaxy(installer.InstallOptions(**kwargs))
+    return installer.Installer(galaxy, progress_callback=events.append), events
+
+
+def test_install_options_unknown():
+    assert installer.InstallOptions(force=True).force is True
+
+    with pytest.raises(TypeError):
+        installer.InstallOptions(frce=True)
+
+
+def test_install(tmpdir, content_path):
+    archive = _role_archive(tmpdir)
+    galaxy_installer, events = _installer()
+
+    results = galaxy_installer.install([archive + ',,myrole'])
+
+    assert [(r.name, r.status, r.required_by) for r in results] == [('myrole', installer.INSTALLED, None)]
+    assert results[0].path.startswith(content_path)
+    assert [e.kind for e in events] == [installer.INSTALLED]
+
+    # installing it again skips it, forcing replaces it
+    results = galaxy_installer.install([{'src': archive, 'name': 'myrole'}])
+    assert results[0].status == installer.SKIPPED
+
+    galaxy_installer, events = _installer(force=True)
+    results = galaxy_installer.install([archive + ',,myrole'])
+    assert results[0].status == installer.INSTALLED
+    assert [e.kind for e in events] == [installer.CHANGING, installer.INSTALLED]
+    assert events[0].message == '- changing role myrole from  to unspecified'
+
+
+def test_install_only(tmpdir, content_path):
+    specs = [_role_archive(tmpdir, 'first') + ',,first', _role_archive(tmpdir, 'second') + ',,second']
+    galaxy_installer, events = _installer()
+
+    results = galaxy_installer.install(specs, only=['second'])
+
+    assert [(r.name, r.status) for r in results] == [('first', installer.SKIPPED), ('second', installer.INSTALLED)]
+
+
+def test_install_dependencies(tmpdir, content_path):
+    common = _role_archive(tmpdir, 'common') + ',,alikins.common'
+    specs = [_role_archive(tmpdir, 'first', [common]) + ',,first', _role_archive(tmpdir, 'second', [common]) + ',,second']
+    galaxy_installer, events = _installer()
+
+    results = galaxy_installer.install(specs)
+
+    assert [(r.name, r.status, r.required_by) for r in results] == [
+        ('first', installer.INSTALLED, None),
+        ('second', installer.INSTALLED, None),
+        ('alikins.common', installer.INSTALLED, 'first'),
+    ]
+    assert [e.message for e in events if e.kind == installer.DEPENDENCY] == ['- adding dependency: alikins.common role',
+                                                                             '- dependency alikins.common already pending installation.']
+
+
+def test_install_failed(tmpdir, content_path):
+    archive = tmpdir.join('broken.tar.gz')
+    archive.write('not a tar file')
+    galaxy_installer, events = _installer()
+
+    results = galaxy_installer.install([archive.strpath + ',,broken'])
+
+    assert results[0].status == installer.FAILED
+    assert results[0].error is not None
+    assert events[-1].kind == installer.FAILED
+    assert events[-1].level == 'warning'
+
+
+def test_install_roles_paths(tmpdir, content_path, monkeypatch):
+    archive = _role_archive(tmpdir)
+    roles_paths = [tmpdir.join('project%s' % i, 'roles').strpath for i in range(3)]
+
+    # the second project has it already
+    galaxy_installer, events = _installer(roles_path=roles_paths[1:2])
+    assert galaxy_installer.install([archive + ',,myrole'])[0].status == installer.INSTALLED
+
+    fetched = []
+    fetch_archive = content.GalaxyContent.fetch_archive
+
+    def counting_fetch_archive(self):
+        fetched.append(self.name)
+        return fetch_archive(self)
+
+    monkeypatch.setattr(content.GalaxyContent, 'fetch_archive', counting_fetch_archive)
+    galaxy_installer, events = _installer(roles_path=roles_paths)
+    results = galaxy_installer.install([archive + ',,myrole'])
+
+    assert fetched == ['myrole']
+    assert [r.status for r in results] == [installer.INSTALLED, installer.SKIPPED, installer.INSTALLED]
+    assert [r.path for r in results] == [os.path.join(roles_path, 'myrole') for roles_path in roles_paths]
+    for roles_path in roles_paths:
+        assert os.path.isfile(os.path.join(roles_path, 'myrole', 'tasks', 'main.yml'))
+    assert not os.path.exists(content_path)
+
+
+def test_install_removes_unused_scm_archives(tmpdir, content_path, monkeypatch):
+    archive = _role_archive(tmpdir)
+    roles_path = tmpdir.join('project', 'roles').strpath
+    galaxy_installer, events = _installer(roles_path=[roles_path])
+    galaxy_installer.install([archive + ',,myrole'])
+
+    scm_archive = tmpdir.join('prefetched.tar')
+    scm_archive.write('')
+
+    def prefetch_scm_archives(contents):
+        for galaxy_content in contents:
+            galaxy_content.scm_archive = scm_archive.strpath
+
+    # already installed in the roles path, so the prefetched archive isn't used
+    galaxy_installer, events = _installer(roles_path=[roles_path])
+    monkeypatch.setattr(galaxy_installer, 'prefetch_scm_archives', prefetch_scm_archives)
+    assert galaxy_installer.install([archive + ',,myrole'])[0].status == installer.SKIPPED
+
+    assert not scm_archive.check()
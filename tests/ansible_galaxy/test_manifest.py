@@ -0,0 +1,73 @@
+import logging
+import os
+
+from ansible_galaxy import manifest
+
+log = logging.getLogger(__name__)
+
+
+def _role(tmpdir):
+    role_dir = tmpdir.mkdir('myrole')
+    role_dir.join('tasks', 'main.yml').write('- debug: msg=hi\n', ensure=True)
+    role_dir.join('meta', 'main.yml').write('dependencies: []\n', ensure=True)
+    role_dir.join('meta', '.galaxy_install_info').write('version: 1.0\n')
+    os.symlink('main.yml', role_dir.join('tasks', 'link.yml').strpath)
+    return role_dir
+
+
+def test_build(tmpdir):
+    role_dir = _role(tmpdir)
+
+    files = manifest.build(role_dir.strpath, exclude=['meta/.galaxy_install_info'])
+
+    assert sorted(files) == ['meta/main.yml', 'tasks/link.yml', 'tasks/main.yml']
+    assert files['tasks/link.yml'] == {'link': 'main.yml'}
+    assert files['tasks/main.yml']['size'] == 16
+    assert files['tasks/main.yml']['sha256'] == manifest.file_checksum(role_dir.join('tasks', 'main.yml').strpath)
+
+
+def test_verify(tmpdir):
+    role_dir = _role(tmpdir)
+    exclude = ['meta/.galaxy_install_info']
+    files = manifest.build(role_dir.strpath, exclude=exclude)
+
+    assert manifest.verify(role_dir.strpath, files, exclude=exclude) == []
+
+    role_dir.join('meta', 'main.yml').remove()
+    role_dir.join('tasks', 'extra.yml').write('')
+    role_dir.join('tasks', 'link.yml').remove()
+    os.symlink('extra.yml', role_dir.join('tasks', 'link.yml').strpath)
+
+    assert manifest.verify(role_dir.strpath, files, exclude=exclude) == [
+        manifest.Drift('meta/main.yml', manifest.MISSING),
+        manifest.Drift('tasks/extra.yml', manifest.ADDED),
+        manifest.Drift('tasks/link.yml', manifest.MODIFIED),
+    ]
+
+
+def test_verify_mtime_fast_path(tmpdir):
+    role_dir = _role(tmpdir)
+    main_yml = role_dir.join('tasks', 'main.yml')
+    files = manifest.build(role_dir.strpath)
+    mtime = files['tasks/main.yml']['mtime']
+
+    # same size and mtime, only a full check hashes it
+    main_yml.write('- debug: msg=ho\n')
+    os.utime(main_yml.strpath, (mtime, mtime))
+    assert manifest.verify(role_dir.strpath, files) == []
+    assert manifest.verify(role_dir.strpath, files, full=True) == [manifest.Drift('tasks/main.yml', manifest.MODIFIED)]
+
+    # a new mtime gets it hashed, and a touched but unchanged file is fine
+    main_yml.write('- debug: msg=hi\n')
+    os.utime(main_yml.strpath, (mtime + 10, mtime + 10))
+    assert manifest.verify(role_dir.strpath, files) == []
+
+
+def test_verify_all(tmpdir):
+    roles = [_role(tmpdir.mkdir(str(i))) for i in range(3)]
+    items = [(role_dir.strpath, manifest.build(role_dir.strpath)) for role_dir in roles]
+    roles[1].join('tasks', 'main.yml').write('- debug: msg=changed, and longer\n')
+
+    results = manifest.verify_all(items, workers=2)
+
+    assert results == [[], [manifest.Drift('tasks/main.yml', manifest.MODIFIED)], []]
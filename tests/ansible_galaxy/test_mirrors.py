@@ -0,0 +1,79 @@
+import logging
+
+import pytest
+
+from ansible_galaxy import exceptions
+from ansible_galaxy import mirrors
+from ansible_galaxy.flat_rest_api import retry
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_URL = 'https://github.com/alikins/awx/archive/1.0.tar.gz'
+
+
+def test_mirror_source():
+    assert mirrors.mirror_source('https://artifacts.example.com/galaxy/', ARCHIVE_URL) == \
+        'https://artifacts.example.com/galaxy/github.com/alikins/awx/archive/1.0.tar.gz'
+    assert mirrors.mirror_source('/srv/mirror', ARCHIVE_URL) == '/srv/mirror/github.com/alikins/awx/archive/1.0.tar.gz'
+    assert mirrors.mirror_source('/srv/mirror', 'https://github.com/alikins/../../etc/passwd') is None
+    assert mirrors.mirror_source('/srv/mirror', '/tmp/local.tar.gz') is None
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    requests = []
+
+    def download(self, url, path):
+        requests.append(url)
+        with open(path, 'wb') as f:
+            f.write(b'upstream archive')
+
+    monkeypatch.setattr(mirrors.Downloader, 'download', download)
+    return requests
+
+
+def test_fetch_from_mirror_dir(tmpdir, upstream):
+    empty_mirror = tmpdir.mkdir('empty')
+    mirror = tmpdir.mkdir('mirror')
+    mirror.join('github.com', 'alikins', 'awx', 'archive', '1.0.tar.gz').write(b'mirrored archive', ensure=True)
+
+    sources = mirrors.ArchiveSources(mirrors=[empty_mirror.strpath, 'file://%s' % mirror.strpath])
+    path, source = sources.fetch(ARCHIVE_URL)
+
+    assert open(path, 'rb').read() == b'mirrored archive'
+    assert source == 'file://%s/github.com/alikins/awx/archive/1.0.tar.gz' % mirror.strpath
+    assert upstream == []
+
+
+def test_fetch_fails_over_to_upstream(tmpdir, upstream):
+    sources = mirrors.ArchiveSources(mirrors=[tmpdir.strpath])
+    path, source = sources.fetch(ARCHIVE_URL)
+
+    assert open(path, 'rb').read() == b'upstream archive'
+    assert source == ARCHIVE_URL
+    assert upstream == [ARCHIVE_URL]
+
+
+def test_fetch_fails(monkeypatch):
+    def download(self, url, path):
+        raise IOError('unreachable')
+
+    monkeypatch.setattr(mirrors.Downloader, 'download', download)
+    sources = mirrors.ArchiveSources(mirrors=['https://artifacts.example.com'], policy=retry.RetryPolicy(retries=0))
+
+    with pytest.raises(exceptions.GalaxyClientError, match='from any source'):
+        sources.fetch(ARCHIVE_URL)
+
+
+def test_fastest_source_first(monkeypatch):
+    latencies = {'https://near.example.com/github.com/alikins/awx/archive/1.0.tar.gz': 0.01,
+                 'https://far.example.com/github.com/alikins/awx/archive/1.0.tar.gz': 0.5,
+                 ARCHIVE_URL: 0.2}
+    monkeypatch.setattr(mirrors, 'probe', lambda source, **kwargs: latencies.get(source, None))
+
+    sources = mirrors.ArchiveSources(mirrors=['https://far.example.com', 'https://down.example.com', 'https://near.example.com'], fastest=True)
+
+    assert sources.sources(ARCHIVE_URL) == ['https://near.example.com/github.com/alikins/awx/archive/1.0.tar.gz',
+                                            ARCHIVE_URL,
+                                            'https://far.example.com/github.com/alikins/awx/archive/1.0.tar.gz',
+                                            'https://down.example.com/github.com/alikins/awx/archive/1.0.tar.gz']
@@ -0,0 +1,117 @@
+
+import logging
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+from ansible_galaxy import exceptions
+from ansible_galaxy import scm
+
+log = logging.getLogger(__name__)
+
+
+def git(repo_dir, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+               GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+    return subprocess.check_output(('git',) + args, cwd=repo_dir, env=env).decode('utf-8').strip()
+
+
+@pytest.fixture
+def git_repo(tmpdir):
+    repo_dir = tmpdir.mkdir('some-role').strpath
+    git(repo_dir, 'init', '--quiet')
+    with open(os.path.join(repo_dir, 'README'), 'w') as f:
+        f.write('v1')
+    git(repo_dir, 'add', 'README')
+    git(repo_dir, 'commit', '--quiet', '-m', 'first')
+    git(repo_dir, 'tag', 'v1.0')
+    with open(os.path.join(repo_dir, 'README'), 'w') as f:
+        f.write('v2')
+    git(repo_dir, 'commit', '--quiet', '-am', 'second')
+    return repo_dir
+
+
+def readme(archive_path):
+    with tarfile.open(archive_path) as tar_file:
+        return tar_file.extractfile('some-role/README').read()
+
+
+def test_archive_tag_and_head(git_repo, tmpdir):
+    cache_path = tmpdir.join('cache').strpath
+    src = 'file://%s' % git_repo
+
+    archive_path = scm.archive(src, name='some-role', version='v1.0', cache_path=cache_path)
+    assert readme(archive_path) == b'v1'
+    os.unlink(archive_path)
+
+    archive_path = scm.archive(src, name='some-role', version='HEAD', cache_path=cache_path)
+    assert readme(archive_path) == b'v2'
+    os.unlink(archive_path)
+
+    # one bare mirror for the url, and its lock file
+    repo_dir_name = os.path.basename(scm.ScmCache(cache_path).repo_dir('git', src))
+    assert sorted(os.listdir(os.path.join(cache_path, 'git'))) == [repo_dir_name, repo_dir_name + '.lock']
+
+
+@pytest.mark.parametrize('ref', ['tag', 'branch'])
+def test_archive_hex_named_ref(git_repo, tmpdir, ref):
+    cache_path = tmpdir.join('cache').strpath
+    src = 'file://%s' % git_repo
+    if ref == 'tag':
+        git(git_repo, 'tag', 'deadbeef', 'v1.0')
+    else:
+        git(git_repo, 'branch', 'deadbeef', 'v1.0')
+
+    # looks like a commit id, but isn't one
+    archive_path = scm.archive(src, name='some-role', version='deadbeef', cache_path=cache_path)
+    assert readme(archive_path) == b'v1'
+    os.unlink(archive_path)
+
+
+def test_archive_repo_dir_made_by_another_process(git_repo, tmpdir):
+    cache_path = tmpdir.join('cache').strpath
+    src = 'file://%s' % git_repo
+    # another process made the dir, but hasn't run git init in it yet
+    os.makedirs(scm.ScmCache(cache_path).repo_dir('git', src))
+
+    archive_path = scm.archive(src, name='some-role', version='v1.0', cache_path=cache_path)
+    assert readme(archive_path) == b'v1'
+    os.unlink(archive_path)
+
+
+def test_archive_cached_commit(git_repo, tmpdir):
+    cache_path = tmpdir.join('cache').strpath
+    src = 'file://%s' % git_repo
+    commit = git(git_repo, 'rev-parse', 'HEAD~1')
+
+    os.unlink(scm.archive(src, name='some-role', version='master', cache_path=cache_path))
+    os.unlink(scm.archive(src, name='some-role', version='v1.0', cache_path=cache_path))
+
+    # the commit is in the cache now, so it is archived without the source repo
+    os.rename(git_repo, git_repo + '.moved')
+    archive_path = scm.archive(src, name='some-role', version=commit, cache_path=cache_path)
+    assert readme(archive_path) == b'v1'
+    os.unlink(archive_path)
+
+
+def test_archive_many(git_repo, tmpdir):
+    cache_path = tmpdir.join('cache').strpath
+    src = 'file://%s' % git_repo
+    specs = [{'src': src, 'scm': 'git', 'name': 'some-role', 'version': 'v1.0'},
+             {'src': src, 'scm': 'git', 'name': 'some-role', 'version': 'no-such-branch'}]
+
+    results = scm.archive_many(specs, cache_path=cache_path)
+    log.debug('results: %s', results)
+
+    assert readme(results[0][0]) == b'v1'
+    assert results[0][1] is None
+    assert results[1][0] is None
+    assert isinstance(results[1][1], exceptions.GalaxyClientError)
+    os.unlink(results[0][0])
+
+
+def test_archive_unsupported_scm():
+    with pytest.raises(exceptions.GalaxyClientError, match='svn is not currently supported'):
+        scm.archive('http://example.com/repo', scm='svn', name='repo')
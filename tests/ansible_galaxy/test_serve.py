@@ -0,0 +1,142 @@
+
+import io
+import json
+import logging
+
+from ansible_galaxy import serve
+
+log = logging.getLogger(__name__)
+
+
+class FauxInfo(dict):
+    pass
+
+
+class FauxResponse(io.BytesIO):
+    def __init__(self, body, content_type='application/json'):
+        super(FauxResponse, self).__init__(body)
+        self._info = FauxInfo({'Content-Type': content_type})
+
+    def getcode(self):
+        return 200
+
+    def info(self):
+        return self._info
+
+
+def faux_proxy(tmpdir, responses, **kwargs):
+    galaxy_proxy = serve.GalaxyProxy('https://galaxy.example.com/', store_path=tmpdir.strpath, **kwargs)
+    urls = []
+
+    def upstream_open(url, **kwargs):
+        urls.append(url)
+        galaxy_proxy.upstream_requests += 1
+        return responses[url](**kwargs)
+
+    galaxy_proxy._upstream_open = upstream_open
+    return galaxy_proxy, urls
+
+
+def test_get_api_rewrites_and_caches(tmpdir):
+    data = {'results': [{'name': 'awx', 'external_url': 'https://github.com/alikins/awx/archive/1.0.tar.gz'},
+                        {'name': 'other', 'external_url': None, 'github_user': 'alikins', 'github_repo': 'other'}]}
+    responses = {'https://galaxy.example.com/api/v1/roles/': lambda **kwargs: FauxResponse(json.dumps(data).encode('utf-8'))}
+    galaxy_proxy, urls = faux_proxy(tmpdir, responses)
+
+    response = galaxy_proxy.get_api('/api/v1/roles/', 'http://localhost:8080')
+    results = json.loads(response.body.decode('utf-8'))['results']
+
+    assert response.status == 200
+    assert results[0]['external_url'] == 'http://localhost:8080/archives/github.com/alikins/awx/archive/1.0.tar.gz'
+    assert results[1]['external_url'] == 'http://localhost:8080/archives/github.com/alikins/other'
+
+    galaxy_proxy.get_api('/api/v1/roles/', 'http://localhost:8080')
+    assert len(urls) == 1
+
+
+def test_get_archive_stores(tmpdir):
+    responses = {'https://github.com/alikins/awx/archive/1.0.tar.gz': lambda **kwargs: FauxResponse(b'archive bytes')}
+    galaxy_proxy, urls = faux_proxy(tmpdir, responses)
+    galaxy_proxy.proxy_archive_url('https://github.com/alikins/awx', 'http://localhost:8080')
+
+    response = galaxy_proxy.get_archive('github.com/alikins/awx/archive/1.0.tar.gz')
+    assert response.status == 200
+    with open(response.path, 'rb') as f:
+        assert f.read() == b'archive bytes'
+
+    galaxy_proxy.get_archive('github.com/alikins/awx/archive/1.0.tar.gz')
+    assert len(urls) == 1
+
+
+def test_get_archive_keeps_scheme(tmpdir):
+    responses = {'http://git.example.com/alikins/awx/archive/1.0.tar.gz': lambda **kwargs: FauxResponse(b'archive bytes')}
+    galaxy_proxy, urls = faux_proxy(tmpdir, responses)
+    galaxy_proxy.proxy_archive_url('http://git.example.com/alikins/awx/', 'http://localhost:8080')
+
+    assert galaxy_proxy.get_archive('git.example.com/alikins/awx/archive/1.0.tar.gz').status == 200
+    assert urls == ['http://git.example.com/alikins/awx/archive/1.0.tar.gz']
+
+
+def test_get_archive_forbidden(tmpdir):
+    responses = {'https://allowed.example.com/awx/archive/1.0.tar.gz': lambda **kwargs: FauxResponse(b'archive bytes')}
+    galaxy_proxy, urls = faux_proxy(tmpdir, responses, allowed_hosts=['allowed.example.com'])
+    galaxy_proxy.proxy_archive_url('https://github.com/alikins/awx', 'http://localhost:8080')
+
+    assert galaxy_proxy.get_archive('169.254.169.254/latest/meta-data').status == 403
+    assert galaxy_proxy.get_archive('github.com/alikins/other/archive/1.0.tar.gz').status == 403
+    assert galaxy_proxy.get_archive('github.com/alikins/awx-other/archive/1.0.tar.gz').status == 403
+    assert urls == []
+
+    assert galaxy_proxy.get_archive('allowed.example.com/awx/archive/1.0.tar.gz').status == 200
+
+
+def test_get_api_cache_evicts(tmpdir, monkeypatch):
+    responses = dict(('https://galaxy.example.com/api/v1/roles/%s/' % i, lambda **kwargs: FauxResponse(b'{}')) for i in range(5))
+    galaxy_proxy, urls = faux_proxy(tmpdir, responses)
+    monkeypatch.setattr(serve, 'MAX_API_CACHE_ENTRIES', 3)
+
+    for i in range(5):
+        galaxy_proxy.get_api('/api/v1/roles/%s/' % i, 'http://localhost:8080')
+    assert [key[0] for key in galaxy_proxy._api_cache] == ['/api/v1/roles/2/', '/api/v1/roles/3/', '/api/v1/roles/4/']
+
+    now = serve.time.time()
+    monkeypatch.setattr(serve.time, 'time', lambda: now + serve.DEFAULT_CACHE_TTL + 1)
+    galaxy_proxy.get_api('/api/v1/roles/0/', 'http://localhost:8080')
+    assert [key[0] for key in galaxy_proxy._api_cache] == ['/api/v1/roles/0/']
+
+
+def test_archive_origins_evict(tmpdir, monkeypatch):
+    galaxy_proxy, urls = faux_proxy(tmpdir, {})
+    monkeypatch.setattr(serve, 'MAX_ARCHIVE_ORIGINS', 2)
+
+    for name in ('first', 'second', 'first', 'third'):
+        galaxy_proxy.proxy_archive_url('https://github.com/alikins/%s' % name, 'http://localhost:8080')
+
+    # rewriting 'first' again made 'second' the oldest
+    assert list(galaxy_proxy._archive_origins) == ['github.com/alikins/first', 'github.com/alikins/third']
+    assert galaxy_proxy.archive_url('github.com/alikins/second/archive/1.0.tar.gz') is None
+
+
+def test_get_api_authorized_not_cached(tmpdir):
+    sent_headers = []
+
+    def secrets(headers=None, **kwargs):
+        sent_headers.append(headers)
+        return FauxResponse(b'{"results": []}')
+
+    galaxy_proxy, urls = faux_proxy(tmpdir, {'https://galaxy.example.com/api/v1/notification_secrets/': secrets})
+
+    for i in range(2):
+        response = galaxy_proxy.get_api('/api/v1/notification_secrets/', 'http://localhost:8080',
+                                        headers={'Authorization': 'Token abc'})
+        assert response.status == 200
+    assert sent_headers == [{'Authorization': 'Token abc'}] * 2
+    assert not galaxy_proxy._api_cache
+
+
+def test_get_archive_bad_path(tmpdir):
+    galaxy_proxy, urls = faux_proxy(tmpdir, {})
+
+    assert galaxy_proxy.get_archive('github.com/../../etc/passwd').status == 404
+    assert galaxy_proxy.get_archive('github.com').status == 404
+    assert urls == []
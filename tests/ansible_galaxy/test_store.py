@@ -0,0 +1,125 @@
+import collections
+import logging
+import os
+import tarfile
+
+import pytest
+
+from ansible_galaxy import store
+from ansible_galaxy.flat_rest_api import content
+
+log = logging.getLogger(__name__)
+
+Options = collections.namedtuple('Options', ['ignore_certs', 'force', 'link_mode'])
+
+
+class Galaxy(object):
+    def __init__(self, options):
+        self.options = options
+        self.content_paths = []
+
+
+@pytest.fixture
+def content_store(tmpdir, monkeypatch):
+    content_store = store.ContentStore(tmpdir.join('store').strpath)
+    monkeypatch.setattr(store, 'CONTENT_STORE', content_store)
+    return content_store
+
+
+def _populate(entry_dir):
+    os.makedirs(os.path.join(entry_dir, 'tasks'))
+    with open(os.path.join(entry_dir, 'tasks', 'main.yml'), 'w') as f:
+        f.write('- debug: msg=hi\n')
+    os.symlink('main.yml', os.path.join(entry_dir, 'tasks', 'link.yml'))
+
+
+def test_add_and_get(content_store):
+    assert content_store.get('alikins.role', '1.0', 'abc') is None
+
+    entry = content_store.add('alikins.role', '1.0', 'abc', _populate)
+
+    assert content_store.get('alikins.role', '1.0', 'abc') == entry
+    assert os.path.isfile(os.path.join(entry, 'tasks', 'main.yml'))
+    assert content_store.get('alikins.role', '1.1', 'abc') is None
+
+
+def test_add_failure_leaves_nothing(content_store):
+    def populate(entry_dir):
+        _populate(entry_dir)
+        raise IOError('disk full')
+
+    with pytest.raises(IOError):
+        content_store.add('alikins.role', '1.0', 'abc', populate)
+
+    assert content_store.get('alikins.role', '1.0', 'abc') is None
+    assert os.listdir(os.path.dirname(content_store.entry_path('alikins.role', '1.0', 'abc'))) == []
+
+
+@pytest.mark.parametrize('link_mode', ['hardlink', 'reflink', 'symlink', 'copy'])
+def test_materialize(content_store, tmpdir, link_mode):
+    entry = content_store.add('alikins.role', '1.0', 'abc', _populate)
+    dest = tmpdir.join('roles', 'alikins.role').strpath
+
+    assert content_store.materialize(entry, dest, link_mode=link_mode) == 2
+
+    with open(os.path.join(dest, 'tasks', 'main.yml')) as f:
+        assert f.read() == '- debug: msg=hi\n'
+    assert os.readlink(os.path.join(dest, 'tasks', 'link.yml')) == 'main.yml'
+    assert not os.path.islink(os.path.join(dest, 'tasks'))
+
+    stored_stat = os.stat(os.path.join(entry, 'tasks', 'main.yml'))
+    dest_stat = os.lstat(os.path.join(dest, 'tasks', 'main.yml'))
+    assert (dest_stat.st_ino == stored_stat.st_ino) == (link_mode == 'hardlink')
+    assert os.path.islink(os.path.join(dest, 'tasks', 'main.yml')) == (link_mode == 'symlink')
+
+
+def test_materialize_falls_back_to_copy(content_store, tmpdir, monkeypatch):
+    def cross_device_link(src, dest):
+        raise OSError(18, 'Invalid cross-device link')
+
+    monkeypatch.setattr(store.os, 'link', cross_device_link)
+    entry = content_store.add('alikins.role', '1.0', 'abc', _populate)
+    dest = tmpdir.join('roles', 'alikins.role').strpath
+
+    content_store.materialize(entry, dest, link_mode='hardlink')
+
+    assert os.path.isfile(os.path.join(dest, 'tasks', 'main.yml'))
+
+
+def _role_archive(tmpdir):
+    role_dir = tmpdir.mkdir('src').mkdir('myrole-1.0')
+    role_dir.join('meta', 'main.yml').write('galaxy_info:\n  author: me\ndependencies: []\n', ensure=True)
+    role_dir.join('tasks', 'main.yml').write('- debug: msg=hi\n', ensure=True)
+    archive = tmpdir.join('myrole.tar.gz').strpath
+    with tarfile.open(archive, 'w:gz') as tar_file:
+        tar_file.add(role_dir.strpath, arcname='myrole-1.0')
+    return archive
+
+
+def test_install_links_from_store(content_store, tmpdir, monkeypatch):
+    archive = _role_archive(tmpdir)
+    galaxy = Galaxy(options=Options(ignore_certs=False, force=True, link_mode='hardlink'))
+
+    monkeypatch.setattr(content.defaults, 'DEFAULT_CONTENT_PATH', [tmpdir.join('content1').strpath])
+    first = content.GalaxyContent(galaxy, 'myrole', src=archive)
+    assert first.install()
+
+    # the second install doesn't open the archive
+    def open_tar(*args, **kwargs):
+        raise AssertionError('the archive was opened')
+
+    monkeypatch.setattr(content.decompress, 'open_tar', open_tar)
+    monkeypatch.setattr(content.defaults, 'DEFAULT_CONTENT_PATH', [tmpdir.join('content2').strpath])
+    second = content.GalaxyContent(galaxy, 'myrole', src=archive)
+    assert second.install()
+
+    first_tasks = os.stat(os.path.join(first.path, 'tasks', 'main.yml'))
+    second_tasks = os.stat(os.path.join(second.path, 'tasks', 'main.yml'))
+    assert first_tasks.st_ino == second_tasks.st_ino
+    assert second.metadata['galaxy_info']['author'] == 'me'
+
+    # each install has its own install info, none in the store
+    assert second.install_info['archive_sha256'] == store.file_checksum(archive)
+    assert sorted(second.install_info['files']) == ['meta/main.yml', 'tasks/main.yml']
+    entry = content_store.get('myrole', '', store.file_checksum(archive))
+    assert not os.path.exists(os.path.join(entry, 'meta', '.galaxy_install_info'))
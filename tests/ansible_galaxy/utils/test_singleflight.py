@@ -0,0 +1,63 @@
+import logging
+import threading
+
+import pytest
+
+from ansible_galaxy.utils.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+
+def test_single_flight_coalesces():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    def worker():
+        results.append(single_flight.do('key', slow, 21))
+
+    leader = threading.Thread(target=worker)
+    leader.start()
+    started.wait(5)
+    assert single_flight.in_flight('key')
+
+    followers = [threading.Thread(target=worker) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    # only let the leader finish once every follower is waiting on it
+    for _ in range(500):
+        if single_flight.waiters('key') == len(followers):
+            break
+        started.wait(0.01)
+    assert single_flight.waiters('key') == len(followers)
+
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    log.debug('calls: %s results: %s', calls, results)
+
+    assert results == [42] * 4
+    assert len(calls) == 1
+    assert not single_flight.in_flight('key')
+
+
+def test_single_flight_exception():
+    single_flight = SingleFlight()
+
+    def fail():
+        raise ValueError('nope')
+
+    with pytest.raises(ValueError, match='nope'):
+        single_flight.do('key', fail)
+
+    # the failed call is forgotten
+    assert single_flight.do('key', lambda: 'ok') == 'ok'
@@ -1,7 +1,10 @@
 import logging
+import tarfile
 
 import pytest
+import yaml
 
+from ansible_galaxy import manifest
 from ansible_galaxy_cli.cli import galaxy
 from ansible_galaxy_cli import exceptions as cli_exceptions
 
@@ -19,3 +22,51 @@ def test_run_info():
     cli.parse()
     with pytest.raises(cli_exceptions.CliOptionsError, match="you must specify a user/role name"):
         cli.run()
+
+
+def test_run_verify(tmpdir):
+    role_dir = tmpdir.mkdir('roles').mkdir('myrole')
+    role_dir.join('tasks', 'main.yml').write('- debug: msg=hi\n', ensure=True)
+    files = manifest.build(role_dir.strpath)
+    role_dir.join('meta', '.galaxy_install_info').write(yaml.safe_dump({'version': '1.0', 'files': files}), ensure=True)
+
+    cli = galaxy.GalaxyCLI(args=['ansible-galaxy', 'verify', '--roles-path', tmpdir.join('roles').strpath])
+    cli.parse()
+    cli.run()
+
+    role_dir.join('tasks', 'main.yml').write('- debug: msg=changed\n')
+    cli = galaxy.GalaxyCLI(args=['ansible-galaxy', 'verify', '--roles-path', tmpdir.join('roles').strpath])
+    cli.parse()
+    with pytest.raises(cli_exceptions.GalaxyCliError, match="1 of 1 roles do not match"):
+        cli.run()
+
+
+def test_run_install_roles_paths_file(tmpdir):
+    role_dir = tmpdir.mkdir('src').mkdir('myrole-1.0')
+    role_dir.join('meta', 'main.yml').write('dependencies: []\n', ensure=True)
+    archive = tmpdir.join('myrole.tar.gz').strpath
+    with tarfile.open(archive, 'w:gz') as tar_file:
+        tar_file.add(role_dir.strpath, arcname='myrole-1.0')
+    paths_file = tmpdir.join('projects.yml')
+    paths_file.write(yaml.safe_dump(['project1/roles', tmpdir.join('project2', 'roles').strpath]))
+
+    cli = galaxy.GalaxyCLI(args=['ansible-galaxy', 'install', '--roles-path', tmpdir.join('project0', 'roles').strpath,
+                                 '--roles-paths-file', paths_file.strpath, archive + ',,myrole'])
+    cli.parse()
+    cli.run()
+
+    for project in ('project0', 'project1', 'project2'):
+        assert tmpdir.join(project, 'roles', 'myrole', 'meta', '.galaxy_install_info').check()
+
+
+def test_run_verify_without_manifest(tmpdir, capsys):
+    role_dir = tmpdir.mkdir('roles').mkdir('foo')
+    role_dir.join('meta', '.galaxy_install_info').write(yaml.safe_dump({'version': '1.0'}), ensure=True)
+
+    cli = galaxy.GalaxyCLI(args=['ansible-galaxy', 'verify', '--roles-path', tmpdir.join('roles').strpath, 'foo'])
+    cli.parse()
+    cli.run()
+
+    out = capsys.readouterr().out
+    assert 'foo was installed without a manifest' in out
+    assert 'not installed' not in out
@@ -0,0 +1,176 @@
+import logging
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+from ansible_galaxy_cli import daemon
+
+log = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def daemon_server(tmpdir):
+    runs = []
+
+    def run(args):
+        runs.append((args, os.getcwd()))
+        if args[1] == 'fail':
+            raise ValueError('it broke')
+        if args[1] == 'exit':
+            sys.exit(2)
+        if args[1] == 'warn':
+            logging.getLogger('ansible_galaxy_cli.cli.galaxy').warning('- myrole was NOT installed successfully')
+            return 0
+        print('ran %s' % ' '.join(args[1:]))
+        sys.stderr.write('a warning\n')
+        return 3
+
+    path = tmpdir.join('daemon.sock').strpath
+    server = daemon.DaemonServer(path, run)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield path, runs
+    server.shutdown()
+    server.server_close()
+
+
+def test_forward(daemon_server, tmpdir, capsys):
+    path, runs = daemon_server
+    cwd = os.getcwd()
+
+    assert daemon.forward(['ansible-galaxy', 'list', 'myrole'], path=path) == 3
+
+    out, err = capsys.readouterr()
+    assert out == 'ran list myrole\n'
+    assert err == 'a warning\n'
+    assert runs == [(['ansible-galaxy', 'list', 'myrole'], cwd)]
+    # the daemon is back where it started
+    assert os.getcwd() == cwd
+
+
+def test_forward_errors(daemon_server, capsys):
+    path, runs = daemon_server
+
+    assert daemon.forward(['ansible-galaxy', 'fail'], path=path) == os.EX_SOFTWARE
+    assert 'it broke' in capsys.readouterr()[1]
+    assert daemon.forward(['ansible-galaxy', 'exit'], path=path) == 2
+
+
+class FauxWriter(object):
+    def __init__(self):
+        self.written = []
+
+    def write(self, text):
+        self.written.append(text)
+
+    def flush(self):
+        pass
+
+
+def test_run_request_env(tmpdir, monkeypatch):
+    def run(args):
+        print('%s %s' % (os.environ.get('https_proxy'), os.environ.get('NETRC')))
+
+    monkeypatch.setenv('https_proxy', 'http://daemon.example.com:3128')
+    monkeypatch.delenv('NETRC', raising=False)
+    daemon_env = dict(os.environ)
+    server = daemon.DaemonServer(tmpdir.join('daemon.sock').strpath, run)
+    stdout = FauxWriter()
+
+    try:
+        server.run_request(['ansible-galaxy', 'list'], None, {'NETRC': '/client/netrc'}, stdout, FauxWriter())
+        server.run_request(['ansible-galaxy', 'list'], None, None, stdout, FauxWriter())
+    finally:
+        server.server_close()
+
+    # the client's unset https_proxy is unset for its command, and a request without env uses the daemon's
+    assert ''.join(stdout.written) == 'None /client/netrc\nhttp://daemon.example.com:3128 None\n'
+    assert dict(os.environ) == daemon_env
+
+
+def test_forward_sends_env(daemon_server, monkeypatch):
+    path, runs = daemon_server
+    requests = []
+    run_request = daemon.DaemonServer.run_request
+
+    def recording_run_request(self, args, cwd, env, stdout, stderr):
+        requests.append(env)
+        return run_request(self, args, cwd, env, stdout, stderr)
+
+    monkeypatch.setattr(daemon.DaemonServer, 'run_request', recording_run_request)
+    monkeypatch.setenv('https_proxy', 'http://client.example.com:3128')
+    monkeypatch.delenv('NETRC', raising=False)
+
+    daemon.forward(['ansible-galaxy', 'list'], path=path)
+
+    assert requests[0]['https_proxy'] == 'http://client.example.com:3128'
+    assert 'NETRC' not in requests[0]
+    assert set(requests[0]) <= set(daemon.FORWARDED_ENV)
+
+
+def test_forward_runs_locally(daemon_server, tmpdir):
+    path, runs = daemon_server
+
+    assert daemon.forward(['ansible-galaxy', 'login'], path=path) is None
+    assert daemon.forward(['ansible-galaxy', 'list'], path=tmpdir.join('nothing.sock').strpath) is None
+    assert runs == []
+
+
+@pytest.mark.parametrize('args', [
+    ['import', '-r', '-'],
+    ['import', '-r-'],
+    ['import', '--repo-file', '-'],
+    ['import', '--repo-file=-'],
+    ['import', '--repo=-'],
+    ['install', '--role-file', '-'],
+])
+def test_forward_runs_stdin_readers_locally(daemon_server, args):
+    path, runs = daemon_server
+
+    assert daemon.forward(['ansible-galaxy'] + args, path=path) is None
+    assert runs == []
+
+
+def test_reads_stdin():
+    assert daemon._reads_stdin(['install', '-r', 'requirements.yml']) is False
+    assert daemon._reads_stdin(['install', '-f', '-']) is False
+    assert daemon._reads_stdin(['import', '-r', '-']) is True
+
+
+def test_forward_log_output(daemon_server, capsys):
+    path, runs = daemon_server
+    logger = logging.getLogger('ansible_galaxy_cli')
+    daemon_terminal = FauxWriter()
+    console_handler = logging.StreamHandler(daemon_terminal)
+    console_handler.setLevel(logging.INFO)
+    logger.addHandler(console_handler)
+
+    try:
+        assert daemon.forward(['ansible-galaxy', 'warn'], path=path) == 0
+    finally:
+        logger.removeHandler(console_handler)
+
+    assert capsys.readouterr()[1] == '- myrole was NOT installed successfully\n'
+    # the daemon's console handler is back, and the client's is gone
+    assert daemon_terminal.written == []
+    assert logger.handlers == []
+
+
+def test_stale_socket(tmpdir):
+    path = tmpdir.join('stale.sock').strpath
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+
+    assert daemon.forward(['ansible-galaxy', 'list'], path=path) is None
+    daemon._remove_stale_socket(path)
+    assert not os.path.exists(path)
+
+
+def test_socket_is_private(daemon_server):
+    path, runs = daemon_server
+    assert os.stat(path).st_mode & 0o777 == 0o600